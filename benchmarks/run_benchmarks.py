@@ -0,0 +1,191 @@
+
+import os
+import sys
+import copy
+import json
+import time
+import shutil
+import logging
+import platform
+import statistics
+import subprocess
+import tempfile
+
+from src import ai_handler, parse_cache, summary
+from src.ai_client import AITransport, AsyncAIClient
+from src.extractor import extract_pbix
+from src.parser import parse_report_layout, save_report_layout
+from src.layout import Layout
+from src.pbix_package import PbixPackage
+from src.parse_cache import ParseCache
+from src.repackager import repackage_pbix
+from src.transformer import apply_edits, process_pbix_edit_request
+from benchmarks.synthetic import SCALES, write_synthetic_pbix
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+BENCHMARK_REQUEST = "Change the title of visual0_0 to Revenue by Region"
+BENCHMARK_INSTRUCTIONS = {"action": "change_title", "target": {"visual_name": "visual0_0"},
+                          "parameters": {"new_title": "Revenue by Region"}}
+
+class StubTransport(AITransport):
+    """Answers every prompt instantly with the same instructions, so runs measure only our code."""
+
+    name = "benchmark-stub"
+
+    async def complete(self, prompt: str, model: str, system_prompt: str = "") -> dict:
+        return {"content": json.dumps(BENCHMARK_INSTRUCTIONS), "usage": {}}
+
+def _install_stub_ai():
+    ai_handler._default_client = AsyncAIClient(StubTransport(), model="benchmark-stub")
+    ai_handler._default_cache = None
+    ai_handler._default_cache_loaded = True
+    # Every pipeline run is measured cold; the cached path has its own benchmark
+    parse_cache._default_cache = None
+    parse_cache._default_cache_loaded = True
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _time(func, repeats: int, setup=None) -> dict:
+    """Runs `func` `repeats` times (calling `setup` untimed before each run) and summarizes wall times."""
+    timings = []
+    for _ in range(repeats):
+        argument = setup() if setup else None
+        started = time.perf_counter()
+        func(argument) if setup else func()
+        timings.append(time.perf_counter() - started)
+    return {"runs": repeats, "min": min(timings), "median": statistics.median(timings),
+            "mean": statistics.fmean(timings), "max": max(timings)}
+
+def run_scale(name: str, params: dict, work_dir: str, repeats: int) -> dict:
+    """Generates one synthetic PBIX and times every pipeline stage against it."""
+    scale_dir = os.path.join(work_dir, name)
+    pbix_path = os.path.join(scale_dir, "report.pbix")
+    output_path = os.path.join(scale_dir, "output.pbix")
+    extract_dir = os.path.join(scale_dir, "extracted")
+    description = write_synthetic_pbix(pbix_path, **params)
+    results = {}
+
+    def fresh_extract_dir():
+        shutil.rmtree(extract_dir, ignore_errors=True)
+    results["extract_pbix"] = _time(lambda _: extract_pbix(pbix_path, extract_dir), repeats, setup=fresh_extract_dir)
+
+    results["parse_report_layout"] = _time(lambda: parse_report_layout(extract_dir), repeats)
+    layout_data = parse_report_layout(extract_dir)
+
+    def open_package_layout():
+        with PbixPackage(pbix_path) as package:
+            return package.read_layout_document()
+    results["read_layout_document"] = _time(open_package_layout, repeats)
+
+    cache = ParseCache(os.path.join(scale_dir, "parse_cache"))
+    with PbixPackage(pbix_path) as package:
+        package.read_layout_document(cache=cache) # Warm the cache
+    def open_cached_layout():
+        with PbixPackage(pbix_path) as package:
+            return package.read_layout_document(cache=cache)
+    results["read_layout_document_cached"] = _time(open_cached_layout, repeats)
+    with PbixPackage(pbix_path) as package:
+        layout_bytes = package.read_member("Report/Layout")
+
+    results["apply_edits"] = _time(lambda layout: apply_edits(layout, BENCHMARK_INSTRUCTIONS), repeats,
+                                   setup=lambda: Layout.from_bytes(layout_bytes))
+
+    results["save_report_layout"] = _time(lambda data: save_report_layout(extract_dir, data), repeats,
+                                          setup=lambda: copy.deepcopy(layout_data))
+
+    edited = apply_edits(Layout.from_bytes(layout_bytes), BENCHMARK_INSTRUCTIONS).to_bytes()
+    results["repackage_pbix"] = _time(lambda: repackage_pbix(pbix_path, output_path, {"Report/Layout": edited}),
+                                      repeats)
+
+    _install_stub_ai()
+    # The LLM path (rules disabled, stub AI) and the local intent-rule fast path
+    for benchmark, intent_rules in (("process_pbix_edit_request", "0"), ("process_pbix_edit_request_rules", "1")):
+        os.environ["INTENT_RULES"] = intent_rules
+        metrics = []
+        def full_pipeline(_):
+            metrics.append(process_pbix_edit_request(pbix_path, output_path, BENCHMARK_REQUEST).to_dict())
+        # Clear the per-file inventory cache so every run is a cold start
+        results[benchmark] = _time(full_pipeline, repeats, setup=summary._inventory_cache.clear)
+        results[benchmark]["stages"] = {
+            stage: statistics.median(run["stages"][stage]["seconds"] for run in metrics)
+            for stage in metrics[-1]["stages"]}
+        results[benchmark]["peak_rss_bytes"] = metrics[-1]["peak_rss_bytes"]
+    os.environ.pop("INTENT_RULES")
+
+    shutil.rmtree(scale_dir, ignore_errors=True)
+    return {"input": description, "benchmarks": results}
+
+def compare(current: dict, baseline: dict, threshold: float = 0.10) -> list[str]:
+    """Lists benchmarks whose median got slower than the baseline by more than `threshold`."""
+    regressions = []
+    for scale, scale_results in current["scales"].items():
+        base_results = baseline.get("scales", {}).get(scale, {}).get("benchmarks", {})
+        for name, timing in scale_results["benchmarks"].items():
+            base = base_results.get(name)
+            if not base or not base["median"]:
+                continue
+            ratio = timing["median"] / base["median"]
+            line = f"{scale}/{name}: {base['median']:.4f}s -> {timing['median']:.4f}s ({ratio:.2f}x)"
+            print(line)
+            if ratio > 1 + threshold:
+                regressions.append(line)
+    return regressions
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the PBIX pipeline on synthetic reports.")
+    parser.add_argument("--scale", action="append", choices=sorted(SCALES),
+                        help="Scale preset to run (repeatable, default: small and medium).")
+    parser.add_argument("--pages", type=int, help="Run a custom scale with this many pages.")
+    parser.add_argument("--visuals-per-page", type=int, default=10, help="Visuals per page for the custom scale.")
+    parser.add_argument("--datamodel-bytes", type=int, default=10 * 1024 * 1024,
+                        help="DataModel blob size for the custom scale.")
+    parser.add_argument("--layout-padding-bytes", type=int, default=0, help="Extra Layout size for the custom scale.")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per benchmark.")
+    parser.add_argument("--output", help="Write results as JSON to this path (default: stdout).")
+    parser.add_argument("--compare", help="Baseline results JSON; exit non-zero on regressions.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown before flagging (0.10 = 10%%).")
+    parser.add_argument("--work-dir", help="Where to generate files (default: a temporary directory).")
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING) # Pipeline info logs would dominate the timings
+
+    scales = {name: SCALES[name] for name in (args.scale or ([] if args.pages else ["small", "medium"]))}
+    if args.pages:
+        scales["custom"] = {"pages": args.pages, "visuals_per_page": args.visuals_per_page,
+                            "datamodel_bytes": args.datamodel_bytes, "layout_padding_bytes": args.layout_padding_bytes}
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="pbix_bench_")
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeats": args.repeats,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "scales": {name: run_scale(name, params, work_dir, args.repeats) for name, params in scales.items()},
+    }
+    if not args.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,150 @@
+
+import os
+import json
+import random
+import zipfile
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Named scales; "estate" approximates the larger reports in a production estate
+SCALES = {
+    "small": {"pages": 3, "visuals_per_page": 8, "datamodel_bytes": 1 * 1024 * 1024, "layout_padding_bytes": 0},
+    "medium": {"pages": 15, "visuals_per_page": 20, "datamodel_bytes": 20 * 1024 * 1024, "layout_padding_bytes": 0},
+    "large": {"pages": 40, "visuals_per_page": 40, "datamodel_bytes": 100 * 1024 * 1024, "layout_padding_bytes": 0},
+    "estate": {"pages": 60, "visuals_per_page": 50, "datamodel_bytes": 250 * 1024 * 1024,
+               "layout_padding_bytes": 4 * 1024 * 1024},
+}
+
+VISUAL_TYPES = ["card", "barChart", "lineChart", "tableEx", "slicer", "pieChart", "clusteredColumnChart"]
+TABLES = {
+    "Sales": ["Amount", "Quantity", "Discount", "Date"],
+    "Product": ["Category", "Name", "Color"],
+    "Customer": ["Region", "Segment", "Country"],
+}
+
+def _visual_config(name: str, visual_type: str, title: str, fields: list[tuple[str, str]]) -> dict:
+    """Builds a visual container config shaped like the ones Power BI Desktop writes."""
+    sources = {}
+    for table, _ in fields:
+        sources.setdefault(table, table[0].lower() + str(len(sources)))
+    return {
+        "name": name,
+        "layouts": [{"id": 0, "position": {"x": 10, "y": 10, "z": 0, "width": 300, "height": 200}}],
+        "singleVisual": {
+            "visualType": visual_type,
+            "projections": {"Values": [{"queryRef": f"{table}.{column}"} for table, column in fields]},
+            "prototypeQuery": {
+                "Version": 2,
+                "From": [{"Name": alias, "Entity": table, "Type": 0} for table, alias in sources.items()],
+                "Select": [{"Column": {"Expression": {"SourceRef": {"Source": sources[table]}}, "Property": column},
+                            "Name": f"{table}.{column}"} for table, column in fields],
+            },
+            "vcObjects": {"title": [{"properties": {"text": {"expr": {"Literal": {"Value": f"'{title}'"}}}}}]},
+        },
+    }
+
+def build_layout(pages: int, visuals_per_page: int, padding_bytes: int = 0, seed: int = 0) -> dict:
+    """Generates a synthetic report layout.
+
+    Args:
+        pages: Number of report pages (sections).
+        visuals_per_page: Visual containers per page.
+        padding_bytes: Approximate extra Layout size, added as a report-level
+            resource blob (real reports carry themes and custom visuals there).
+        seed: Seed for the field/type choices, so runs are reproducible.
+
+    Returns:
+        The layout dictionary, with nested JSON fields encoded as strings.
+    """
+    rng = random.Random(seed)
+    table_names = list(TABLES)
+    sections = []
+    for page in range(pages):
+        containers = []
+        for index in range(visuals_per_page):
+            visual_type = VISUAL_TYPES[(page + index) % len(VISUAL_TYPES)]
+            fields = []
+            for _ in range(rng.randint(1, 3)):
+                table = rng.choice(table_names)
+                fields.append((table, rng.choice(TABLES[table])))
+            config = _visual_config(f"visual{page}_{index}", visual_type, f"Chart {page + 1}-{index + 1}", fields)
+            containers.append({
+                "x": 10.0 + index, "y": 10.0, "z": float(index), "width": 300.0, "height": 200.0,
+                "config": json.dumps(config, separators=(",", ":")),
+                "filters": "[]",
+                "query": json.dumps(config["singleVisual"]["prototypeQuery"], separators=(",", ":")),
+                "dataTransforms": "{}",
+            })
+        sections.append({
+            "name": f"ReportSection{page}", "displayName": f"Page {page + 1}", "ordinal": page,
+            "filters": "[]", "config": "{}", "displayOption": 1, "width": 1280, "height": 720,
+            "visualContainers": containers,
+        })
+
+    layout = {"id": 0, "resourcePackages": [], "sections": sections, "config": json.dumps({"version": "5.37"}),
+              "layoutOptimization": 0}
+    if padding_bytes:
+        layout["resourcePackages"].append({"resourcePackage": {
+            "name": "SharedResources", "type": 2,
+            "items": [{"type": 202, "name": "Theme", "path": "BaseThemes/Synthetic.json",
+                       "payload": "x" * (padding_bytes // 2)}], # UTF-16: two bytes per character
+        }})
+    return layout
+
+def write_synthetic_pbix(path: str, pages: int = 3, visuals_per_page: int = 8, datamodel_bytes: int = 1024 * 1024,
+                         layout_padding_bytes: int = 0, seed: int = 0) -> dict:
+    """Writes a synthetic .pbix archive with the members a real report has.
+
+    The DataModel is random bytes stored uncompressed, matching the already
+    compressed XPress9 blob Power BI writes; the Layout is UTF-16-LE JSON.
+
+    Returns:
+        A description of the generated file (scale parameters and member sizes).
+    """
+    layout = build_layout(pages, visuals_per_page, layout_padding_bytes, seed)
+    layout_bytes = json.dumps(layout, separators=(",", ":")).encode("utf-16-le")
+    rng = random.Random(seed)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("Version", "1.28".encode("utf-16-le"))
+        archive.writestr("[Content_Types].xml", '<?xml version="1.0" encoding="utf-8"?><Types/>')
+        archive.writestr("Settings", json.dumps({"Version": 4}).encode("utf-16-le"))
+        archive.writestr("Metadata", json.dumps({"Version": 5}).encode("utf-16-le"))
+        # Stream the blob in chunks so large scales do not need it all in memory
+        with archive.open(zipfile.ZipInfo("DataModel", date_time=(2024, 1, 1, 0, 0, 0)), "w") as blob:
+            remaining = datamodel_bytes
+            while remaining:
+                chunk = min(remaining, 4 * 1024 * 1024)
+                blob.write(rng.randbytes(chunk))
+                remaining -= chunk
+        archive.writestr("Report/Layout", layout_bytes)
+        archive.writestr("Report/StaticResources/SharedResources/BaseThemes/CY24SU02.json", "{}")
+        archive.writestr("SecurityBindings", b"\x00" * 64)
+
+    description = {"path": path, "pages": pages, "visuals_per_page": visuals_per_page,
+                   "datamodel_bytes": datamodel_bytes, "layout_bytes": len(layout_bytes),
+                   "file_bytes": os.path.getsize(path)}
+    logging.info(f"Generated synthetic PBIX {path} ({description['file_bytes']} bytes)")
+    return description
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic .pbix archive for benchmarking.")
+    parser.add_argument("output", help="Path of the .pbix file to write.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="Named scale preset.")
+    parser.add_argument("--pages", type=int, help="Override the number of pages.")
+    parser.add_argument("--visuals-per-page", type=int, help="Override the visuals per page.")
+    parser.add_argument("--datamodel-bytes", type=int, help="Override the DataModel blob size.")
+    parser.add_argument("--layout-padding-bytes", type=int, help="Override the extra Layout size.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+
+    args = parser.parse_args()
+
+    params = dict(SCALES[args.scale])
+    for key in params:
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+    print(json.dumps(write_synthetic_pbix(args.output, seed=args.seed, **params), indent=2))
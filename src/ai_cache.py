@@ -0,0 +1,169 @@
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ai-pbix-transformer", "ai_instructions.sqlite")
+
+def normalize_request(user_request: str) -> str:
+    """Normalizes a request so trivially different phrasings share a cache entry."""
+    text = re.sub(r"\s+", " ", user_request.strip().lower())
+    return text.rstrip(".!?;: ")
+
+def structure_fingerprint(pbix_structure_summary: dict) -> str:
+    """Stable hash of a structure summary, independent of key order."""
+    canonical = json.dumps(pbix_structure_summary, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class InstructionCache:
+    """On-disk SQLite cache of AI edit instructions.
+
+    Entries are keyed by the normalized request, a fingerprint of the
+    structure summary, the model and the prompt version, so templates shared
+    across reports hit the same entry while any prompt change misses. Entries
+    expire after `ttl_seconds` and the least recently used ones are evicted
+    once `max_entries` or `max_bytes` is exceeded. The database runs in WAL
+    mode, so several batch workers can share one cache file.
+
+    Example:
+        cache = InstructionCache("/tmp/ai_cache.sqlite", ttl_seconds=86400)
+        key = cache.make_key(request, summary, model="gemini-1.5-flash", prompt_version="1")
+        instructions = cache.get(key)
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 10000,
+                 max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float | None = 30 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "writes": 0}
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS instructions (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS instructions_last_access ON instructions (last_access)")
+
+    @staticmethod
+    def make_key(user_request: str, pbix_structure_summary: dict, model: str, prompt_version: str) -> str:
+        parts = (normalize_request(user_request), structure_fingerprint(pbix_structure_summary), model, prompt_version)
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        """Returns cached instructions, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM instructions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            value, created = row
+            if self.ttl_seconds is not None and now - created > self.ttl_seconds:
+                self._conn.execute("DELETE FROM instructions WHERE key = ?", (key,))
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE instructions SET last_access = ? WHERE key = ?", (now, key))
+            self._stats["hits"] += 1
+        return json.loads(value)
+
+    def put(self, key: str, instructions: dict):
+        """Stores instructions and evicts least recently used entries past the limits."""
+        value = json.dumps(instructions, ensure_ascii=False, separators=(",", ":"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO instructions (key, value, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now))
+            self._stats["writes"] += 1
+            self._evict()
+
+    def _evict(self):
+        count, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM instructions").fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        evicted = 0
+        rows = self._conn.execute("SELECT key, size FROM instructions ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM instructions WHERE key = ?", (key,))
+            count -= 1
+            total_bytes -= size
+            evicted += 1
+        self._stats["evictions"] += evicted
+
+    def purge_expired(self) -> int:
+        """Deletes every expired entry and returns how many were removed."""
+        if self.ttl_seconds is None:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM instructions WHERE created < ?", (time.time() - self.ttl_seconds,))
+            self._stats["expired"] += cursor.rowcount
+            return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM instructions")
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters for this process plus the current cache size."""
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM instructions").fetchone()
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update(entries=entries, bytes=total_bytes, hit_rate=stats["hits"] / lookups if lookups else 0.0)
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def cache_from_env() -> InstructionCache | None:
+    """Builds the instruction cache from `AI_CACHE_PATH`, or None if `AI_CACHE=0`."""
+    if os.getenv("AI_CACHE", "1").lower() in ("0", "false", "off", "no"):
+        return None
+    ttl = os.getenv("AI_CACHE_TTL_SECONDS")
+    return InstructionCache(
+        os.getenv("AI_CACHE_PATH", DEFAULT_CACHE_PATH),
+        max_entries=int(os.getenv("AI_CACHE_MAX_ENTRIES", "10000")),
+        max_bytes=int(os.getenv("AI_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl_seconds=float(ttl) if ttl else 30 * 24 * 3600,
+    )
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or clear the AI instruction cache.")
+    parser.add_argument("--path", default=os.getenv("AI_CACHE_PATH", DEFAULT_CACHE_PATH), help="Cache database path.")
+    parser.add_argument("--clear", action="store_true", help="Delete every cached entry.")
+    parser.add_argument("--purge-expired", action="store_true", help="Delete expired entries.")
+
+    args = parser.parse_args()
+
+    cache = InstructionCache(args.path)
+    if args.clear:
+        cache.clear()
+    if args.purge_expired:
+        print(f"Purged {cache.purge_expired()} expired entries.")
+    print(json.dumps(cache.stats(), indent=2))
+    cache.close()
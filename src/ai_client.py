@@ -0,0 +1,308 @@
+
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import http.client
+import urllib.request
+import urllib.error
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+SYSTEM_PROMPT = "You are a PBIX modification assistant."
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class AIClientError(Exception):
+    """Raised when an LLM call fails for good (after retries, or non-retryable)."""
+
+class AITransportError(AIClientError):
+    """A single failed provider call.
+
+    Args:
+        message: Description of the failure.
+        status: HTTP status code, if the provider returned one.
+        retry_after: Seconds the provider asked us to wait, if given.
+    """
+
+    def __init__(self, message: str, status: int | None = None, retry_after: float | None = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status in RETRYABLE_STATUS_CODES
+
+# --- Transports ---
+
+class AITransport:
+    """Sends one prompt to an LLM provider.
+
+    Subclasses implement `complete`, returning a dictionary with the raw
+    `content` string and a `usage` dictionary (`prompt_tokens`,
+    `completion_tokens`) when the provider reports it. Transports raise
+    `AITransportError` with the HTTP status so the client can decide whether
+    to retry.
+    """
+
+    name = "base"
+
+    async def complete(self, prompt: str, model: str, system_prompt: str = SYSTEM_PROMPT) -> dict:
+        raise NotImplementedError
+
+class PlaceholderTransport(AITransport):
+    """Offline stand-in that answers a few recognisable requests with canned JSON."""
+
+    name = "placeholder"
+
+    async def complete(self, prompt: str, model: str, system_prompt: str = SYSTEM_PROMPT) -> dict:
+        # The user request is quoted on the second line of the prompt
+        request_line = prompt.lower().split("the user wants to make the following change:", 1)[-1].split("\n", 1)[0]
+        if "add a title" in request_line:
+            content = json.dumps({
+                "action": "add_visual",
+                "target": { "section_name": "Page 1" }, # Example target
+                "parameters": {
+                    "visual_type": "textbox",
+                    "properties": { "text": "New Title Added by AI" },
+                    "position": { "x": 10, "y": 10, "z": 0 },
+                    "size": { "width": 300, "height": 50 }
+                }
+            })
+        elif "change title" in request_line:
+            content = json.dumps({
+                "action": "modify_visual_property",
+                "target": { "visual_name": "VisualToChange" }, # Needs actual target identification
+                "parameters": { "property_path": "config.singleVisual.vcObjects.title[0].properties.text.expr.Literal.Value",
+                                "new_value": "'Title Updated by AI'" }
+            })
+        else:
+            content = "{}" # Empty response if no match
+        return {"content": content, "usage": {}}
+
+def _post_json(url: str, payload: dict, headers: dict, timeout: float) -> dict:
+    """Blocking JSON POST; runs in a worker thread via `asyncio.to_thread`.
+
+    Every failure, including a truncated or non-JSON body, surfaces as
+    `AITransportError` so the client can retry it.
+    """
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), method="POST",
+                                     headers={"Content-Type": "application/json", **headers})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            raw = response.read()
+        return json.loads(raw.decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        retry_after = e.headers.get("Retry-After") if e.headers else None
+        try:
+            retry_after = float(retry_after) if retry_after else None
+        except ValueError:
+            retry_after = None
+        raise AITransportError(f"HTTP {e.code} from {url}: {e.reason}", status=e.code, retry_after=retry_after) from e
+    except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+        # URLError, timeouts and connection resets are OSErrors; IncompleteRead is an HTTPException
+        raise AITransportError(f"Connection to {url} failed: {e!r}") from e
+    except ValueError as e: # JSONDecodeError and UnicodeDecodeError
+        raise AITransportError(f"Invalid JSON response from {url}: {e}") from e
+
+class OpenAICompatibleTransport(AITransport):
+    """Chat-completions transport for OpenAI and any server speaking the same API.
+
+    Point `base_url` at a local fake server to run tests and benchmarks
+    without network access or API cost.
+    """
+
+    name = "openai"
+
+    def __init__(self, api_key: str | None, base_url: str = "https://api.openai.com/v1", http_timeout: float = 120.0):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.http_timeout = http_timeout
+
+    async def complete(self, prompt: str, model: str, system_prompt: str = SYSTEM_PROMPT) -> dict:
+        payload = {
+            "model": model,
+            "messages": [{"role": "system", "content": system_prompt},
+                         {"role": "user", "content": prompt}],
+            "response_format": {"type": "json_object"},
+        }
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        body = await asyncio.to_thread(_post_json, f"{self.base_url}/chat/completions", payload, headers, self.http_timeout)
+        try:
+            content = body["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise AIClientError(f"Unexpected chat completion response shape: {body}") from e
+        usage = body.get("usage") or {}
+        return {"content": content,
+                "usage": {"prompt_tokens": usage.get("prompt_tokens"), "completion_tokens": usage.get("completion_tokens")}}
+
+class GeminiTransport(AITransport):
+    """Google Gemini `generateContent` transport over plain HTTPS."""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str, base_url: str = "https://generativelanguage.googleapis.com/v1beta",
+                 http_timeout: float = 120.0):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.http_timeout = http_timeout
+
+    async def complete(self, prompt: str, model: str, system_prompt: str = SYSTEM_PROMPT) -> dict:
+        payload = {
+            "systemInstruction": {"parts": [{"text": system_prompt}]},
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {"responseMimeType": "application/json"},
+        }
+        url = f"{self.base_url}/models/{model}:generateContent"
+        body = await asyncio.to_thread(_post_json, url, payload, {"x-goog-api-key": self.api_key}, self.http_timeout)
+        try:
+            content = "".join(part.get("text", "") for part in body["candidates"][0]["content"]["parts"])
+        except (KeyError, IndexError, TypeError) as e:
+            raise AIClientError(f"Unexpected Gemini response shape: {body}") from e
+        usage = body.get("usageMetadata") or {}
+        return {"content": content,
+                "usage": {"prompt_tokens": usage.get("promptTokenCount"), "completion_tokens": usage.get("candidatesTokenCount")}}
+
+# --- Flow control ---
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for retryable provider errors."""
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, error: AITransportError | None = None) -> float:
+        """Seconds to wait before retry number `attempt` (1-based)."""
+        if error is not None and error.retry_after is not None:
+            return min(self.max_delay, error.retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+class AsyncAIClient:
+    """Concurrent LLM client with bounded concurrency, rate limiting, retries and timeouts.
+
+    The per-attempt `timeout` is never shorter than the transport's own
+    `http_timeout`: an attempt abandoned earlier would keep its worker
+    thread blocked on the socket while the retry starts another one.
+
+    Example:
+        client = AsyncAIClient(GeminiTransport(api_key), model="gemini-1.5-flash",
+                               max_concurrency=16, requests_per_second=5)
+        responses = await client.complete_many(prompts)
+    """
+
+    def __init__(self, transport: AITransport, model: str, max_concurrency: int = 8,
+                 requests_per_second: float | None = None, burst: float | None = None,
+                 timeout: float = 60.0, retry_policy: RetryPolicy | None = None):
+        self.transport = transport
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.timeout = max(timeout, getattr(transport, "http_timeout", None) or 0)
+        self.retry_policy = retry_policy or RetryPolicy()
+        # asyncio primitives bind to the running loop, so they are created per loop
+        self._loop = None
+        self._semaphore = None
+        self._bucket = None
+
+    def _flow_control(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._bucket = TokenBucket(self.requests_per_second, self.burst) if self.requests_per_second else None
+        return self._semaphore, self._bucket
+
+    async def complete(self, prompt: str, system_prompt: str = SYSTEM_PROMPT) -> dict:
+        """Sends one prompt, retrying transient failures.
+
+        Returns:
+            The transport's response dictionary, plus `latency` (seconds of the
+            successful attempt) and `attempts`.
+
+        Raises:
+            AIClientError: When the call fails permanently or retries run out.
+        """
+        semaphore, bucket = self._flow_control()
+        attempts = self.retry_policy.max_attempts
+        for attempt in range(1, attempts + 1):
+            async with semaphore:
+                if bucket is not None:
+                    await bucket.acquire()
+                started = time.perf_counter()
+                try:
+                    response = await asyncio.wait_for(
+                        self.transport.complete(prompt, self.model, system_prompt), timeout=self.timeout)
+                    response["latency"] = time.perf_counter() - started
+                    response["attempts"] = attempt
+                    return response
+                except asyncio.TimeoutError:
+                    error = AITransportError(f"{self.transport.name} call timed out after {self.timeout}s")
+                except AITransportError as e:
+                    error = e
+            if not error.retryable or attempt == attempts:
+                raise AIClientError(f"LLM call failed after {attempt} attempt(s): {error}") from error
+            delay = self.retry_policy.delay(attempt, error)
+            logging.warning(f"Transient LLM error ({error}); retrying in {delay:.2f}s "
+                            f"(attempt {attempt + 1}/{attempts})")
+            await asyncio.sleep(delay)
+
+    async def complete_many(self, prompts: list[str], system_prompt: str = SYSTEM_PROMPT) -> list:
+        """Sends many prompts concurrently; failures are returned as exceptions in place."""
+        return await asyncio.gather(*(self.complete(prompt, system_prompt) for prompt in prompts),
+                                    return_exceptions=True)
+
+def client_from_env() -> AsyncAIClient:
+    """Builds a client from environment variables.
+
+    `GOOGLE_API_KEY` selects Gemini; otherwise `AI_PROVIDER_BASE_URL` (with an
+    optional `AI_PROVIDER_API_KEY`) selects an OpenAI-compatible server.
+    Without either, the offline placeholder transport is used. `AI_MODEL`,
+    `AI_MAX_CONCURRENCY`, `AI_REQUESTS_PER_SECOND` and `AI_TIMEOUT` tune the
+    client; `AI_TIMEOUT` bounds both the HTTP socket and each attempt.
+    """
+    timeout = float(os.getenv("AI_TIMEOUT", "60"))
+    if os.getenv("GOOGLE_API_KEY"):
+        transport = GeminiTransport(os.environ["GOOGLE_API_KEY"], http_timeout=timeout)
+        default_model = "gemini-1.5-flash"
+    elif os.getenv("AI_PROVIDER_BASE_URL"):
+        transport = OpenAICompatibleTransport(os.getenv("AI_PROVIDER_API_KEY"), os.environ["AI_PROVIDER_BASE_URL"],
+                                              http_timeout=timeout)
+        default_model = "gpt-4o-mini"
+    else:
+        transport = PlaceholderTransport()
+        default_model = "placeholder"
+
+    requests_per_second = os.getenv("AI_REQUESTS_PER_SECOND")
+    return AsyncAIClient(
+        transport,
+        model=os.getenv("AI_MODEL", default_model),
+        max_concurrency=int(os.getenv("AI_MAX_CONCURRENCY", "8")),
+        requests_per_second=float(requests_per_second) if requests_per_second else None,
+        timeout=timeout,
+    )
@@ -1,133 +1,265 @@
 
-import os
+import json
+import asyncio
 import logging
-# Import necessary AI SDKs later, e.g., from openai import OpenAI
+import concurrent.futures
 
-logging.basicConfig(level=logging.INFO, format=\"%(asctime)s - %(levelname)s - %(message)s\")
+from src.ai_client import AsyncAIClient, client_from_env
+from src.ai_cache import InstructionCache, cache_from_env
+from src.metrics import PipelineMetrics
 
-# Placeholder for API Key handling - replace with secure method
-# API_KEY = os.getenv(\"YOUR_AI_PROVIDER_API_KEY\")
-# client = OpenAI(api_key=API_KEY) # Example for OpenAI
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-def get_ai_edit_instructions(user_request: str, pbix_structure_summary: dict) -> dict | None:
-    \"\"\"Sends user request and PBIX structure summary to an LLM
-    to get structured editing instructions.
+try:
+    # Optional: load GOOGLE_API_KEY / AI_PROVIDER_* from a local .env file
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
 
-    Args:
-        user_request: The natural language request from the user.
-        pbix_structure_summary: A summary of the relevant PBIX components
-                                (e.g., layout structure, table/column names).
+# Bump whenever build_prompt changes meaning, so cached instructions are not reused
+PROMPT_VERSION = "5"
 
-    Returns:
-        A dictionary containing structured instructions for editing,
-        or None if the AI fails to provide valid instructions.
-    \"\"\"
+_default_client: AsyncAIClient | None = None
+_default_cache: InstructionCache | None = None
+_default_cache_loaded = False
+_shared_loop: asyncio.AbstractEventLoop | None = None
+
+def use_event_loop(loop: asyncio.AbstractEventLoop | None):
+    """Routes AI calls from synchronous code onto a long-lived event loop running in another thread.
 
-    # --- 1. Construct the Prompt --- 
+    A long-running service sets this so every job shares one loop, and with it
+    the client's concurrency limit and rate limiter; pass None to go back to a
+    fresh `asyncio.run` per call.
+    """
+    global _shared_loop
+    _shared_loop = loop
+
+def run_ai_coroutine(coroutine, timeout: float | None = None):
+    """Runs an AI coroutine to completion from synchronous code.
+
+    Raises:
+        TimeoutError: If it does not finish within `timeout` seconds (the
+            coroutine is cancelled).
+    """
+    if _shared_loop is not None and _shared_loop.is_running():
+        future = asyncio.run_coroutine_threadsafe(coroutine, _shared_loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"AI instructions not received within {timeout:.1f}s") from None
+    if timeout is None:
+        return asyncio.run(coroutine)
+    try:
+        return asyncio.run(asyncio.wait_for(coroutine, timeout))
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"AI instructions not received within {timeout:.1f}s") from None
+
+def get_default_client() -> AsyncAIClient:
+    """Returns the process-wide AI client, building it from the environment on first use."""
+    global _default_client
+    if _default_client is None:
+        _default_client = client_from_env()
+        logging.info(f"Using {_default_client.transport.name} AI transport with model {_default_client.model}")
+    return _default_client
+
+def get_default_cache() -> InstructionCache | None:
+    """Returns the process-wide instruction cache (None when disabled via `AI_CACHE=0`)."""
+    global _default_cache, _default_cache_loaded
+    if not _default_cache_loaded:
+        _default_cache_loaded = True
+        try:
+            _default_cache = cache_from_env()
+        except Exception as e:
+            logging.warning(f"AI instruction cache unavailable, continuing without it: {e}")
+    return _default_cache
+
+def build_prompt(user_request: str, pbix_structure_summary: dict) -> str:
+    """Builds the instruction prompt for a user request and PBIX structure summary."""
+    # --- Construct the Prompt --- 
     # This needs careful engineering. It should include:
     # - The user's raw request.
     # - Context about the PBIX structure (layout sections, visuals, data model tables/columns).
     # - Clear instructions on the desired output format (e.g., JSON with action type, target element, parameters).
-    prompt = f\"\"
+    return f"""
     You are an AI assistant helping to modify Power BI PBIX files programmatically.
-    The user wants to make the following change: \"{user_request}\"
+    The user wants to make the following change: "{user_request}"
 
-    Here is a summary of the relevant PBIX structure:
-    {json.dumps(pbix_structure_summary, indent=2)}
+    Here is a summary of the relevant PBIX structure (visuals are rows following "visual_columns"):
+    {json.dumps(pbix_structure_summary, ensure_ascii=False, separators=(",", ":"))}
 
     Based on the user request and the structure, provide instructions in JSON format
     to perform the edit. The JSON should specify:
-    - \"action\": The type of edit (e.g., \"add_visual\", \"modify_measure\", \"change_title\").
-    - \"target\": Details identifying the element to modify (e.g., {{ \"section_name\": \"Page 1\", \"visual_name\": \"Sales Chart\" }}).
-    - \"parameters\": Specific values needed for the action (e.g., {{ \"new_title\": \"Updated Sales Chart\" }} or {{ \"measure_dax\": \"SUM(Sales[Revenue])\" }}).
+    - "action": The type of edit (e.g., "add_visual", "modify_measure", "change_title").
+    - "target": Details identifying the element to modify (e.g., {{ "section_name": "Page 1", "visual_name": "Sales Chart" }}).
+    - "parameters": Specific values needed for the action (e.g., {{ "new_title": "Updated Sales Chart" }} or {{ "measure_dax": "SUM(Sales[Revenue])" }}).
 
     Example Output Format:
-    {{ \"action\": \"change_title\", \"target\": {{ \"visual_name\": \"Old Title Visual\" }}, \"parameters\": {{ \"new_title\": \"New Title\" }} }}
+    {{ "action": "change_title", "target": {{ "visual_name": "Old Title Visual" }}, "parameters": {{ "new_title": "New Title" }} }}
+
+    For "modify_visual_property", "parameters" holds a "property_path" into the visual container, crossing its
+    JSON-encoded "config" transparently (e.g. "config.singleVisual.vcObjects.title[0].properties.show"), and either
+    a "new_value" or "delete": true. Paths support [*] wildcards and filters on paths relative to each element, such
+    as "$.sections[*].visualContainers[?config.singleVisual.visualType=barChart]". A target with only
+    "section_name" and/or "visual_type" applies the path to every matching visual.
+
+    If the request needs several edits, return them in order as a plan; they are applied together or not at all:
+    {{ "operations": [ {{ "action": "change_title", "target": {{ "visual_name": "visual1" }}, "parameters": {{ "new_title": "Sales" }} }},
+                       {{ "action": "change_title", "target": {{ "visual_name": "visual2" }}, "parameters": {{ "new_title": "Costs" }} }} ] }}
 
     Provide only the JSON instructions.
-    \"\"\"
-    logging.info(f\"Sending request to AI for: {user_request}\")
-    # logging.debug(f\"Full prompt:\\n{prompt}\") # Uncomment for debugging
+    """
+
+def parse_instructions(ai_response_content: str) -> dict | None:
+    """Parses and validates the JSON instructions returned by the LLM.
 
-    # --- 2. Call the LLM API (Placeholder) --- 
+    Returns a single `{action, target, parameters}` instruction, or a plan
+    `{"operations": [...]}` when the model returned several edits (either as
+    such an object or as a bare list). Returns None if the response is not
+    valid instructions.
+    """
     try:
-        # Replace with actual API call using the chosen provider's SDK
-        # response = client.chat.completions.create(
-        #     model=\"gpt-4\", # Or another suitable model
-        #     messages=[{{\"role\": \"system\", \"content\": \"You are a PBIX modification assistant.\"}},
-        #               {{\"role\": \"user\", \"content\": prompt}}],
-        #     response_format={{\"type\": \"json_object\"}} # If supported
-        # )
-        # ai_response_content = response.choices[0].message.content
-
-        # --- Placeholder Response --- 
-        # Simulate a response for now
-        logging.warning(\"Using placeholder AI response. Replace with actual API call.\")
-        if \"add a title\" in user_request.lower():
-             ai_response_content = json.dumps({
-                 \"action\": \"add_visual\",
-                 \"target\": { \"section_name\": \"Page 1\" }, # Example target
-                 \"parameters\": {
-                     \"visual_type\": \"textbox\",
-                     \"properties\": { \"text\": \"New Title Added by AI\" },
-                     \"position\": { \"x\": 10, \"y\": 10, \"z\": 0 },
-                     \"size\": { \"width\": 300, \"height\": 50 }
-                 }
-             })
-        elif \"change title\" in user_request.lower():
-             ai_response_content = json.dumps({
-                 \"action\": \"modify_visual_property\",
-                 \"target\": { \"visual_name\": \"VisualToChange\" }, # Needs actual target identification
-                 \"parameters\": { \"property_path\": \"config.layouts[0].widgets[0].config.title\", \"new_value\": \"Title Updated by AI\" }
-             })
-        else:
-            ai_response_content = \"{}\" # Empty response if no match
-        # --- End Placeholder Response ---
-
-        logging.info(f\"Received AI response content.\")
-        # logging.debug(f\"AI Response: {ai_response_content}\")
-
-        # --- 3. Parse the Response --- 
         # Ensure the response is valid JSON
         instructions = json.loads(ai_response_content)
-        
-        # --- 4. Basic Validation (Optional but Recommended) --- 
-        if not isinstance(instructions, dict) or \"action\" not in instructions:
-            logging.error(f\"Invalid instruction format received from AI: {instructions}\")
-            return None
-            
-        logging.info(f\"Successfully parsed AI instructions: {instructions}\")
-        return instructions
-
     except json.JSONDecodeError as e:
-        logging.error(f\"Failed to decode JSON from AI response: {e}\\nResponse content: {ai_response_content}\")
+        logging.error(f"Failed to decode JSON from AI response: {e}\nResponse content: {ai_response_content}")
+        return None
+
+    # A bare list of operations is accepted as a plan
+    if isinstance(instructions, list):
+        instructions = {"operations": instructions}
+
+    # Basic Validation (Optional but Recommended)
+    if not isinstance(instructions, dict):
+        logging.error(f"Invalid instruction format received from AI: {instructions}")
+        return None
+    operations = instructions.get("operations") if "operations" in instructions else [instructions]
+    if not isinstance(operations, list) or not operations or \
+            not all(isinstance(operation, dict) and "action" in operation for operation in operations):
+        logging.error(f"Invalid instruction format received from AI: {instructions}")
         return None
+
+    logging.info(f"Successfully parsed AI instructions: {instructions}")
+    return instructions
+
+async def get_ai_edit_instructions_async(user_request: str, pbix_structure_summary: dict,
+                                         client: AsyncAIClient | None = None,
+                                         cache: InstructionCache | None = None,
+                                         bypass_cache: bool = False,
+                                         metrics: PipelineMetrics | None = None) -> dict | None:
+    """Async variant of `get_ai_edit_instructions`; many calls can be in flight at once.
+
+    Concurrency, rate limiting, retries and timeouts are handled by `client`
+    (the environment-configured default client if omitted). Valid
+    instructions are stored in `cache` (the default cache if omitted) and
+    served from it on repeat requests unless `bypass_cache` is set. LLM
+    latency, token usage and cache hits are recorded on `metrics` if given.
+    """
+    client = client or get_default_client()
+    cache = None if bypass_cache else (cache or get_default_cache())
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(user_request, pbix_structure_summary, client.model, PROMPT_VERSION)
+        cached = cache.get(cache_key)
+        if metrics is not None:
+            metrics.record_cache("ai_instructions", hit=cached is not None)
+        if cached is not None:
+            logging.info(f"Using cached AI instructions for: {user_request}")
+            if metrics is not None:
+                metrics.record_llm_call(cached=True)
+            return cached
+
+    prompt = build_prompt(user_request, pbix_structure_summary)
+    logging.info(f"Sending request to AI for: {user_request}")
+    # logging.debug(f"Full prompt:\n{prompt}") # Uncomment for debugging
+
+    try:
+        response = await client.complete(prompt)
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
-        # Catch potential API errors or other issues
-        logging.error(f\"An error occurred during AI interaction: {e}\")
+        # API errors that survived the client's retries, or a transport bug
+        logging.error(f"An error occurred during AI interaction: {e}")
+        if metrics is not None:
+            metrics.record_llm_call(failed=True)
         return None
 
+    if metrics is not None:
+        usage = response.get("usage") or {}
+        metrics.record_llm_call(response["latency"], usage.get("prompt_tokens"), usage.get("completion_tokens"))
+    logging.info(f"Received AI response content in {response['latency']:.2f}s.")
+    # logging.debug(f"AI Response: {response['content']}")
+    instructions = parse_instructions(response["content"])
+    if instructions is not None and cache_key is not None:
+        cache.put(cache_key, instructions)
+    return instructions
+
+async def get_many_ai_edit_instructions(requests: list[tuple[str, dict]],
+                                        client: AsyncAIClient | None = None,
+                                        bypass_cache: bool = False,
+                                        metrics: PipelineMetrics | None = None) -> list[dict | None]:
+    """Fetches instructions for many (user_request, structure_summary) pairs concurrently.
+
+    A failure in one request yields None for it without affecting the others.
+
+    Returns:
+        Instructions (or None on failure) in the same order as `requests`.
+    """
+    outcomes = await asyncio.gather(*(
+        get_ai_edit_instructions_async(user_request, summary, client, bypass_cache=bypass_cache, metrics=metrics)
+        for user_request, summary in requests), return_exceptions=True)
+    results = []
+    for (user_request, _), outcome in zip(requests, outcomes):
+        if isinstance(outcome, BaseException):
+            logging.error(f"Fetching AI instructions for {user_request!r} failed: {outcome!r}")
+            outcome = None
+        results.append(outcome)
+    return results
+
+def get_ai_edit_instructions(user_request: str, pbix_structure_summary: dict,
+                             client: AsyncAIClient | None = None, bypass_cache: bool = False) -> dict | None:
+    """Sends user request and PBIX structure summary to an LLM
+    to get structured editing instructions.
+
+    This is a blocking wrapper around `get_ai_edit_instructions_async`; code
+    already running an event loop should await the async variant instead.
+
+    Args:
+        user_request: The natural language request from the user.
+        pbix_structure_summary: A summary of the relevant PBIX components
+                                (e.g., layout structure, table/column names).
+        client: The AI client to use; defaults to `get_default_client()`.
+        bypass_cache: Skip the instruction cache and always call the LLM.
+
+    Returns:
+        A dictionary containing structured instructions for editing,
+        or None if the AI fails to provide valid instructions.
+    """
+    return run_ai_coroutine(get_ai_edit_instructions_async(user_request, pbix_structure_summary, client,
+                                                      bypass_cache=bypass_cache))
+
 # Example usage
-if __name__ == \"__main__\":
-    test_request = \"Add a title card to Page 1 saying \\\"Sales Overview\\\".\"
+if __name__ == "__main__":
+    test_request = "Add a title card to Page 1 saying \"Sales Overview\"."
     # In a real scenario, this summary would be dynamically generated from parsed PBIX components
     test_summary = {
-        \"layout\": {
-            \"sections\": [
-                {\"name\": \"Page 1\", \"displayName\": \"Sales Dashboard\", \"visuals\": [\"Sales Chart\", \"KPI Card\"]},
-                {\"name\": \"Page 2\", \"displayName\": \"Details\", \"visuals\": [\"Data Table\"]}
+        "layout": {
+            "sections": [
+                {"name": "Page 1", "displayName": "Sales Dashboard", "visuals": ["Sales Chart", "KPI Card"]},
+                {"name": "Page 2", "displayName": "Details", "visuals": ["Data Table"]}
             ]
         },
-        \"data_model\": {
-            \"tables\": [\"Sales\", \"Products\", \"Calendar\"]
+        "data_model": {
+            "tables": ["Sales", "Products", "Calendar"]
         }
     }
     
     instructions = get_ai_edit_instructions(test_request, test_summary)
     
     if instructions:
-        print(\"\\nReceived instructions:\")
+        print("\nReceived instructions:")
         print(json.dumps(instructions, indent=2))
     else:
-        print(\"\\nFailed to get valid instructions from AI.\")
+        print("\nFailed to get valid instructions from AI.")
 
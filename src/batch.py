@@ -0,0 +1,141 @@
+
+import os
+import csv
+import json
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from src.transformer import process_pbix_edit_requests
+from src.metrics import PipelineMetrics
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+MANIFEST_FIELDS = ("input", "output", "request")
+
+def load_manifest(manifest_path: str) -> list[dict]:
+    """Loads batch rows from a JSONL or CSV manifest.
+
+    Each row needs `input`, `output` and `request` fields. CSV manifests must
+    have a header row; any file not ending in `.csv` is read as JSONL.
+
+    Raises:
+        FileNotFoundError: If the manifest does not exist.
+        ValueError: If a row is malformed or misses a required field.
+    """
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"Manifest not found: {manifest_path}")
+
+    rows = []
+    with open(manifest_path, "r", encoding="utf-8", newline="") as f:
+        if manifest_path.lower().endswith(".csv"):
+            for line_number, row in enumerate(csv.DictReader(f), start=2):
+                rows.append((line_number, row))
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    rows.append((line_number, json.loads(line)))
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{manifest_path}:{line_number}: invalid JSON ({e})") from e
+
+    items = []
+    for line_number, row in rows:
+        missing = [field for field in MANIFEST_FIELDS if not (row or {}).get(field)]
+        if missing:
+            raise ValueError(f"{manifest_path}:{line_number}: missing field(s) {', '.join(missing)}")
+        items.append({field: row[field] for field in MANIFEST_FIELDS})
+    logging.info(f"Loaded {len(items)} batch item(s) from {manifest_path}")
+    return items
+
+def group_manifest(items: list[dict]) -> list[dict]:
+    """Groups manifest rows by (input, output) so each PBIX is parsed and saved once.
+
+    Requests keep their manifest order within a group.
+
+    Raises:
+        ValueError: If two different inputs would be written to the same output.
+    """
+    groups: dict[tuple[str, str], dict] = {}
+    output_owners: dict[str, str] = {}
+    for item in items:
+        input_path = os.path.abspath(item["input"])
+        output_path = os.path.abspath(item["output"])
+        owner = output_owners.setdefault(output_path, input_path)
+        if owner != input_path:
+            raise ValueError(f"Output {item['output']} is targeted by more than one input ({owner}, {input_path})")
+        group = groups.setdefault((input_path, output_path),
+                                  {"input": item["input"], "output": item["output"], "requests": []})
+        group["requests"].append(item["request"])
+    return list(groups.values())
+
+def _run_group(group: dict, bypass_cache: bool = False) -> list[dict]:
+    """Worker entry point: applies every request of one group and reports per item."""
+    started = time.perf_counter()
+    metrics = PipelineMetrics()
+    try:
+        results = process_pbix_edit_requests(group["input"], group["output"], group["requests"],
+                                             bypass_cache=bypass_cache, metrics=metrics)
+    except Exception as e:
+        results = [{"request": request, "status": "error", "error": str(e), "seconds": 0.0}
+                   for request in group["requests"]]
+    group_seconds = time.perf_counter() - started
+    group_metrics = metrics.to_dict()
+    for result in results:
+        result.update(input=group["input"], output=group["output"], group_seconds=group_seconds,
+                      group_metrics=group_metrics)
+    return results
+
+def run_batch(items: list[dict], max_workers: int | None = None, bypass_cache: bool = False) -> list[dict]:
+    """Runs batch items over a process pool, one task per (input, output) group.
+
+    Args:
+        items: Manifest rows with `input`, `output` and `request`.
+        max_workers: Pool size; defaults to `os.cpu_count()`. Use 1 to run
+            everything in the current process (useful for debugging).
+        bypass_cache: Always ask the LLM instead of reusing cached instructions.
+
+    Returns:
+        One result per manifest row (see `process_pbix_edit_requests`),
+        annotated with its input/output, the wall time of its group and the
+        group's `PipelineMetrics` as a dictionary.
+    """
+    groups = group_manifest(items)
+    logging.info(f"Running {len(items)} request(s) across {len(groups)} PBIX file(s)")
+
+    if max_workers == 1:
+        return [result for group in groups for result in _run_group(group, bypass_cache)]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        group_results = executor.map(_run_group, groups, [bypass_cache] * len(groups))
+        return [result for results in group_results for result in results]
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Apply many edit requests across many PBIX files.")
+    parser.add_argument("--manifest", required=True, help="JSONL or CSV file with input/output/request rows.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count).")
+    parser.add_argument("--report", help="Write per-item results as JSON to this path.")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the AI instruction cache.")
+
+    args = parser.parse_args()
+
+    try:
+        batch_started = time.perf_counter()
+        batch_results = run_batch(load_manifest(args.manifest), max_workers=args.workers,
+                                  bypass_cache=args.no_cache)
+        failed = [result for result in batch_results if result["status"] != "ok"]
+        for result in failed:
+            print(f"FAILED {result['input']}: {result['request']!r}: {result['error']}")
+        print(f"Processed {len(batch_results)} request(s) in {time.perf_counter() - batch_started:.2f}s "
+              f"({len(failed)} failed)")
+        if args.report:
+            with open(args.report, "w", encoding="utf-8") as f:
+                json.dump(batch_results, f, indent=2)
+        if failed:
+            exit(1)
+    except Exception as e:
+        logging.error(f"Batch run failed: {e}")
+        exit(1)
@@ -1,53 +1,217 @@
 
 import zipfile
 import os
+import fnmatch
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-logging.basicConfig(level=logging.INFO, format=\"%(asctime)s - %(levelname)s - %(message)s\")
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-def extract_pbix(pbix_file_path: str, output_dir: str):
-    \"\"\"Extracts the contents of a PBIX file to a specified directory.
+# Guards against zip bombs and hostile uploads. Real PBIX files have a few dozen
+# members; the DataModel blob is already XPress9-compressed (ratio ~1) and the
+# UTF-16 Layout JSON rarely compresses past 50:1.
+DEFAULT_MAX_TOTAL_BYTES = 16 * 1024 * 1024 * 1024
+DEFAULT_MAX_MEMBERS = 10000
+DEFAULT_MAX_RATIO = 250
+RATIO_CHECK_MIN_BYTES = 1024 * 1024 # Tiny members may legitimately compress extremely well
+COPY_CHUNK_SIZE = 1024 * 1024
+
+class UnsafeArchiveError(ValueError):
+    """Raised when an archive exceeds the extraction limits or contains unsafe member paths."""
+
+def _safe_target(output_dir: str, member_name: str) -> str:
+    """Maps a member name to a path inside `output_dir`, rejecting anything that would escape it."""
+    name = member_name.replace("\\", "/")
+    parts = [part for part in name.split("/") if part not in ("", ".")]
+    if name.startswith("/") or ".." in parts or (parts and ":" in parts[0]) or "\x00" in name:
+        raise UnsafeArchiveError(f"Unsafe member path in archive: {member_name!r}")
+    root = os.path.realpath(output_dir)
+    target = os.path.realpath(os.path.join(root, *parts))
+    if target != root and not target.startswith(root + os.sep):
+        raise UnsafeArchiveError(f"Member {member_name!r} would be extracted outside {output_dir}")
+    return target
+
+def _select_members(zip_ref: zipfile.ZipFile, members: list[str] | None) -> list[zipfile.ZipInfo]:
+    infos = zip_ref.infolist()
+    if members is None:
+        return infos
+    selected = [info for info in infos if any(info.filename == pattern or fnmatch.fnmatchcase(info.filename, pattern)
+                                              for pattern in members)]
+    missing = [pattern for pattern in members if not any(info.filename == pattern or fnmatch.fnmatchcase(info.filename, pattern)
+                                                         for info in selected)]
+    if missing:
+        logging.warning(f"No archive members matched: {missing}")
+    return selected
+
+def check_archive(zip_ref: zipfile.ZipFile, members: list[str] | None = None,
+                  max_total_bytes: int = DEFAULT_MAX_TOTAL_BYTES, max_members: int = DEFAULT_MAX_MEMBERS,
+                  max_ratio: float = DEFAULT_MAX_RATIO) -> list[zipfile.ZipInfo]:
+    """Validates an archive from its central directory, before anything is decompressed.
+
+    Args:
+        zip_ref: The open archive.
+        members: Member names or glob patterns to select (all members if None).
+        max_total_bytes: Limit on the summed uncompressed size of the selected members.
+        max_members: Limit on the number of entries in the archive.
+        max_ratio: Limit on any member's uncompressed/compressed size ratio.
+
+    Returns:
+        The central directory entries of the selected members.
+
+    Raises:
+        UnsafeArchiveError: If a limit is exceeded or a member is encrypted.
+    """
+    entry_count = len(zip_ref.infolist())
+    if entry_count > max_members:
+        raise UnsafeArchiveError(f"Archive has {entry_count} members (limit {max_members})")
+
+    infos = _select_members(zip_ref, members)
+    total_bytes = 0
+    for info in infos:
+        if info.flag_bits & 0x1:
+            raise UnsafeArchiveError(f"Member {info.filename!r} is encrypted")
+        if info.file_size >= RATIO_CHECK_MIN_BYTES and info.file_size > max_ratio * max(info.compress_size, 1):
+            raise UnsafeArchiveError(f"Member {info.filename!r} expands {info.file_size / max(info.compress_size, 1):.0f}:1 "
+                                     f"(limit {max_ratio}:1)")
+        total_bytes += info.file_size
+    if total_bytes > max_total_bytes:
+        raise UnsafeArchiveError(f"Archive expands to {total_bytes} bytes (limit {max_total_bytes})")
+    return infos
+
+def _extract_member(pbix_file_path: str, info: zipfile.ZipInfo, target: str, handles: threading.local,
+                    opened: list[zipfile.ZipFile]):
+    # Each worker reads through its own handle so members inflate in parallel
+    # instead of contending for the shared file position lock.
+    zip_ref = getattr(handles, "zip_ref", None)
+    if zip_ref is None:
+        zip_ref = handles.zip_ref = zipfile.ZipFile(pbix_file_path, "r")
+        opened.append(zip_ref)
+
+    partial_path = target + ".partial"
+    written = 0
+    try:
+        with zip_ref.open(info) as source, open(partial_path, "wb") as destination:
+            while chunk := source.read(COPY_CHUNK_SIZE):
+                written += len(chunk)
+                if written > info.file_size: # Never trust the stream past the size we validated
+                    raise UnsafeArchiveError(f"Member {info.filename!r} inflates past its declared size")
+                destination.write(chunk)
+        os.replace(partial_path, target)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+def extract_pbix(pbix_file_path: str, output_dir: str, members: list[str] | None = None,
+                 max_workers: int | None = None, max_total_bytes: int = DEFAULT_MAX_TOTAL_BYTES,
+                 max_members: int = DEFAULT_MAX_MEMBERS, max_ratio: float = DEFAULT_MAX_RATIO):
+    """Extracts the contents of a PBIX file to a specified directory.
+
+    The archive is validated against the size, ratio and member-count limits
+    (see `check_archive`), and every member path is checked to stay inside
+    `output_dir` and not to collide with another member's, before any data
+    is written. Members are then inflated in parallel, largest first, with
+    bounded-memory chunked copies, so one large DataModel no longer
+    serializes the whole extraction.
 
     Args:
         pbix_file_path: The path to the .pbix file.
         output_dir: The directory where the contents should be extracted.
-    \"\"\"
+        members: Member names or glob patterns (e.g. `["Report/*", "DataModelSchema"]`)
+            to extract; all members if None.
+        max_workers: Decompression threads (defaults to `min(8, os.cpu_count())`).
+        max_total_bytes: Limit on the summed uncompressed size of the extracted members.
+        max_members: Limit on the number of entries in the archive.
+        max_ratio: Limit on any member's compression ratio.
+
+    Returns:
+        The names of the extracted members.
+
+    Raises:
+        UnsafeArchiveError: If the archive breaks a limit or contains an unsafe or duplicate path.
+    """
     if not os.path.exists(pbix_file_path):
-        logging.error(f\"PBIX file not found: {pbix_file_path}\")
-        raise FileNotFoundError(f\"PBIX file not found: {pbix_file_path}\")
+        logging.error(f"PBIX file not found: {pbix_file_path}")
+        raise FileNotFoundError(f"PBIX file not found: {pbix_file_path}")
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-        logging.info(f\"Created output directory: {output_dir}\")
+        logging.info(f"Created output directory: {output_dir}")
 
     try:
-        with zipfile.ZipFile(pbix_file_path, \'r\') as zip_ref:
-            zip_ref.extractall(output_dir)
-            logging.info(f\"Successfully extracted \\\"{pbix_file_path}\\\" to \\\"{output_dir}\\\"\")
-            # List extracted files for confirmation
-            extracted_files = zip_ref.namelist()
-            logging.info(f\"Extracted files: {extracted_files}\")
-            return extracted_files
+        with zipfile.ZipFile(pbix_file_path, 'r') as zip_ref:
+            infos = check_archive(zip_ref, members, max_total_bytes=max_total_bytes,
+                                  max_members=max_members, max_ratio=max_ratio)
     except zipfile.BadZipFile:
-        logging.error(f\"Error: The file \\\"{pbix_file_path}\\\" is not a valid zip file or is corrupted.\")
+        logging.error(f"Error: The file \"{pbix_file_path}\" is not a valid zip file or is corrupted.")
+        raise
+    except UnsafeArchiveError as e:
+        logging.error(f"Refusing to extract \"{pbix_file_path}\": {e}")
+        raise
+
+    try:
+        # Resolve every target (and fail on traversal) before writing anything
+        targets = [(info, _safe_target(output_dir, info.filename)) for info in infos]
+        # Two members mapping to one file (a repeated name, "a/b" next to "a/./b",
+        # or names differing only in case on Windows) would race in the workers
+        claimed = {}
+        for info, target in targets:
+            key = os.path.normcase(target)
+            if key in claimed:
+                raise UnsafeArchiveError(f"Members {claimed[key]!r} and {info.filename!r} both extract to {target}")
+            claimed[key] = info.filename
+        files = []
+        for info, target in targets:
+            if info.is_dir():
+                os.makedirs(target, exist_ok=True)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                files.append((info, target))
+        files.sort(key=lambda item: item[0].file_size, reverse=True)
+
+        handles = threading.local()
+        opened: list[zipfile.ZipFile] = []
+        workers = max(1, min(max_workers or min(8, os.cpu_count() or 1), len(files) or 1))
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_extract_member, pbix_file_path, info, target, handles, opened) for info, target in files]
+                for future in futures:
+                    future.result()
+        finally:
+            for zip_ref in opened:
+                zip_ref.close()
+
+        extracted_files = [info.filename for info in infos]
+        logging.info(f"Successfully extracted \"{pbix_file_path}\" to \"{output_dir}\"")
+        logging.info(f"Extracted {len(extracted_files)} files with {workers} worker(s).")
+        logging.debug(f"Extracted files: {extracted_files}")
+        return extracted_files
+    except UnsafeArchiveError as e:
+        logging.error(f"Refusing to extract \"{pbix_file_path}\": {e}")
         raise
     except Exception as e:
-        logging.error(f\"An unexpected error occurred during extraction: {e}\")
+        logging.error(f"An unexpected error occurred during extraction: {e}")
         raise
 
 # Example usage (can be run as a script)
-if __name__ == \"__main__\":
+if __name__ == "__main__":
     import argparse
 
-    parser = argparse.ArgumentParser(description=\"Extract a PBIX file.\")
-    parser.add_argument(\"--input\", required=True, help=\"Path to the input PBIX file.\")
-    parser.add_argument(\"--output\", required=True, help=\"Directory to extract the contents to.\")
+    parser = argparse.ArgumentParser(description="Extract a PBIX file.")
+    parser.add_argument("--input", required=True, help="Path to the input PBIX file.")
+    parser.add_argument("--output", required=True, help="Directory to extract the contents to.")
+    parser.add_argument("--member", action="append", dest="members", help="Member name or glob pattern to extract (repeatable; default: all).")
+    parser.add_argument("--workers", type=int, help="Number of decompression threads.")
+    parser.add_argument("--max-total-bytes", type=int, default=DEFAULT_MAX_TOTAL_BYTES, help="Limit on total uncompressed size.")
+    parser.add_argument("--max-members", type=int, default=DEFAULT_MAX_MEMBERS, help="Limit on the number of archive members.")
+    parser.add_argument("--max-ratio", type=float, default=DEFAULT_MAX_RATIO, help="Limit on any member's compression ratio.")
 
     args = parser.parse_args()
 
     try:
-        extract_pbix(args.input, args.output)
+        extract_pbix(args.input, args.output, members=args.members, max_workers=args.workers,
+                     max_total_bytes=args.max_total_bytes, max_members=args.max_members, max_ratio=args.max_ratio)
     except Exception as e:
-        logging.error(f\"Extraction failed: {e}\")
+        logging.error(f"Extraction failed: {e}")
         exit(1)
-
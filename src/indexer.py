@@ -0,0 +1,435 @@
+
+import os
+import json
+import time
+import sqlite3
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from src.layout import config_title, query_fields
+from src.parser import iter_layout_visuals
+from src.pbix_package import PbixPackage
+from src.schema import DATA_MODEL_SCHEMA_PATH, read_data_model_schema
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DEFAULT_INDEX_PATH = "pbix_index.sqlite"
+REPORT_EXTENSIONS = (".pbix", ".pbit")
+INDEX_VERSION = "2" # Bump to force a full re-index when extraction changes
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    fingerprint TEXT,
+    indexed_at REAL NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    name TEXT,
+    display_name TEXT,
+    ordinal INTEGER
+);
+CREATE TABLE IF NOT EXISTS visuals (
+    id INTEGER PRIMARY KEY,
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    page_id INTEGER NOT NULL REFERENCES pages(id) ON DELETE CASCADE,
+    name TEXT,
+    visual_type TEXT,
+    title TEXT
+);
+CREATE TABLE IF NOT EXISTS fields (
+    visual_id INTEGER NOT NULL REFERENCES visuals(id) ON DELETE CASCADE,
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    table_name TEXT NOT NULL,
+    field_name TEXT NOT NULL,
+    kind TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS model_fields (
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    table_name TEXT NOT NULL,
+    field_name TEXT,
+    kind TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE INDEX IF NOT EXISTS pages_report ON pages (report_id);
+CREATE INDEX IF NOT EXISTS visuals_report ON visuals (report_id);
+CREATE INDEX IF NOT EXISTS visuals_type ON visuals (visual_type COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS fields_table ON fields (table_name COLLATE NOCASE, field_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS fields_visual ON fields (visual_id);
+CREATE INDEX IF NOT EXISTS model_fields_table ON model_fields (table_name COLLATE NOCASE);
+"""
+
+def scan_report(path: str, known_fingerprint: str | None = None) -> dict:
+    """Worker entry point: reads the pages, visuals and model fields of one report.
+
+    Only the Layout (streamed, one visual at a time) and, when present, the
+    DataModelSchema are read from the archive. If the layout/schema CRCs
+    still match `known_fingerprint`, nothing is decompressed at all.
+
+    Returns:
+        `{"path", "fingerprint", "unchanged"}` plus `"pages"`, `"model"` or an
+        `"error"` message.
+    """
+    result = {"path": path, "fingerprint": None, "unchanged": False}
+    try:
+        with PbixPackage(path) as package:
+            layout_member = package.find_layout_member()
+            parts = [package.member_fingerprint(name) for name in (layout_member, DATA_MODEL_SCHEMA_PATH)
+                     if name and package.has_member(name)]
+            result["fingerprint"] = f"{INDEX_VERSION}:" + "/".join(parts)
+            if result["fingerprint"] == known_fingerprint:
+                result["unchanged"] = True
+                return result
+
+            pages = {}
+            if layout_member:
+                with package.open_member(layout_member) as stream:
+                    for section_index, section_info, container in iter_layout_visuals(stream, include_empty_sections=True):
+                        page = pages.setdefault(section_index, {
+                            "name": section_info.get("name"), "display_name": section_info.get("displayName"),
+                            "ordinal": section_info.get("ordinal", section_index), "visuals": []})
+                        if container is None:
+                            continue # A page without visuals is still a page
+                        try:
+                            config = json.loads(container.get("config") or "{}")
+                        except json.JSONDecodeError:
+                            continue
+                        query = config.get("singleVisual", {}).get("prototypeQuery") or {}
+                        page["visuals"].append({
+                            "name": config.get("name"),
+                            "visual_type": config.get("singleVisual", {}).get("visualType"),
+                            "title": config_title(config),
+                            "fields": query_fields(query),
+                        })
+            result["pages"] = [pages[index] for index in sorted(pages)]
+
+            result["model"] = []
+            if package.has_member(DATA_MODEL_SCHEMA_PATH):
+                with package.open_member(DATA_MODEL_SCHEMA_PATH) as stream:
+                    result["model"] = read_data_model_schema(stream)["tables"]
+    except Exception as e:
+        # Corrupt deflate streams (zlib.error), unsupported compression and bad
+        # JSON all land here; one broken report must not abort the whole scan
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+def fts_query(text: str) -> str:
+    """Turns free text into an FTS5 query: every word becomes a quoted phrase, all required."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+class ReportIndex:
+    """Persistent SQLite index of pages, visuals and field references across many reports.
+
+    `update` scans a directory in parallel and re-reads only reports whose
+    mtime/size changed and whose Layout/DataModelSchema CRCs differ from the
+    indexed ones. Visual titles, names, types, pages and fields are also
+    kept in an FTS5 table for free-text search when SQLite supports it.
+
+    Example:
+        index = ReportIndex("reports.sqlite")
+        index.update("/shares/reports")
+        for row in index.find_visuals(visual_type="pieChart", table="Sales"):
+            print(row["path"], row["page"], row["title"])
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA_SQL)
+        try:
+            self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS visuals_fts USING fts5("
+                               "title, name, visual_type, page, fields, tokenize='unicode61')")
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            logging.warning("SQLite FTS5 unavailable; text search falls back to LIKE matching.")
+            self.has_fts = False
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # --- Indexing ---
+
+    def update(self, directory: str, max_workers: int | None = None, prune: bool = True) -> dict:
+        """Brings the index up to date with the reports under `directory`.
+
+        Args:
+            directory: Folder scanned recursively for .pbix/.pbit files.
+            max_workers: Worker processes; defaults to `os.cpu_count()`. Use 1
+                to scan in the current process.
+            prune: Drop reports under `directory` that no longer exist.
+
+        Returns:
+            Counts of scanned, indexed, unchanged (skipped by mtime or CRC),
+            failed and removed reports.
+        """
+        started = time.perf_counter()
+        stats = {"scanned": 0, "indexed": 0, "unchanged": 0, "failed": 0, "removed": 0}
+        known = {row["path"]: row for row in self._conn.execute(
+            "SELECT id, path, mtime, size, fingerprint FROM reports")}
+
+        found, pending = set(), []
+        for root, _, files in os.walk(directory):
+            for file_name in files:
+                if not file_name.lower().endswith(REPORT_EXTENSIONS):
+                    continue
+                path = os.path.abspath(os.path.join(root, file_name))
+                found.add(path)
+                stats["scanned"] += 1
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                row = known.get(path)
+                if row and row["mtime"] == stat.st_mtime and row["size"] == stat.st_size:
+                    stats["unchanged"] += 1
+                    continue
+                pending.append((path, stat, row["fingerprint"] if row else None))
+
+        if pending:
+            paths = [path for path, _, _ in pending]
+            fingerprints = [fingerprint for _, _, fingerprint in pending]
+            if max_workers == 1:
+                results = map(scan_report, paths, fingerprints)
+                self._store_results(pending, results, stats)
+            else:
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    results = executor.map(scan_report, paths, fingerprints, chunksize=8)
+                    self._store_results(pending, results, stats)
+
+        if prune:
+            prefix = os.path.join(os.path.abspath(directory), "")
+            for path, row in known.items():
+                if path.startswith(prefix) and path not in found:
+                    self._delete_report(row["id"])
+                    stats["removed"] += 1
+        self._conn.commit()
+        logging.info(f"Indexed {directory} in {time.perf_counter() - started:.2f}s: {stats}")
+        return stats
+
+    def _store_results(self, pending: list, results, stats: dict):
+        uncommitted = 0
+        for (path, stat, _), result in zip(pending, results):
+            if result.get("error"):
+                logging.warning(f"Could not index {path}: {result['error']}")
+                stats["failed"] += 1
+            elif result["unchanged"]:
+                stats["unchanged"] += 1
+            else:
+                stats["indexed"] += 1
+            self._store_report(path, stat, result)
+            uncommitted += 1
+            if uncommitted >= 200:
+                self._conn.commit() # Keep write transactions short on big scans
+                uncommitted = 0
+
+    def _delete_report(self, report_id: int):
+        if self.has_fts:
+            self._conn.execute("DELETE FROM visuals_fts WHERE rowid IN (SELECT id FROM visuals WHERE report_id = ?)",
+                               (report_id,))
+        self._conn.execute("DELETE FROM reports WHERE id = ?", (report_id,))
+
+    def _store_report(self, path: str, stat: os.stat_result, result: dict):
+        row = self._conn.execute("SELECT id FROM reports WHERE path = ?", (path,)).fetchone()
+        if result["unchanged"] and row:
+            # Touched but identical content: remember the new mtime so the next scan skips the CRC check
+            self._conn.execute("UPDATE reports SET mtime = ?, size = ? WHERE id = ?",
+                               (stat.st_mtime, stat.st_size, row["id"]))
+            return
+        if row:
+            self._delete_report(row["id"])
+        cursor = self._conn.execute(
+            "INSERT INTO reports (path, mtime, size, fingerprint, indexed_at, error) VALUES (?, ?, ?, ?, ?, ?)",
+            (path, stat.st_mtime, stat.st_size, None if result.get("error") else result["fingerprint"],
+             time.time(), result.get("error")))
+        report_id = cursor.lastrowid
+
+        for page in result.get("pages", []):
+            page_id = self._conn.execute(
+                "INSERT INTO pages (report_id, name, display_name, ordinal) VALUES (?, ?, ?, ?)",
+                (report_id, page["name"], page["display_name"], page["ordinal"])).lastrowid
+            for visual in page["visuals"]:
+                visual_id = self._conn.execute(
+                    "INSERT INTO visuals (report_id, page_id, name, visual_type, title) VALUES (?, ?, ?, ?, ?)",
+                    (report_id, page_id, visual["name"], visual["visual_type"], visual["title"])).lastrowid
+                refs = []
+                for ref, kind in visual["fields"]:
+                    table_name, _, field_name = ref.partition(".")
+                    refs.append((visual_id, report_id, table_name, field_name, kind))
+                self._conn.executemany("INSERT INTO fields (visual_id, report_id, table_name, field_name, kind) "
+                                       "VALUES (?, ?, ?, ?, ?)", refs)
+                if self.has_fts:
+                    self._conn.execute(
+                        "INSERT INTO visuals_fts (rowid, title, name, visual_type, page, fields) VALUES (?, ?, ?, ?, ?, ?)",
+                        (visual_id, visual["title"] or "", visual["name"] or "", visual["visual_type"] or "",
+                         page["display_name"] or page["name"] or "", " ".join(ref for ref, _ in visual["fields"])))
+
+        for table in result.get("model", []):
+            model_rows = [(report_id, table["name"], None, "table")]
+            model_rows += [(report_id, table["name"], column, "column") for column in table["columns"]]
+            model_rows += [(report_id, table["name"], measure, "measure") for measure in table["measures"]]
+            self._conn.executemany("INSERT INTO model_fields (report_id, table_name, field_name, kind) "
+                                   "VALUES (?, ?, ?, ?)", model_rows)
+
+    # --- Queries ---
+
+    def find_visuals(self, visual_type: str | None = None, table: str | None = None, field: str | None = None,
+                     title: str | None = None, text: str | None = None, page: str | None = None,
+                     limit: int | None = 1000) -> list[dict]:
+        """Finds visuals across every indexed report.
+
+        Args:
+            visual_type: Exact visual type (case-insensitive), e.g. "pieChart".
+            table: Only visuals bound to a field of this table.
+            field: Only visuals bound to this `Table.Field`.
+            title: Exact visual title (case-insensitive).
+            text: Free-text query over titles, names, types, pages and fields.
+                Each whitespace-separated word must match (as an FTS5 phrase
+                when available, a substring otherwise); punctuation such as
+                `-` or `"` is matched literally, not as query syntax.
+            page: Page display name or name (case-insensitive).
+            limit: Maximum number of rows.
+
+        Returns:
+            Rows with `path`, `page`, `page_name`, `visual`, `visual_type` and `title`.
+        """
+        clauses, params = [], []
+        if visual_type:
+            clauses.append("v.visual_type = ? COLLATE NOCASE")
+            params.append(visual_type)
+        if title:
+            clauses.append("v.title = ? COLLATE NOCASE")
+            params.append(title)
+        if page:
+            clauses.append("(p.display_name = ? COLLATE NOCASE OR p.name = ? COLLATE NOCASE)")
+            params += [page, page]
+        if table or field:
+            table_name, _, field_name = (field or "").partition(".")
+            sub = "SELECT visual_id FROM fields WHERE table_name = ? COLLATE NOCASE"
+            sub_params = [table or table_name]
+            if field:
+                sub += " AND field_name = ? COLLATE NOCASE"
+                sub_params.append(field_name)
+            clauses.append(f"v.id IN ({sub})")
+            params += sub_params
+        if text and text.split():
+            if self.has_fts:
+                clauses.append("v.id IN (SELECT rowid FROM visuals_fts WHERE visuals_fts MATCH ?)")
+                params.append(fts_query(text))
+            else:
+                for word in text.split():
+                    clauses.append("(v.title LIKE ? OR v.name LIKE ? OR p.display_name LIKE ?)")
+                    params += [f"%{word}%"] * 3
+
+        sql = ("SELECT r.path, p.display_name AS page, p.name AS page_name, v.name AS visual, v.visual_type, v.title "
+               "FROM visuals v JOIN pages p ON p.id = v.page_id JOIN reports r ON r.id = v.report_id")
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY r.path, p.ordinal, v.id"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def find_pages(self, table: str, field: str | None = None, limit: int | None = 1000) -> list[dict]:
+        """Finds pages with at least one visual bound to `table` (or to `table.field`)."""
+        sql = ("SELECT DISTINCT r.path, p.display_name AS page, p.name AS page_name FROM fields f "
+               "JOIN visuals v ON v.id = f.visual_id JOIN pages p ON p.id = v.page_id JOIN reports r ON r.id = f.report_id "
+               "WHERE f.table_name = ? COLLATE NOCASE")
+        params = [table]
+        if field:
+            sql += " AND f.field_name = ? COLLATE NOCASE"
+            params.append(field)
+        sql += " ORDER BY r.path, p.ordinal"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def find_reports(self, table: str | None = None, visual_type: str | None = None) -> list[str]:
+        """Lists reports whose model or visuals use `table`, and/or that contain `visual_type`."""
+        clauses, params = [], []
+        if table:
+            clauses.append("(r.id IN (SELECT report_id FROM fields WHERE table_name = ? COLLATE NOCASE) "
+                           "OR r.id IN (SELECT report_id FROM model_fields WHERE table_name = ? COLLATE NOCASE))")
+            params += [table, table]
+        if visual_type:
+            clauses.append("r.id IN (SELECT report_id FROM visuals WHERE visual_type = ? COLLATE NOCASE)")
+            params.append(visual_type)
+        sql = "SELECT r.path FROM reports r"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return [row["path"] for row in self._conn.execute(sql + " ORDER BY r.path", params)]
+
+    def stats(self) -> dict:
+        counts = {}
+        for table in ("reports", "pages", "visuals", "fields"):
+            counts[table] = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        counts["failed"] = self._conn.execute("SELECT COUNT(*) FROM reports WHERE error IS NOT NULL").fetchone()[0]
+        return counts
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Index a folder of PBIX files and query the index.")
+    parser.add_argument("--db", default=DEFAULT_INDEX_PATH, help="Index database path.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("update", help="Scan a directory and update the index.")
+    build_parser.add_argument("directory", help="Folder containing .pbix/.pbit files (scanned recursively).")
+    build_parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    build_parser.add_argument("--no-prune", action="store_true", help="Keep entries for deleted files.")
+
+    query_parser = subparsers.add_parser("query", help="Find visuals, pages or reports.")
+    query_parser.add_argument("--visual-type", help="Visual type, e.g. pieChart.")
+    query_parser.add_argument("--table", help="Table referenced by the visual.")
+    query_parser.add_argument("--field", help="Table.Field referenced by the visual.")
+    query_parser.add_argument("--title", help="Exact visual title.")
+    query_parser.add_argument("--text", help="Free-text search over titles, names, types, pages and fields.")
+    query_parser.add_argument("--page", help="Page name or display name.")
+    query_parser.add_argument("--pages", action="store_true", help="List matching pages instead of visuals (needs --table or --field).")
+    query_parser.add_argument("--reports", action="store_true", help="List matching report paths only.")
+    query_parser.add_argument("--limit", type=int, default=1000, help="Maximum rows to print.")
+    query_parser.add_argument("--json", action="store_true", help="Print rows as JSON.")
+
+    subparsers.add_parser("stats", help="Print index size.")
+
+    args = parser.parse_args()
+
+    with ReportIndex(args.db) as index:
+        if args.command == "update":
+            print(json.dumps(index.update(args.directory, max_workers=args.workers, prune=not args.no_prune)))
+        elif args.command == "stats":
+            print(json.dumps(index.stats(), indent=2))
+        else:
+            if args.reports:
+                rows = [{"path": path} for path in index.find_reports(table=args.table, visual_type=args.visual_type)]
+            elif args.pages:
+                if not (args.table or args.field):
+                    parser.error("--pages needs --table or --field")
+                table_name, _, field_name = (args.field or "").partition(".")
+                rows = index.find_pages(args.table or table_name, field_name or None, limit=args.limit)
+            else:
+                rows = index.find_visuals(visual_type=args.visual_type, table=args.table, field=args.field,
+                                          title=args.title, text=args.text, page=args.page, limit=args.limit)
+            if args.json:
+                print(json.dumps(rows, indent=2, ensure_ascii=False))
+            else:
+                for row in rows:
+                    print("\t".join("" if value is None else str(value) for value in row.values()))
+                print(f"{len(rows)} row(s)")
@@ -0,0 +1,292 @@
+
+import os
+import re
+import json
+import logging
+
+from src.layout import Layout, Section, VisualContainer
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Requests matched below this confidence go to the LLM instead
+DEFAULT_MIN_CONFIDENCE = 0.8
+
+# Friendly chart names users type, mapped to Power BI visualType ids
+VISUAL_TYPE_NAMES = {
+    "bar chart": "barChart", "stacked bar chart": "barChart", "clustered bar chart": "clusteredBarChart",
+    "column chart": "columnChart", "stacked column chart": "columnChart",
+    "clustered column chart": "clusteredColumnChart", "line chart": "lineChart", "area chart": "areaChart",
+    "pie chart": "pieChart", "pie": "pieChart", "donut chart": "donutChart", "doughnut chart": "donutChart",
+    "table": "tableEx", "matrix": "pivotTable", "card": "card", "multi-row card": "multiRowCard",
+    "slicer": "slicer", "scatter chart": "scatterChart", "map": "map", "filled map": "filledMap",
+    "gauge": "gauge", "treemap": "treemap", "funnel": "funnel", "funnel chart": "funnel",
+    "waterfall chart": "waterfallChart", "kpi": "kpi", "textbox": "textbox", "text box": "textbox",
+}
+VISUAL_TYPE_IDS = {type_id.lower(): type_id for type_id in VISUAL_TYPE_NAMES.values()}
+
+# Visual types that bind the same projection roles (Category/Series/Y), so a
+# type change is just a new visualType. Moving between families needs the
+# projections remapped, which is left to the LLM.
+VISUAL_TYPE_FAMILIES = {
+    "cartesian": {"barChart", "clusteredBarChart", "hundredPercentStackedBarChart", "columnChart",
+                  "clusteredColumnChart", "hundredPercentStackedColumnChart", "lineChart", "areaChart",
+                  "stackedAreaChart"},
+    "radial": {"pieChart", "donutChart"},
+}
+
+SHOW_TRUE = {"expr": {"Literal": {"Value": "true"}}}
+SHOW_FALSE = {"expr": {"Literal": {"Value": "false"}}}
+
+# --- Grammar ---
+
+_POLITE = r"(?:(?:please|kindly|can you|could you|would you)\s+)*"
+_THE = r"(?:the\s+)?"
+_ENTITY = r"(?P<visual>\"[^\"]+\"|'[^']+'|.+?)"
+_VALUE = r"(?P<value>\"[^\"]*\"|'[^']*'|.+)"
+_TOGGLE = r"(?P<verb>hide|show|remove|display|turn\s+off|turn\s+on|enable|disable)"
+
+# (intent, pattern) in priority order; patterns must match the whole request
+RULES = [
+    ("change_title", rf"(?:change|set|update|make|rename)\s+{_THE}title\s+(?:of|on|for)\s+{_THE}{_ENTITY}\s+(?:to|as|into)\s+{_VALUE}"),
+    ("change_title", rf"(?:change|set|update|make)\s+{_THE}{_ENTITY}(?:'s)?\s+(?:visual\s+)?title\s+(?:to|as)\s+{_VALUE}"),
+    ("change_title", rf"(?:retitle|rename)\s+{_THE}{_ENTITY}\s+(?:to|as)\s+{_VALUE}"),
+    ("toggle_title", rf"{_TOGGLE}\s+(?P<all>all\s+(?:of\s+)?)?{_THE}title(?P<plural>s)?\s+(?:of|on|for|from)\s+{_THE}{_ENTITY}"),
+    ("toggle_title", rf"{_TOGGLE}\s+{_THE}{_ENTITY}(?:'s)?\s+titles?"),
+    ("change_visual_type", rf"(?:change|set)\s+{_THE}(?:visual\s+|chart\s+)?type\s+(?:of|for)\s+{_THE}{_ENTITY}\s+to\s+(?:an?\s+)?(?P<type>.+)"),
+    ("change_visual_type", rf"(?:change|convert|switch|turn|make)\s+{_THE}{_ENTITY}\s+(?:in)?to\s+(?:an?\s+)?(?P<type>.+)"),
+]
+COMPILED_RULES = [(intent, re.compile(_POLITE + pattern, re.IGNORECASE | re.DOTALL)) for intent, pattern in RULES]
+
+_PAGE_SPLIT = re.compile(r"\s+(?:on|in|from)\s+(?:the\s+)?", re.IGNORECASE)
+_COMPOUND = re.compile(r"\s(?:and|then|also)\s|;", re.IGNORECASE)
+
+def _unquote(text: str) -> tuple[str, bool]:
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "\"'":
+        return text[1:-1], True
+    return text, False
+
+def _visual_type_id(text: str, plural: bool = False) -> str | None:
+    """Maps "pie chart", "pie charts" or "pieChart" to a visualType id."""
+    key = re.sub(r"\s+(?:visuals?|charts?)$", lambda m: " chart" if "chart" in m.group(0) else "", text.strip().lower())
+    candidates = [key]
+    if plural:
+        candidates += [re.sub(r"ices$", "ix", key), re.sub(r"es$", "", key), re.sub(r"s$", "", key)]
+    for candidate in candidates:
+        type_id = VISUAL_TYPE_NAMES.get(candidate) or VISUAL_TYPE_IDS.get(candidate.replace(" ", ""))
+        if type_id:
+            return type_id
+    return None
+
+# --- Entity resolution ---
+
+def _find_visuals(layout: Layout, text: str, section: Section | None) -> list[VisualContainer]:
+    name, _ = _unquote(text)
+    matches = layout.find_visuals_by_name(name, section) or layout.find_visuals_by_title(name, section)
+    if not matches:
+        # "the Sales Chart visual" -> "Sales Chart"
+        trimmed = re.sub(r"\s+visual$", "", name, flags=re.IGNORECASE)
+        if trimmed != name:
+            matches = layout.find_visuals_by_name(trimmed, section) or layout.find_visuals_by_title(trimmed, section)
+    return matches
+
+def _split_page(layout: Layout, text: str) -> list[tuple[str, Section | None]]:
+    """Lists `(entity, section)` readings of "X on page Y", most specific first.
+
+    Every " on "/" in " could separate the entity from a page name, so each
+    split whose right side names an existing page is a candidate; the
+    unsplit text is always the last reading.
+    """
+    readings = []
+    for separator in reversed(list(_PAGE_SPLIT.finditer(text))):
+        page_text = text[separator.end():]
+        # "Page 2" may itself be a page name, so try it before "page X" / "X page"
+        for candidate in (page_text, re.sub(r"^page\s+|\s+page$", "", page_text, flags=re.IGNORECASE)):
+            section = layout.get_section(_unquote(candidate)[0])
+            if section is not None:
+                break
+        if section is not None:
+            readings.append((text[:separator.start()], section))
+    readings.append((text, None))
+    return readings
+
+def _resolve_entity(layout: Layout, text: str) -> tuple[list[VisualContainer], Section | None]:
+    """Resolves a visual phrase (optionally naming its page) against the layout indexes."""
+    for entity, section in _split_page(layout, text):
+        matches = _find_visuals(layout, entity, section)
+        if matches:
+            return matches, section
+    return [], None
+
+def _resolve_bulk(layout: Layout, text: str) -> tuple[str | None, Section | None, bool] | None:
+    """Resolves "all pie charts [on page X]" to `(visual_type, section, understood)`, or None if not a bulk phrase."""
+    match = re.match(r"(?:all|every|each)\s+(?:of\s+)?(?:the\s+)?(?P<rest>.+)", text.strip(), re.IGNORECASE)
+    if not match:
+        return None
+    for entity, section in _split_page(layout, match.group("rest")):
+        if re.fullmatch(r"visuals?|charts?", entity.strip(), re.IGNORECASE):
+            return None, section, True
+        visual_type = _visual_type_id(entity, plural=True)
+        if visual_type:
+            return visual_type, section, True
+    return None, None, False
+
+# --- Instruction builders ---
+
+def _target(visual: VisualContainer) -> dict:
+    # Resolve by internal name and page so the plan cannot drift onto another visual
+    return {"section_name": visual.section.name, "visual_name": visual.name}
+
+def _toggle_title_operation(visual: VisualContainer, show: bool) -> dict:
+    title = visual.config.get("singleVisual", {}).get("vcObjects", {}).get("title")
+    if title:
+        path, value = "config.singleVisual.vcObjects.title[0].properties.show", SHOW_TRUE if show else SHOW_FALSE
+    else:
+        path, value = "config.singleVisual.vcObjects.title", [{"properties": {"show": SHOW_TRUE if show else SHOW_FALSE}}]
+    return {"action": "modify_visual_property", "target": _target(visual),
+            "parameters": {"property_path": path, "new_value": value}}
+
+def _build(intent: str, groups: dict, visuals: list[VisualContainer]) -> dict | None:
+    if intent == "change_title":
+        new_title, _ = _unquote(groups["value"])
+        return {"action": "change_title", "target": _target(visuals[0]), "parameters": {"new_title": new_title}}
+    if intent == "toggle_title":
+        show = groups["verb"].lower().split()[-1] in ("show", "display", "on", "enable")
+        operations = [_toggle_title_operation(visual, show) for visual in visuals]
+        return operations[0] if len(operations) == 1 else {"operations": operations}
+    if intent == "change_visual_type":
+        return {"action": "modify_visual_property", "target": _target(visuals[0]),
+                "parameters": {"property_path": "config.singleVisual.visualType", "new_value": groups["type_id"]}}
+    return None
+
+# --- Matching ---
+
+def _visual_type_family(type_id: str | None) -> str | None:
+    return next((family for family, type_ids in VISUAL_TYPE_FAMILIES.items() if type_id in type_ids), None)
+
+def match_intent(user_request: str, layout: Layout) -> dict:
+    """Classifies a request with the local grammar and resolves its entities against the layout.
+
+    Each rule is a whole-request pattern; the visual (and optional page) it
+    names is looked up through the layout's name, title and type indexes.
+    Confidence starts at 0.55 for a grammar match and reaches 0.9+ only when
+    every entity resolves to exactly one element; ambiguous or unknown
+    entities and compound requests ("... and ...") score low so they are
+    left to the LLM, as are visual type changes across `VISUAL_TYPE_FAMILIES`.
+
+    Args:
+        user_request: The natural language request.
+        layout: The parsed layout the request refers to.
+
+    Returns:
+        `{"intent", "confidence", "instructions", "reason"}`. `intent` and
+        `instructions` are None when no rule matches the request.
+    """
+    text = re.sub(r"\s+", " ", user_request).strip().rstrip(".!")
+    for intent, pattern in COMPILED_RULES:
+        match = pattern.fullmatch(text)
+        if not match:
+            continue
+        groups = match.groupdict()
+        entity_text = groups["visual"]
+        confidence = 0.55
+        quoted = _unquote(entity_text)[1]
+
+        if intent == "change_visual_type":
+            groups["type_id"] = _visual_type_id(groups["type"])
+            if not groups["type_id"]:
+                continue # "change X to Y" with an unknown Y is more likely a title change; try the next rule
+
+        bulk = _resolve_bulk(layout, entity_text) if intent == "toggle_title" else None
+        if bulk is None and (groups.get("all") or groups.get("plural")):
+            # "hide all titles on Page 2": the entity is a page, not a visual
+            page_bulk = _resolve_bulk(layout, f"all visuals on {entity_text}")
+            if page_bulk is not None and page_bulk[1] is not None:
+                bulk = page_bulk
+        if bulk is not None:
+            visual_type, section, understood = bulk
+            if not understood:
+                return {"intent": intent, "confidence": 0.2, "instructions": None,
+                        "reason": f"Could not resolve {entity_text!r} to a visual type"}
+            visuals = layout.find_visuals_by_type(visual_type, section) if visual_type else \
+                list(section.visuals if section else layout.iter_visuals())
+            if not visuals:
+                return {"intent": intent, "confidence": 0.3, "instructions": None,
+                        "reason": f"No visuals match {entity_text!r}"}
+            confidence += 0.35
+        else:
+            visuals, section = _resolve_entity(layout, entity_text)
+            if not visuals:
+                return {"intent": intent, "confidence": 0.2, "instructions": None,
+                        "reason": f"No visual named or titled {entity_text!r}"}
+            if len(visuals) > 1:
+                return {"intent": intent, "confidence": 0.5, "instructions": None,
+                        "reason": f"{entity_text!r} matches {len(visuals)} visuals"}
+            confidence += 0.35 + (0.05 if quoted else 0.0)
+
+        if any(visual.name is None for visual in visuals):
+            return {"intent": intent, "confidence": 0.3, "instructions": None,
+                    "reason": "Matched visual has no name to target"}
+
+        if intent == "change_visual_type":
+            current = visuals[0].visual_type
+            if current != groups["type_id"] and (_visual_type_family(current) is None or
+                                                 _visual_type_family(current) != _visual_type_family(groups["type_id"])):
+                return {"intent": intent, "confidence": 0.6, "instructions": None,
+                        "reason": f"Changing {current} to {groups['type_id']} needs projection remapping"}
+
+        # The entity resolved, so an "and" inside it is part of a name; an
+        # unquoted "and"/"then" in the new value more likely starts a second edit
+        tail = groups.get("value") or ""
+        if not _unquote(tail)[1] and _COMPOUND.search(tail):
+            confidence -= 0.4
+            reason = "Request looks like it combines several edits"
+        else:
+            reason = f"Matched {intent} rule"
+        return {"intent": intent, "confidence": round(min(confidence, 1.0), 2),
+                "instructions": _build(intent, groups, visuals), "reason": reason}
+
+    return {"intent": None, "confidence": 0.0, "instructions": None, "reason": "No rule matched"}
+
+def min_confidence_from_env() -> float | None:
+    """Returns the fast-path confidence threshold, or None if `INTENT_RULES=0` disables the fast path."""
+    if os.getenv("INTENT_RULES", "1").lower() in ("0", "false", "off", "no"):
+        return None
+    return float(os.getenv("INTENT_MIN_CONFIDENCE", str(DEFAULT_MIN_CONFIDENCE)))
+
+def route_requests(user_requests: list[str], layout: Layout, min_confidence: float | None = DEFAULT_MIN_CONFIDENCE) -> list[dict]:
+    """Decides per request whether the local rules or the LLM produce its instructions.
+
+    Returns:
+        One match per request (see `match_intent`) with an added `"route"`:
+        "rules" when its instructions can be used directly, otherwise "llm".
+    """
+    routed = []
+    for user_request in user_requests:
+        if min_confidence is None:
+            match = {"intent": None, "confidence": 0.0, "instructions": None, "reason": "Rules disabled"}
+        else:
+            match = match_intent(user_request, layout)
+        confident = match["instructions"] is not None and match["confidence"] >= min_confidence
+        match["route"] = "rules" if confident else "llm"
+        if not confident:
+            match["instructions"] = None
+        logging.info(f"Routing {user_request!r} to {match['route']} ({match['reason']}, confidence {match['confidence']:.2f})")
+        routed.append(match)
+    return routed
+
+if __name__ == "__main__":
+    import argparse
+
+    from src.pbix_package import PbixPackage
+
+    parser = argparse.ArgumentParser(description="Show how requests would be routed by the local intent rules.")
+    parser.add_argument("--input", required=True, help="Path to the PBIX file the requests refer to.")
+    parser.add_argument("requests", nargs="+", help="Natural language edit requests.")
+
+    args = parser.parse_args()
+
+    with PbixPackage(args.input) as package:
+        routes = route_requests(args.requests, package.read_layout_document())
+    for user_request, route in zip(args.requests, routes):
+        print(json.dumps({"request": user_request, **route}, indent=2, ensure_ascii=False))
@@ -0,0 +1,192 @@
+
+import json
+import codecs
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+_WHITESPACE = " \t\n\r"
+
+def sniff_encoding(prefix: bytes) -> str:
+    """Detects the text encoding of a JSON document from its first bytes.
+
+    A byte order mark wins; otherwise the position of NUL bytes in the first
+    character tells UTF-16 LE/BE apart from UTF-8 (JSON text always starts
+    with an ASCII character). The returned codec name consumes any BOM.
+    """
+    if prefix.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if prefix.startswith(codecs.BOM_UTF16_LE) or prefix.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16" # Reads the BOM to pick the byte order
+    if len(prefix) >= 2:
+        if prefix[0] != 0 and prefix[1] == 0:
+            return "utf-16-le"
+        if prefix[0] == 0 and prefix[1] != 0:
+            return "utf-16-be"
+    return "utf-8"
+
+def decode_json_bytes(raw: bytes):
+    """Decodes a JSON document in a single pass using the sniffed encoding."""
+    return json.loads(raw.decode(sniff_encoding(raw[:4])))
+
+class JsonStreamReader:
+    """Pull-style reader over a JSON document in a binary stream.
+
+    The stream is decoded incrementally and only the value currently being
+    read is held in memory, so callers can walk into a large document (for
+    example the `sections` of a Report/Layout) and materialize one element
+    at a time.
+
+    Example:
+        reader = JsonStreamReader(fileobj)
+        for key in reader.iter_object():
+            if key == "sections":
+                for _ in reader.iter_array():
+                    section = reader.read_value()
+            else:
+                reader.skip_value()
+    """
+
+    def __init__(self, fileobj, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self._fileobj = fileobj
+        self._chunk_size = chunk_size
+        first = fileobj.read(chunk_size)
+        self.encoding = sniff_encoding(first[:4])
+        self._decoder = codecs.getincrementaldecoder(self.encoding)()
+        self._buffer = self._decoder.decode(first, final=not first)
+        self._pos = 0
+        self._base = 0
+        self._eof = not first
+        self._json = json.JSONDecoder()
+
+    @classmethod
+    def from_text(cls, text: str) -> "JsonStreamReader":
+        """Creates a reader over already decoded text; offsets index into `text`."""
+        reader = cls.__new__(cls)
+        reader._fileobj = None
+        reader._chunk_size = len(text)
+        reader.encoding = None
+        reader._decoder = None
+        reader._buffer = text
+        reader._pos = 0
+        reader._base = 0
+        reader._eof = True
+        reader._json = json.JSONDecoder()
+        return reader
+
+    @property
+    def offset(self) -> int:
+        """Character offset in the decoded document just past the last consumed token."""
+        return self._base + self._pos
+
+    def value_start(self) -> int:
+        """Skips whitespace and returns the offset where the next value begins."""
+        self._peek()
+        return self.offset
+
+    # --- Buffer management ---
+
+    def _fill(self, min_chars: int = 1) -> bool:
+        """Reads more input until at least `min_chars` new characters are buffered."""
+        if self._pos > len(self._buffer) // 2:
+            self._buffer = self._buffer[self._pos:]
+            self._base += self._pos
+            self._pos = 0
+        added = 0
+        while added < min_chars and not self._eof:
+            chunk = self._fileobj.read(self._chunk_size)
+            self._eof = not chunk
+            text = self._decoder.decode(chunk, final=self._eof)
+            self._buffer += text
+            added += len(text)
+        return added > 0
+
+    def _peek(self) -> str:
+        """Returns the next non-whitespace character without consuming it ('' at EOF)."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise json.JSONDecodeError(f"Expecting {char!r}, found {found!r}", self._buffer, self._pos)
+        self._pos += 1
+
+    # --- Values ---
+
+    def read_value(self):
+        """Decodes and returns the next complete JSON value."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                # Value spans past the buffer; grow it geometrically to stay linear
+                self._fill(max(self._chunk_size, len(self._buffer) - self._pos))
+                continue
+            if end == len(self._buffer) and not self._eof:
+                # A number at the very end of the buffer may continue in the next chunk
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def skip_value(self):
+        """Consumes the next JSON value without keeping it.
+
+        Objects and arrays are walked element by element, so skipping a large
+        container needs no more memory than its largest scalar.
+        """
+        char = self._peek()
+        if char == "{":
+            for _ in self.iter_object():
+                self.skip_value()
+        elif char == "[":
+            for _ in self.iter_array():
+                self.skip_value()
+        else:
+            self.read_value()
+
+    def iter_object(self):
+        """Yields the keys of the next JSON object.
+
+        After each key the caller must consume exactly one value (with
+        `read_value`, `skip_value`, `iter_object` or `iter_array`) before
+        advancing the iterator.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self._expect(":")
+            yield key
+            separator = self._peek()
+            self._pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise json.JSONDecodeError("Expecting ',' or '}'", self._buffer, self._pos - 1)
+
+    def iter_array(self):
+        """Yields once per element of the next JSON array; the caller consumes each element."""
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            separator = self._peek()
+            self._pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise json.JSONDecodeError("Expecting ',' or ']'", self._buffer, self._pos - 1)
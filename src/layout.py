@@ -0,0 +1,586 @@
+
+import copy
+import json
+import logging
+from contextlib import contextmanager
+
+from src.json_stream import JsonStreamReader, sniff_encoding
+from src.parser import serialize_layout
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Fields that Power BI stores as JSON documents encoded into strings
+ENCODED_REPORT_FIELDS = ("config", "filters")
+ENCODED_SECTION_FIELDS = ("config", "filters")
+ENCODED_VISUAL_FIELDS = ("config", "filters", "query", "dataTransforms")
+
+def encode_nested_json(value) -> str:
+    """Encodes a decoded config/filters/query value the way Power BI stores it."""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+def _literal_text(expr_container) -> str | None:
+    """Extracts the string from a `{"expr": {"Literal": {"Value": "'...'"}}}` property."""
+    try:
+        value = expr_container["expr"]["Literal"]["Value"]
+    except (KeyError, TypeError):
+        return None
+    if isinstance(value, str) and len(value) >= 2 and value[0] == value[-1] == "'":
+        return value[1:-1].replace("''", "'")
+    return value if isinstance(value, str) else None
+
+def _field_ref(expression: dict, aliases: dict) -> str | None:
+    """Resolves one prototypeQuery select expression to `Table.Field`."""
+    for kind in ("Column", "Measure", "HierarchyLevel"):
+        node = expression.get(kind)
+        if node is None:
+            continue
+        if kind == "HierarchyLevel":
+            hierarchy = node.get("Expression", {}).get("Hierarchy", {})
+            source = hierarchy.get("Expression", {}).get("SourceRef", {})
+            prop = node.get("Level")
+        else:
+            source = node.get("Expression", {}).get("SourceRef", {})
+            prop = node.get("Property")
+        table = aliases.get(source.get("Source"), source.get("Entity"))
+        return f"{table}.{prop}" if table and prop else None
+    inner = expression.get("Aggregation", {}).get("Expression")
+    return _field_ref(inner, aliases) if isinstance(inner, dict) else None
+
+def query_fields(query: dict) -> list[tuple[str, str]]:
+    """Lists `(Table.Field, kind)` for a prototypeQuery's selects, kind being "measure" or "column"."""
+    aliases = {source.get("Name"): source.get("Entity") for source in query.get("From", [])}
+    fields = []
+    for expression in query.get("Select", []):
+        ref = _field_ref(expression, aliases)
+        if ref:
+            fields.append((ref, "measure" if "Measure" in expression else "column"))
+    return fields
+
+def query_field_refs(query: dict) -> list[str]:
+    """Lists the `Table.Field` references of a prototypeQuery, in select order."""
+    refs = []
+    for ref, _ in query_fields(query):
+        if ref not in refs:
+            refs.append(ref)
+    return refs
+
+def config_title(config: dict) -> str | None:
+    """Returns the literal title text of a decoded visual config, if any."""
+    vc_objects = config.get("singleVisual", {}).get("vcObjects", {})
+    for entry in vc_objects.get("title", []):
+        text = _literal_text(entry.get("properties", {}).get("text"))
+        if text is not None:
+            return text
+    return None
+
+class LayoutNode:
+    """Wraps one raw layout dictionary whose string-encoded fields decode on demand.
+
+    The raw dictionary stays the source of truth for plain fields (x, y,
+    width, ...). Encoded fields are decoded on first access and cached; after
+    changing a decoded value call `touch()` so `flush()` re-encodes it.
+    """
+
+    encoded_fields: tuple[str, ...] = ()
+
+    def __init__(self, raw: dict, layout: "Layout | None" = None):
+        self.raw = raw
+        self.layout = layout
+        self._decoded: dict = {}
+        self._dirty = False
+        self.span: tuple[int, int] | None = None # Character range in the source text, if known
+
+    def decoded(self, field: str):
+        """Returns the decoded value of an encoded field, decoding it only once."""
+        if field not in self._decoded:
+            value = self.raw.get(field)
+            if isinstance(value, str):
+                value = json.loads(value) if value else None
+            self._decoded[field] = value
+        return self._decoded[field]
+
+    @property
+    def config(self) -> dict:
+        return self.decoded("config") or {}
+
+    @property
+    def filters(self) -> list:
+        return self.decoded("filters") or []
+
+    def set_decoded(self, field: str, value):
+        """Replaces the decoded value of an encoded field; call `touch()` afterwards."""
+        self._decoded[field] = value
+
+    def remove_field(self, field: str):
+        """Deletes a field (encoded or plain) from the node; call `touch()` afterwards."""
+        self.raw.pop(field, None)
+        self._decoded.pop(field, None)
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def touch(self):
+        """Marks this node as modified so its decoded fields are re-encoded on flush."""
+        if not self._dirty:
+            self._dirty = True
+            if self.layout is not None:
+                self.layout._touched.append(self)
+                self.layout._modified.append(self)
+
+    def _copy_raw(self) -> dict:
+        return copy.deepcopy(self.raw)
+
+    def _snapshot(self) -> tuple:
+        """Captures the node's state for `Layout.transaction` rollback."""
+        return self._copy_raw(), copy.deepcopy(self._decoded), self._dirty
+
+    def _restore(self, snapshot: tuple):
+        raw, decoded, dirty = snapshot
+        # Restore in place: parent containers hold a reference to this dictionary
+        self.raw.clear()
+        self.raw.update(raw)
+        self._decoded = decoded
+        self._dirty = dirty
+
+    def flush(self):
+        """Writes re-encoded values back into the raw dictionary if the node was touched."""
+        if not self._dirty:
+            return
+        for field, value in self._decoded.items():
+            if field in self.encoded_fields and isinstance(self.raw.get(field, ""), str):
+                self.raw[field] = encode_nested_json(value)
+        self._dirty = False
+
+class VisualContainer(LayoutNode):
+    """A single entry of a section's `visualContainers` list."""
+
+    encoded_fields = ENCODED_VISUAL_FIELDS
+
+    def __init__(self, raw: dict, section: "Section"):
+        super().__init__(raw, section.layout)
+        self.section = section
+
+    @property
+    def query(self) -> dict:
+        return self.decoded("query") or {}
+
+    @property
+    def name(self) -> str | None:
+        return self.config.get("name")
+
+    @property
+    def visual_type(self) -> str | None:
+        return self.config.get("singleVisual", {}).get("visualType")
+
+    @property
+    def title(self) -> str | None:
+        """The literal title text from the visual's formatting objects, if any."""
+        return config_title(self.config)
+
+    @property
+    def bound_fields(self) -> list[str]:
+        """`Table.Field` references selected by the visual's prototype query."""
+        query = self.config.get("singleVisual", {}).get("prototypeQuery") or {}
+        return query_field_refs(query)
+
+    def __repr__(self):
+        return f"VisualContainer(name={self.name!r}, type={self.visual_type!r}, section={self.section.name!r})"
+
+class Section(LayoutNode):
+    """A report page, i.e. one entry of the layout's `sections` list."""
+
+    encoded_fields = ENCODED_SECTION_FIELDS
+
+    def __init__(self, raw: dict, layout: "Layout"):
+        super().__init__(raw, layout)
+        self.visuals = [VisualContainer(container, self) for container in raw.get("visualContainers", [])]
+
+    @property
+    def name(self) -> str | None:
+        return self.raw.get("name")
+
+    @property
+    def display_name(self) -> str | None:
+        return self.raw.get("displayName")
+
+    def _copy_raw(self) -> dict:
+        # Visual containers are checkpointed individually; only the list itself is copied
+        raw = dict(self.raw)
+        if "visualContainers" in raw:
+            raw["visualContainers"] = list(raw["visualContainers"])
+        return raw
+
+    def _snapshot(self) -> tuple:
+        return super()._snapshot(), list(self.visuals)
+
+    def _restore(self, snapshot: tuple):
+        node_snapshot, visuals = snapshot
+        super()._restore(node_snapshot)
+        self.visuals = visuals
+
+    def add_visual(self, container: dict, index: int | None = None) -> VisualContainer:
+        """Adds a raw visual container to this page (at the end unless `index` is given) and indexes it."""
+        containers = self.raw.setdefault("visualContainers", [])
+        index = len(containers) if index is None else min(index, len(containers))
+        containers.insert(index, container)
+        visual = VisualContainer(container, self)
+        self.visuals.insert(index, visual)
+        self.layout._index_visual(visual)
+        self.layout.structure_changed = True
+        return visual
+
+    def remove_visual(self, visual: VisualContainer):
+        """Removes a visual container from this page."""
+        containers = self.raw["visualContainers"]
+        del containers[next(index for index, container in enumerate(containers) if container is visual.raw)]
+        self.visuals.remove(visual)
+        self.layout.invalidate_visual_index()
+        self.layout.structure_changed = True
+
+    def __repr__(self):
+        return f"Section(name={self.name!r}, displayName={self.display_name!r}, visuals={len(self.visuals)})"
+
+class Layout(LayoutNode):
+    """Indexed object model over a parsed Report/Layout document.
+
+    Sections are indexed by `name` and `displayName` up front (no decoding
+    needed). Visual indexes by name, title and type need each visual's
+    `config`, so they are built on the first visual lookup; every config is
+    decoded at most once and the result is cached on its container.
+
+    Example:
+        layout = Layout.from_bytes(package.read_member("Report/Layout"))
+        section, visual = layout.resolve({"section_name": "Page 1", "visual_name": "Sales Chart"})
+        visual.config["singleVisual"]["visualType"] = "lineChart"
+        visual.touch()
+        package.write_member("Report/Layout", layout.to_bytes())
+    """
+
+    encoded_fields = ENCODED_REPORT_FIELDS
+
+    @classmethod
+    def from_bytes(cls, raw_layout: bytes) -> "Layout":
+        """Parses Report/Layout bytes, remembering where each section and visual sits.
+
+        The recorded spans let `to_bytes` return the original bytes when
+        nothing changed, and splice in re-encoded text for only the sections
+        and visuals that were touched.
+
+        Raises:
+            json.JSONDecodeError, UnicodeDecodeError: If the bytes are not a
+                valid layout document.
+        """
+        encoding = sniff_encoding(raw_layout[:4])
+        text = raw_layout.decode(encoding)
+        reader = JsonStreamReader.from_text(text)
+
+        raw, section_spans = {}, []
+        for key in reader.iter_object():
+            if key != "sections":
+                raw[key] = reader.read_value()
+                continue
+            raw["sections"] = []
+            for _ in reader.iter_array():
+                section_start = reader.value_start()
+                section, visual_spans = {}, []
+                for section_key in reader.iter_object():
+                    if section_key != "visualContainers":
+                        section[section_key] = reader.read_value()
+                        continue
+                    section["visualContainers"] = []
+                    for _ in reader.iter_array():
+                        visual_start = reader.value_start()
+                        section["visualContainers"].append(reader.read_value())
+                        visual_spans.append((visual_start, reader.offset))
+                raw["sections"].append(section)
+                section_spans.append(((section_start, reader.offset), visual_spans))
+
+        layout = cls(raw)
+        layout.source_bytes = raw_layout
+        layout.source_text = text
+        layout.encoding = encoding
+        for section, (span, visual_spans) in zip(layout.sections, section_spans):
+            section.span = span
+            for visual, visual_span in zip(section.visuals, visual_spans):
+                visual.span = visual_span
+        return layout
+
+    def __init__(self, raw: dict):
+        super().__init__(raw)
+        self.layout = self
+        self._touched: list[LayoutNode] = []
+        self._modified: list[LayoutNode] = []
+        self.source_bytes: bytes | None = None
+        self.source_text: str | None = None
+        self.encoding = "utf-16-le"
+        self.from_cache = False # Set when loaded from a ParseCache instead of parsed
+        self.sections = [Section(section, self) for section in raw.get("sections", [])]
+        self.structure_changed = False
+        self._sections_by_key: dict[str, Section] = {}
+        for section in self.sections:
+            self._index_section(section)
+        self._visuals_by_name: dict[str, list[VisualContainer]] = {}
+        self._visuals_by_title: dict[str, list[VisualContainer]] = {}
+        self._visuals_by_type: dict[str, list[VisualContainer]] = {}
+        self._visual_index_built = False
+        self._checkpoints: dict[int, tuple[LayoutNode, tuple]] | None = None
+
+    # --- Indexing ---
+
+    def _index_section(self, section: Section):
+        for key in (section.name, section.display_name):
+            if key:
+                self._sections_by_key.setdefault(key, section)
+                self._sections_by_key.setdefault(key.lower(), section)
+
+    def reindex_sections(self):
+        """Rebuilds the section lookup after pages were renamed, added or removed."""
+        self._sections_by_key.clear()
+        for section in self.sections:
+            self._index_section(section)
+
+    def _index_visual(self, visual: VisualContainer):
+        if not self._visual_index_built:
+            return # Picked up when the index is first built
+        for index, key in ((self._visuals_by_name, visual.name),
+                           (self._visuals_by_title, visual.title),
+                           (self._visuals_by_type, visual.visual_type)):
+            if key:
+                index.setdefault(key, []).append(visual)
+                if key.lower() != key:
+                    index.setdefault(key.lower(), []).append(visual)
+
+    def invalidate_visual_index(self):
+        """Drops the visual indexes after a name, title or type change; they rebuild on the next lookup."""
+        self._visual_index_built = False
+        for index in (self._visuals_by_name, self._visuals_by_title, self._visuals_by_type):
+            index.clear()
+
+    def _ensure_visual_index(self):
+        if self._visual_index_built:
+            return
+        self._visual_index_built = True
+        for visual in self.iter_visuals():
+            try:
+                self._index_visual(visual)
+            except json.JSONDecodeError as e:
+                logging.warning(f"Skipping visual with undecodable config on section {visual.section.name}: {e}")
+
+    def add_section(self, raw_section: dict, index: int | None = None) -> Section:
+        """Adds a raw section (page) to the report (at the end unless `index` is given) and indexes it."""
+        sections = self.raw.setdefault("sections", [])
+        index = len(sections) if index is None else min(index, len(sections))
+        sections.insert(index, raw_section)
+        section = Section(raw_section, self)
+        self.sections.insert(index, section)
+        self._index_section(section)
+        self.invalidate_visual_index()
+        self.structure_changed = True
+        return section
+
+    def remove_section(self, section: Section):
+        """Removes a section (page) and its visuals from the report."""
+        sections = self.raw["sections"]
+        del sections[next(index for index, raw in enumerate(sections) if raw is section.raw)]
+        self.sections.remove(section)
+        self.reindex_sections()
+        self.invalidate_visual_index()
+        self.structure_changed = True
+
+    # --- Lookups ---
+
+    def iter_visuals(self):
+        """Iterates over every visual container in page order."""
+        for section in self.sections:
+            yield from section.visuals
+
+    def get_section(self, key: str) -> Section | None:
+        """Finds a section by `name` or `displayName` (case-insensitive fallback)."""
+        if not key:
+            return None
+        return self._sections_by_key.get(key) or self._sections_by_key.get(key.lower())
+
+    def _lookup(self, index: dict, key: str, section: Section | None) -> list[VisualContainer]:
+        self._ensure_visual_index()
+        matches = index.get(key) or index.get(key.lower(), [])
+        if section is not None:
+            matches = [visual for visual in matches if visual.section is section]
+        return matches
+
+    def find_visuals_by_name(self, name: str, section: Section | None = None) -> list[VisualContainer]:
+        return self._lookup(self._visuals_by_name, name, section)
+
+    def find_visuals_by_title(self, title: str, section: Section | None = None) -> list[VisualContainer]:
+        return self._lookup(self._visuals_by_title, title, section)
+
+    def find_visuals_by_type(self, visual_type: str, section: Section | None = None) -> list[VisualContainer]:
+        return self._lookup(self._visuals_by_type, visual_type, section)
+
+    def resolve(self, target: dict) -> tuple[Section | None, VisualContainer | None]:
+        """Resolves an AI instruction target to a section and (optionally) a visual.
+
+        Recognised keys are `section_name` (or `page_name`), which matches a
+        section's name or displayName, and `visual_name`, which matches a
+        visual's name first and its title second. `visual_title` and
+        `visual_type` narrow the search explicitly.
+
+        Returns:
+            A `(section, visual)` tuple; either element is None when the target
+            does not name one or nothing matches.
+        """
+        target = target or {}
+        section_key = target.get("section_name") or target.get("page_name")
+        section = self.get_section(section_key) if section_key else None
+        if section_key and section is None:
+            logging.warning(f"Target section not found in layout: {section_key}")
+            return None, None
+
+        candidates = None
+        if target.get("visual_name"):
+            key = target["visual_name"]
+            candidates = self.find_visuals_by_name(key, section) or self.find_visuals_by_title(key, section)
+        elif target.get("visual_title"):
+            candidates = self.find_visuals_by_title(target["visual_title"], section)
+        elif target.get("visual_type"):
+            candidates = self.find_visuals_by_type(target["visual_type"], section)
+
+        if candidates is None:
+            return section, None
+        if not candidates:
+            logging.warning(f"Target visual not found in layout: {target}")
+            return section, None
+        if len(candidates) > 1:
+            logging.warning(f"Target {target} matched {len(candidates)} visuals; using the first.")
+        visual = candidates[0]
+        return visual.section, visual
+
+    # --- Transactions ---
+
+    def _copy_raw(self) -> dict:
+        # Sections are checkpointed individually; only the list itself is copied
+        raw = {key: value for key, value in self.raw.items() if key != "sections"}
+        raw = copy.deepcopy(raw)
+        if "sections" in self.raw:
+            raw["sections"] = list(self.raw["sections"])
+        return raw
+
+    def _snapshot(self) -> tuple:
+        return super()._snapshot(), list(self.sections)
+
+    def _restore(self, snapshot: tuple):
+        node_snapshot, sections = snapshot
+        super()._restore(node_snapshot)
+        self.sections = sections
+        self.reindex_sections()
+
+    @contextmanager
+    def transaction(self):
+        """Groups edits so that either all of them apply or none do.
+
+        Inside the block, call `checkpoint(node)` on every section or visual
+        before changing it; the report root is checkpointed on entry. If the
+        block raises, checkpointed nodes are restored, touches made inside the
+        block are dropped and the exception propagates. Only the nodes an
+        edit targets are copied, so a transaction over a large report stays
+        cheap.
+
+        Example:
+            with layout.transaction():
+                for visual in visuals:
+                    layout.checkpoint(visual)
+                    visual.config["singleVisual"]["visualType"] = "lineChart"
+                    visual.touch()
+        """
+        if self._checkpoints is not None:
+            raise RuntimeError("Layout transactions cannot be nested")
+        self._checkpoints = {}
+        saved = (list(self._touched), list(self._modified), self.structure_changed)
+        self.checkpoint(self)
+        try:
+            yield self
+        except BaseException:
+            self._rollback(*saved)
+            raise
+        finally:
+            self._checkpoints = None
+
+    def checkpoint(self, node: LayoutNode):
+        """Records a node's current state so the open transaction can restore it."""
+        if self._checkpoints is not None and id(node) not in self._checkpoints:
+            self._checkpoints[id(node)] = (node, node._snapshot())
+
+    def _rollback(self, touched: list, modified: list, structure_changed: bool):
+        for node, snapshot in self._checkpoints.values():
+            node._restore(snapshot)
+        self._touched[:] = touched
+        self._modified[:] = modified
+        self.structure_changed = structure_changed
+        # Titles, names or visual lists may have changed; rebuild lazily from the restored state
+        self.invalidate_visual_index()
+        logging.info(f"Rolled back layout transaction ({len(self._checkpoints)} node(s) restored)")
+
+    # --- Serialization ---
+
+    def touched_nodes(self) -> list[LayoutNode]:
+        """Returns every node (report, sections, visuals) with pending changes."""
+        return list(self._touched)
+
+    def modified_nodes(self) -> list[LayoutNode]:
+        """Returns every node touched since the layout was read, including already flushed ones."""
+        return list(self._modified)
+
+    def to_dict(self) -> dict:
+        """Returns the raw layout dictionary with touched nodes re-encoded.
+
+        Only sections and visuals that were `touch()`-ed are re-encoded; every
+        other encoded string is left exactly as it was read.
+        """
+        for node in self._touched:
+            node.flush()
+        self._touched.clear()
+        return self.raw
+
+    @property
+    def modified(self) -> bool:
+        """True if anything was touched or restructured since the layout was read."""
+        return bool(self._modified) or self.structure_changed
+
+    def to_bytes(self) -> bytes:
+        """Serializes the layout, doing as little encoding work as possible.
+
+        - Nothing touched: the original bytes are returned unchanged.
+        - Only sections/visuals touched: their text is re-encoded compactly
+          and spliced into the original text; everything else is kept
+          byte-for-byte.
+        - Report-level changes, added visuals, or no source text: the whole
+          document is serialized compactly, as Power BI writes it.
+        """
+        self.to_dict()
+        if self.source_text is None or self.structure_changed or self._dirty_root():
+            return serialize_layout(self.raw, encoding=self.encoding)
+        if not self._modified:
+            return self.source_bytes
+
+        # Touching a section re-encodes it whole, which covers its visuals
+        modified_sections = {id(node) for node in self._modified if isinstance(node, Section)}
+        replacements, seen = [], set()
+        for node in self._modified:
+            if id(node) in seen or (isinstance(node, VisualContainer) and id(node.section) in modified_sections):
+                continue
+            seen.add(id(node))
+            if node.span is None:
+                return serialize_layout(self.raw, encoding=self.encoding)
+            replacements.append((node.span, encode_nested_json(node.raw)))
+        replacements.sort(key=lambda item: item[0][0])
+
+        pieces, cursor = [], 0
+        for (start, end), text in replacements:
+            pieces.append(self.source_text[cursor:start])
+            pieces.append(text)
+            cursor = end
+        pieces.append(self.source_text[cursor:])
+        return "".join(pieces).encode(self.encoding)
+
+    def _dirty_root(self) -> bool:
+        return any(node is self for node in self._modified)
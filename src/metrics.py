@@ -0,0 +1,178 @@
+
+import sys
+import json
+import time
+import logging
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource # Not available on Windows
+except ImportError:
+    resource = None
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+def peak_rss_bytes() -> int | None:
+    """Returns the peak resident set size of this process, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class PipelineMetrics:
+    """Per-run instrumentation for the transform pipeline.
+
+    Records wall time and bytes read/written per stage, peak RSS growth,
+    optional tracemalloc allocation peaks, LLM latency and token counts, and
+    cache hit/miss counters. Export with `to_dict`, `to_json` or
+    `to_prometheus`.
+
+    Example:
+        metrics = PipelineMetrics(track_memory=True)
+        with metrics.stage("parse"):
+            layout = package.read_layout_document()
+        metrics.add_bytes("parse", read=len(raw))
+        print(metrics.to_json())
+
+    Args:
+        track_memory: Trace Python allocations per stage with tracemalloc.
+            Precise but slows the pipeline down noticeably, so it is off by
+            default; peak RSS is always recorded where the platform allows.
+    """
+
+    def __init__(self, track_memory: bool = False):
+        self.track_memory = track_memory
+        self.stages: dict[str, dict] = {}
+        self.llm = {"calls": 0, "cached": 0, "failures": 0, "latency_seconds": 0.0,
+                    "max_latency_seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0}
+        self.caches: dict[str, dict] = {}
+        self.routes: dict[str, int] = {}
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+        self._rss_start = peak_rss_bytes()
+
+    def _stage_entry(self, name: str) -> dict:
+        return self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "bytes_read": 0, "bytes_written": 0,
+                                             "alloc_peak_bytes": 0, "alloc_delta_bytes": 0, "rss_growth_bytes": 0})
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times a pipeline stage; repeated stages accumulate."""
+        entry = self._stage_entry(name)
+        started_tracing = False
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            alloc_before = tracemalloc.get_traced_memory()[0]
+        rss_before = peak_rss_bytes()
+        started = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry["seconds"] += time.perf_counter() - started
+            entry["calls"] += 1
+            rss_after = peak_rss_bytes()
+            if rss_before is not None and rss_after is not None:
+                entry["rss_growth_bytes"] += rss_after - rss_before
+            if self.track_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                entry["alloc_peak_bytes"] = max(entry["alloc_peak_bytes"], peak - alloc_before)
+                entry["alloc_delta_bytes"] += current - alloc_before
+                if started_tracing:
+                    tracemalloc.stop()
+
+    def add_bytes(self, stage: str, read: int = 0, written: int = 0):
+        entry = self._stage_entry(stage)
+        entry["bytes_read"] += read
+        entry["bytes_written"] += written
+
+    def record_llm_call(self, latency: float | None = None, prompt_tokens: int | None = None,
+                        completion_tokens: int | None = None, cached: bool = False, failed: bool = False):
+        """Records one instruction lookup, whether served by the LLM or the cache."""
+        if cached:
+            self.llm["cached"] += 1
+            return
+        if failed:
+            self.llm["failures"] += 1
+            return
+        self.llm["calls"] += 1
+        if latency is not None:
+            self.llm["latency_seconds"] += latency
+            self.llm["max_latency_seconds"] = max(self.llm["max_latency_seconds"], latency)
+        self.llm["prompt_tokens"] += prompt_tokens or 0
+        self.llm["completion_tokens"] += completion_tokens or 0
+
+    def record_route(self, route: str):
+        """Counts which path ("rules" or "llm") produced a request's instructions."""
+        self.routes[route] = self.routes.get(route, 0) + 1
+
+    def record_cache(self, name: str, hit: bool):
+        entry = self.caches.setdefault(name, {"hits": 0, "misses": 0})
+        entry["hits" if hit else "misses"] += 1
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def to_dict(self) -> dict:
+        total = (self.finished or time.perf_counter()) - self.started
+        rss_end = peak_rss_bytes()
+        caches = {}
+        for name, entry in self.caches.items():
+            lookups = entry["hits"] + entry["misses"]
+            caches[name] = dict(entry, hit_rate=entry["hits"] / lookups if lookups else 0.0)
+        return {
+            "total_seconds": total,
+            "peak_rss_bytes": rss_end,
+            "rss_growth_bytes": rss_end - self._rss_start if rss_end is not None and self._rss_start is not None else None,
+            "stages": self.stages,
+            "llm": self.llm,
+            "caches": caches,
+            "routes": self.routes,
+        }
+
+    def to_json(self, indent: int | None = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self, prefix: str = "pbix_transform", labels: dict | None = None) -> str:
+        """Renders the metrics in the Prometheus text exposition format."""
+        def label_text(extra: dict) -> str:
+            merged = {**(labels or {}), **extra}
+            if not merged:
+                return ""
+            return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in merged.items()) + "}"
+
+        data = self.to_dict()
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: list[tuple[dict, float]]):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for extra, value in samples:
+                if value is not None:
+                    lines.append(f"{prefix}_{name}{label_text(extra)} {value}")
+
+        metric("duration_seconds", "gauge", "Wall time of the whole run.", [({}, data["total_seconds"])])
+        metric("peak_rss_bytes", "gauge", "Peak resident set size of the process.", [({}, data["peak_rss_bytes"])])
+        stage_fields = [("stage_seconds", "seconds", "Wall time per pipeline stage."),
+                        ("stage_bytes_read", "bytes_read", "Bytes read per pipeline stage."),
+                        ("stage_bytes_written", "bytes_written", "Bytes written per pipeline stage."),
+                        ("stage_alloc_peak_bytes", "alloc_peak_bytes", "Peak traced allocations per stage.")]
+        for name, field, help_text in stage_fields:
+            metric(name, "gauge", help_text, [({"stage": stage}, entry[field]) for stage, entry in data["stages"].items()])
+        for field in ("calls", "cached", "failures", "prompt_tokens", "completion_tokens"):
+            metric(f"llm_{field}_total", "counter", f"LLM {field.replace('_', ' ')}.", [({}, data["llm"][field])])
+        metric("llm_latency_seconds_total", "counter", "Summed LLM call latency.", [({}, data["llm"]["latency_seconds"])])
+        metric("requests_total", "counter", "Requests per instruction route.",
+               [({"route": route}, count) for route, count in data["routes"].items()])
+        metric("cache_hits_total", "counter", "Cache hits per cache.",
+               [({"cache": name}, entry["hits"]) for name, entry in data["caches"].items()])
+        metric("cache_misses_total", "counter", "Cache misses per cache.",
+               [({"cache": name}, entry["misses"]) for name, entry in data["caches"].items()])
+        return "\n".join(lines) + "\n"
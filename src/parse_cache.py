@@ -0,0 +1,170 @@
+
+import os
+import pickle
+import hashlib
+import logging
+import tempfile
+import threading
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DEFAULT_PARSE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ai-pbix-transformer", "parsed")
+PARSE_CACHE_VERSION = "1" # Bump when the pickled Layout model changes shape
+
+_default_cache: "ParseCache | None" = None
+_default_cache_loaded = False
+
+class ParseCache:
+    """Content-addressed on-disk cache of parsed PBIX members.
+
+    Entries are keyed by a member's CRC and size as recorded in the zip
+    central directory (see `PbixPackage.member_fingerprint`), so a changed
+    member simply misses and unchanged files are never decompressed or
+    JSON-decoded again. Values are stored as pickles, one file per entry;
+    the least recently used entries are evicted once `max_entries` or
+    `max_bytes` is exceeded. Only point this at a directory you trust:
+    loading a pickle can run arbitrary code.
+
+    Example:
+        cache = ParseCache("/tmp/pbix_parse_cache")
+        layout = cache.get("layout", package.member_fingerprint("Report/Layout"))
+    """
+
+    def __init__(self, directory: str = DEFAULT_PARSE_CACHE_DIR, max_entries: int = 2000,
+                 max_bytes: int = 2 * 1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "errors": 0, "evictions": 0, "writes": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, kind: str, fingerprint: str) -> str:
+        key = hashlib.sha256(f"{PARSE_CACHE_VERSION}\x1f{kind}\x1f{fingerprint}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.pickle")
+
+    def get(self, kind: str, fingerprint: str):
+        """Returns the cached value for a member fingerprint, or None on a miss."""
+        path = self._path(kind, fingerprint)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        except Exception as e:
+            # Truncated or incompatible entry: drop it and parse from scratch
+            logging.warning(f"Discarding unreadable parse cache entry {path}: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+                self._stats["misses"] += 1
+            self._remove(path)
+            return None
+        try:
+            os.utime(path) # Mark as recently used for LRU eviction
+        except OSError:
+            pass
+        with self._lock:
+            self._stats["hits"] += 1
+        return value
+
+    def put(self, kind: str, fingerprint: str, value):
+        """Stores a value atomically and evicts least recently used entries past the limits."""
+        path = self._path(kind, fingerprint)
+        fd, temp_path = tempfile.mkstemp(prefix=".entry_", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except Exception as e:
+            logging.warning(f"Could not write parse cache entry {path}: {e}")
+            self._remove(temp_path)
+            return
+        with self._lock:
+            self._stats["writes"] += 1
+            self._evict()
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".pickle"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue # Evicted by another process
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        count = len(entries)
+        total_bytes = sum(size for _, size, _ in entries)
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            self._remove(path)
+            count -= 1
+            total_bytes -= size
+            self._stats["evictions"] += 1
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._entries():
+                self._remove(path)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters for this process plus the current cache size."""
+        with self._lock:
+            entries = self._entries()
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update(entries=len(entries), bytes=sum(size for _, size, _ in entries),
+                     hit_rate=stats["hits"] / lookups if lookups else 0.0)
+        return stats
+
+def parse_cache_from_env() -> ParseCache | None:
+    """Builds the parse cache from `PARSE_CACHE_DIR`, or None if `PARSE_CACHE=0`."""
+    if os.getenv("PARSE_CACHE", "1").lower() in ("0", "false", "off", "no"):
+        return None
+    return ParseCache(
+        os.getenv("PARSE_CACHE_DIR", DEFAULT_PARSE_CACHE_DIR),
+        max_entries=int(os.getenv("PARSE_CACHE_MAX_ENTRIES", "2000")),
+        max_bytes=int(os.getenv("PARSE_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024))),
+    )
+
+def get_default_parse_cache() -> ParseCache | None:
+    """Returns the process-wide parse cache (None when disabled via `PARSE_CACHE=0`)."""
+    global _default_cache, _default_cache_loaded
+    if not _default_cache_loaded:
+        _default_cache_loaded = True
+        try:
+            _default_cache = parse_cache_from_env()
+        except Exception as e:
+            logging.warning(f"Parse cache unavailable, continuing without it: {e}")
+    return _default_cache
+
+if __name__ == "__main__":
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or clear the PBIX parse cache.")
+    parser.add_argument("--dir", default=os.getenv("PARSE_CACHE_DIR", DEFAULT_PARSE_CACHE_DIR), help="Cache directory.")
+    parser.add_argument("--clear", action="store_true", help="Delete every cached entry.")
+
+    args = parser.parse_args()
+
+    cache = ParseCache(args.dir)
+    if args.clear:
+        cache.clear()
+    print(json.dumps(cache.stats(), indent=2))
@@ -3,37 +3,147 @@ import json
 import os
 import logging
 
-logging.basicConfig(level=logging.INFO, format=\"%(asctime)s - %(levelname)s - %(message)s\")
+from src.json_stream import JsonStreamReader, sniff_encoding, DEFAULT_CHUNK_SIZE
 
-LAYOUT_FILE_PATH = \"Report/Layout\"
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+LAYOUT_FILE_PATH = "Report/Layout"
 
 def find_layout_file(extracted_dir: str) -> str | None:
-    \"\"\"Finds the report layout file within the extracted PBIX directory.\"\"\"
+    """Finds the report layout file within the extracted PBIX directory."""
     # Check common variations of the layout file name/path
     possible_paths = [
         os.path.join(extracted_dir, LAYOUT_FILE_PATH),
-        os.path.join(extracted_dir, \"Report\", \"layout.json\") # Older PBIX versions might use this
+        os.path.join(extracted_dir, "Report", "layout.json") # Older PBIX versions might use this
     ]
     for path in possible_paths:
         if os.path.isfile(path):
-            logging.info(f\"Found layout file at: {path}\")
+            logging.info(f"Found layout file at: {path}")
             return path
 
-    # Fallback: Search recursively for a file named \"Layout\" or \"layout.json\" within \"Report\"
-    report_dir = os.path.join(extracted_dir, \"Report\")
+    # Fallback: Search recursively for a file named "Layout" or "layout.json" within "Report"
+    report_dir = os.path.join(extracted_dir, "Report")
     if os.path.isdir(report_dir):
         for root, _, files in os.walk(report_dir):
             for file in files:
-                if file.lower() == \"layout\" or file.lower() == \"layout.json\":
+                if file.lower() == "layout" or file.lower() == "layout.json":
                     found_path = os.path.join(root, file)
-                    logging.info(f\"Found layout file via search: {found_path}\")
+                    logging.info(f"Found layout file via search: {found_path}")
                     return found_path
 
-    logging.warning(f\"Layout file not found in expected locations within {extracted_dir}\")
+    logging.warning(f"Layout file not found in expected locations within {extracted_dir}")
     return None
 
+def parse_layout_bytes(raw_layout: bytes, source: str = "Report/Layout") -> dict | None:
+    """Parses raw Report/Layout bytes, as read from disk or straight from the archive.
+
+    The encoding (UTF-16 LE is the PBIX norm; UTF-8 and BOM-prefixed files
+    also occur) is sniffed from the first bytes, so the document is decoded
+    and parsed exactly once.
+
+    Args:
+        raw_layout: The undecoded contents of the layout file.
+        source: A label for the layout's origin, used in log messages.
+
+    Returns:
+        A dictionary representing the parsed JSON layout, or None if the
+        bytes cannot be decoded.
+    """
+    encoding = sniff_encoding(raw_layout[:4])
+    try:
+        layout_data = json.loads(raw_layout.decode(encoding))
+        logging.info(f"Successfully parsed layout file ({encoding}): {source}")
+        return layout_data
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        logging.error(f"Failed to parse {source} as {encoding}: {e}")
+        return None
+    except Exception as e:
+        logging.error(f"An unexpected error occurred while parsing {source}: {e}")
+        return None
+
+def _open_layout_source(source):
+    """Returns (binary stream, should_close) for a path or an already open binary stream."""
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, "rb"), True
+    return source, False
+
+def iter_layout_sections(source, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Yields the layout's sections one at a time without parsing the whole document.
+
+    Only the section currently being yielded is materialized, which keeps
+    memory flat for read-only tasks (inventory, summaries, search) on large
+    layouts.
+
+    Args:
+        source: A layout file path, or a binary stream such as
+            `PbixPackage.open_member("Report/Layout")`.
+        chunk_size: Number of bytes read from the stream at a time.
+    """
+    stream, should_close = _open_layout_source(source)
+    try:
+        reader = JsonStreamReader(stream, chunk_size)
+        for key in reader.iter_object():
+            if key != "sections":
+                reader.skip_value()
+                continue
+            for _ in reader.iter_array():
+                yield reader.read_value()
+    finally:
+        if should_close:
+            stream.close()
+
+def iter_layout_visuals(source, chunk_size: int = DEFAULT_CHUNK_SIZE, include_empty_sections: bool = False):
+    """Yields `(section_index, section_info, visual_container)` one visual at a time.
+
+    `section_info` holds the section fields that precede `visualContainers`
+    in the document (Power BI writes `name`, `displayName`, `filters` and
+    `ordinal` first); later fields such as the section `config` are skipped.
+    Visual `config` strings are returned still encoded. With
+    `include_empty_sections`, a section without visuals is yielded once with
+    `visual_container` set to None.
+    """
+    stream, should_close = _open_layout_source(source)
+    try:
+        reader = JsonStreamReader(stream, chunk_size)
+        for key in reader.iter_object():
+            if key != "sections":
+                reader.skip_value()
+                continue
+            for section_index in reader.iter_array():
+                section_info = {}
+                has_visuals = False
+                for section_key in reader.iter_object():
+                    if section_key == "visualContainers":
+                        for _ in reader.iter_array():
+                            has_visuals = True
+                            yield section_index, section_info, reader.read_value()
+                    elif section_key in ("name", "displayName", "ordinal"):
+                        section_info[section_key] = reader.read_value()
+                    else:
+                        reader.skip_value()
+                if include_empty_sections and not has_visuals:
+                    yield section_index, section_info, None
+    finally:
+        if should_close:
+            stream.close()
+
+def serialize_layout(layout_data: dict, compact: bool = True, encoding: str = "utf-16-le") -> bytes:
+    """Encodes a layout dictionary into the bytes stored as Report/Layout.
+
+    Args:
+        layout_data: The layout dictionary.
+        compact: Write compact JSON without whitespace, as Power BI does.
+            Pass False for an indented, human-readable file.
+        encoding: Output encoding; PBIX layouts are normally UTF-16 LE.
+    """
+    if compact:
+        text = json.dumps(layout_data, ensure_ascii=False, separators=(",", ":"))
+    else:
+        text = json.dumps(layout_data, ensure_ascii=False, indent=2) # Use indent for readability
+    return text.encode(encoding)
+
 def parse_report_layout(extracted_dir: str) -> dict | None:
-    \"\"\"Parses the Report/Layout JSON file from an extracted PBIX directory.
+    """Parses the Report/Layout JSON file from an extracted PBIX directory.
 
     Args:
         extracted_dir: The directory containing the extracted PBIX contents.
@@ -41,66 +151,72 @@ def parse_report_layout(extracted_dir: str) -> dict | None:
     Returns:
         A dictionary representing the parsed JSON layout, or None if the file
         cannot be found or parsed.
-    \"\"\"
+    """
     layout_file = find_layout_file(extracted_dir)
 
     if not layout_file:
         return None
 
     try:
-        # PBIX layout often uses UTF-16 LE encoding
-        with open(layout_file, \"r\", encoding=\"utf-16-le\") as f:
-            layout_data = json.load(f)
-            logging.info(f\"Successfully parsed layout file: {layout_file}\")
-            return layout_data
+        with open(layout_file, "rb") as f:
+            raw_layout = f.read()
     except FileNotFoundError:
-        logging.error(f\"Layout file path found but file not accessible: {layout_file}\")
+        logging.error(f"Layout file path found but file not accessible: {layout_file}")
         return None
-    except (json.JSONDecodeError, UnicodeDecodeError) as e:
-        logging.warning(f\"Failed to parse {layout_file} with utf-16-le ({e}), trying utf-8...\")
-        # Try reading with different encoding as fallback
-        try:
-            with open(layout_file, \"r\", encoding=\"utf-8\") as f_utf8:
-                layout_data = json.load(f_utf8)
-                logging.info(f\"Successfully parsed layout file with UTF-8 fallback: {layout_file}\")
-                return layout_data
-        except Exception as fallback_e:
-            logging.error(f\"Fallback UTF-8 parsing also failed for {layout_file}: {fallback_e}\")
-            return None
     except Exception as e:
-        logging.error(f\"An unexpected error occurred while parsing {layout_file}: {e}\")
+        logging.error(f"An unexpected error occurred while parsing {layout_file}: {e}")
         return None
 
-def save_report_layout(extracted_dir: str, layout_data: dict):
-    \"\"\"Saves the modified layout data back to the Report/Layout file.
+    return parse_layout_bytes(raw_layout, source=layout_file)
+
+def save_report_layout(extracted_dir: str, layout_data, compact: bool = True) -> bool:
+    """Saves the modified layout data back to the Report/Layout file.
+
+    The file is left untouched when the serialized layout is identical to
+    what is already on disk, so unchanged documents cost no write.
 
     Args:
         extracted_dir: The directory containing the extracted PBIX contents.
-        layout_data: The dictionary representing the layout to be saved.
+        layout_data: The dictionary (or `layout.Layout`) to be saved. A
+            `Layout` read with `Layout.from_bytes` only re-encodes what changed.
+        compact: Write compact JSON as Power BI does (ignored for `Layout`).
+
+    Returns:
+        True if the file was written, False if it was already up to date.
 
     Raises:
         FileNotFoundError: If the original layout file cannot be found.
         IOError: If there is an error writing the file.
-    \"\"\"
+    """
     layout_file = find_layout_file(extracted_dir)
 
     if not layout_file:
-        logging.error(f\"Cannot save layout: Original layout file not found in {extracted_dir}\")
-        raise FileNotFoundError(f\"Original layout file not found in {extracted_dir}\")
+        logging.error(f"Cannot save layout: Original layout file not found in {extracted_dir}")
+        raise FileNotFoundError(f"Original layout file not found in {extracted_dir}")
 
     try:
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(layout_file), exist_ok=True)
+        if hasattr(layout_data, "to_bytes"):
+            if not layout_data.modified:
+                logging.info(f"Layout unchanged; skipped writing {layout_file}")
+                return False
+            new_bytes = layout_data.to_bytes()
+        else:
+            new_bytes = serialize_layout(layout_data, compact=compact)
+
+        with open(layout_file, "rb") as f:
+            if f.read() == new_bytes:
+                logging.info(f"Layout unchanged; skipped writing {layout_file}")
+                return False
 
-        # Write the file using UTF-16 LE encoding, which is common for PBIX layouts
-        with open(layout_file, \"w\", encoding=\"utf-16-le\") as f:
-            json.dump(layout_data, f, ensure_ascii=False, indent=2) # Use indent for readability
-            logging.info(f\"Successfully saved modified layout to: {layout_file}\")
+        with open(layout_file, "wb") as f:
+            f.write(new_bytes)
+            logging.info(f"Successfully saved modified layout to: {layout_file}")
+        return True
     except IOError as e:
-        logging.error(f\"Failed to write layout file {layout_file}: {e}\")
+        logging.error(f"Failed to write layout file {layout_file}: {e}")
         raise
     except Exception as e:
-        logging.error(f\"An unexpected error occurred while saving {layout_file}: {e}\")
+        logging.error(f"An unexpected error occurred while saving {layout_file}: {e}")
         raise
 
 # --- Example Modification Function (Conceptual) ---
@@ -108,35 +224,35 @@ def save_report_layout(extracted_dir: str, layout_data: dict):
 # For now, it just demonstrates reading, making a trivial change, and saving.
 
 def modify_and_save_layout(extracted_dir: str):
-    \"\"\"Example function to parse, modify, and save the layout.\"\"\"
-    logging.info(\"Attempting to modify layout...\")
+    """Example function to parse, modify, and save the layout."""
+    logging.info("Attempting to modify layout...")
     layout = parse_report_layout(extracted_dir)
     if not layout:
-        logging.error(\"Cannot modify layout, parsing failed.\")
+        logging.error("Cannot modify layout, parsing failed.")
         return
 
     # --- Placeholder Modification --- 
     # Example: Add a comment or metadata to the layout root
-    layout[\"_modification_comment\"] = \"Layout modified by AI PBIX Transformer\"
-    logging.info(\"Applied placeholder modification to layout data.\")
+    layout["_modification_comment"] = "Layout modified by AI PBIX Transformer"
+    logging.info("Applied placeholder modification to layout data.")
     # --- End Placeholder Modification ---
 
     try:
         save_report_layout(extracted_dir, layout)
-        logging.info(\"Layout modification saved successfully.\")
+        logging.info("Layout modification saved successfully.")
     except Exception as e:
-        logging.error(f\"Failed to save layout modification: {e}\")
+        logging.error(f"Failed to save layout modification: {e}")
 
 # --- Main execution block for testing --- 
-if __name__ == \"__main__\":
+if __name__ == "__main__":
     import argparse
     from extractor import extract_pbix
     import shutil
 
-    parser = argparse.ArgumentParser(description=\"Parse, optionally modify, and save the Report/Layout file from a PBIX.\")
-    parser.add_argument(\"--input\", required=True, help=\"Path to the input PBIX file.\")
-    parser.add_argument(\"--temp_dir\", default=\"./temp_extracted\", help=\"Temporary directory to extract PBIX contents.\")
-    parser.add_argument(\"--modify\", action=\"store_true\", help=\"Apply a placeholder modification before saving.\")
+    parser = argparse.ArgumentParser(description="Parse, optionally modify, and save the Report/Layout file from a PBIX.")
+    parser.add_argument("--input", required=True, help="Path to the input PBIX file.")
+    parser.add_argument("--temp_dir", default="./temp_extracted", help="Temporary directory to extract PBIX contents.")
+    parser.add_argument("--modify", action="store_true", help="Apply a placeholder modification before saving.")
 
     args = parser.parse_args()
     cleanup_temp = True
@@ -144,32 +260,32 @@ if __name__ == \"__main__\":
     try:
         # Clean up previous temp dir if it exists
         if os.path.exists(args.temp_dir):
-            logging.warning(f\"Removing existing temporary directory: {args.temp_dir}\")
+            logging.warning(f"Removing existing temporary directory: {args.temp_dir}")
             shutil.rmtree(args.temp_dir)
 
-        logging.info(f\"Extracting {args.input} to {args.temp_dir}...\")
+        logging.info(f"Extracting {args.input} to {args.temp_dir}...")
         extract_pbix(args.input, args.temp_dir)
 
         if args.modify:
             modify_and_save_layout(args.temp_dir)
         else:
-            logging.info(f\"Parsing layout from {args.temp_dir}...\")
+            logging.info(f"Parsing layout from {args.temp_dir}...")
             layout = parse_report_layout(args.temp_dir)
             if layout:
-                print(\"Layout parsed successfully.\")
-                if \"sections\" in layout:
-                    print(f\"Number of report sections: {len(layout[\"sections\"])}\")
+                print("Layout parsed successfully.")
+                if "sections" in layout:
+                    print(f"Number of report sections: {len(layout['sections'])}")
             else:
-                print(\"Failed to parse report layout.\")
+                print("Failed to parse report layout.")
 
     except Exception as e:
-        logging.error(f\"An error occurred in the main execution: {e}\")
+        logging.error(f"An error occurred in the main execution: {e}")
         cleanup_temp = False # Keep temp dir for debugging if error occurs
         exit(1)
     finally:
         # Clean up the temporary directory if successful and cleanup is enabled
         if cleanup_temp and os.path.exists(args.temp_dir):
-            logging.info(f\"Cleaning up temporary directory: {args.temp_dir}\")
+            logging.info(f"Cleaning up temporary directory: {args.temp_dir}")
             # shutil.rmtree(args.temp_dir) # Uncomment to enable cleanup
             pass
 
@@ -0,0 +1,476 @@
+
+import copy
+import json
+import logging
+
+from src.layout import Layout, LayoutNode, Section, VisualContainer
+from src.pbix_package import PbixPackage
+from src.parse_cache import get_default_parse_cache
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+PATCH_FORMAT = "pbix-layout-patch"
+PATCH_VERSION = 1
+
+# Child lists are diffed node by node, never as fields of their parent
+CHILD_FIELDS = ("sections", "visualContainers")
+
+class PatchConflictError(ValueError):
+    """Raised when a patch does not fit the layout it is applied to."""
+
+# --- JSON Pointer helpers ---
+
+def _escape(token) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+def _tokens(pointer: str) -> list[str]:
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise PatchConflictError(f"Invalid JSON pointer: {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+def _step(container, token: str, pointer: str):
+    if isinstance(container, dict):
+        if token not in container:
+            raise PatchConflictError(f"Path {pointer} does not exist (missing {token!r})")
+        return container[token]
+    if isinstance(container, list):
+        try:
+            return container[int(token)]
+        except (ValueError, IndexError):
+            raise PatchConflictError(f"Path {pointer} does not exist (bad index {token!r})") from None
+    raise PatchConflictError(f"Path {pointer} does not exist ({token!r} under a scalar)")
+
+def _same(a, b) -> bool:
+    # JSON distinguishes true from 1, Python equality does not
+    return type(a) is type(b) and a == b
+
+# --- Diffing ---
+
+def _view(raw: dict, encoded_fields: tuple, decoded=None) -> dict:
+    """Returns a node's own fields with string-encoded JSON decoded, excluding child lists.
+
+    `decoded` is a callable returning the current decoded value of an encoded
+    field (`LayoutNode.decoded`), used for live nodes whose raw strings may
+    still be stale.
+    """
+    view = {}
+    for key, value in raw.items():
+        if key in CHILD_FIELDS:
+            continue
+        if key in encoded_fields and isinstance(value, str):
+            view[key] = decoded(key) if decoded else (json.loads(value) if value else None)
+        else:
+            view[key] = value
+    return view
+
+def _node_view(node: LayoutNode) -> dict:
+    return _view(node.raw, node.encoded_fields, node.decoded)
+
+def diff_values(before, after, path: str = "") -> list[dict]:
+    """Lists JSON Patch operations turning `before` into `after`.
+
+    Replaced and removed values carry their previous value in `"old"`, which
+    lets `apply_patch` detect conflicts and `invert_patch` build a rollback.
+    """
+    ops = []
+    _diff(before, after, path, ops)
+    return ops
+
+def _diff(before, after, path: str, ops: list):
+    if _same(before, after):
+        return
+    if isinstance(before, dict) and isinstance(after, dict):
+        for key, value in before.items():
+            if key not in after:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}", "old": value})
+        for key, value in after.items():
+            if key not in before:
+                ops.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": value})
+            else:
+                _diff(before[key], value, f"{path}/{_escape(key)}", ops)
+    elif isinstance(before, list) and isinstance(after, list) and \
+            len(after) >= len(before) and (len(after) == len(before) or _same(after[:len(before)], before)):
+        for index, value in enumerate(before):
+            _diff(value, after[index], f"{path}/{index}", ops)
+        for index in range(len(before), len(after)):
+            ops.append({"op": "add", "path": f"{path}/{index}", "value": after[index]})
+    else:
+        ops.append({"op": "replace", "path": path, "value": after, "old": before})
+
+def _node_key(node: LayoutNode) -> dict:
+    if isinstance(node, VisualContainer):
+        return {"section": node.section.name, "visual": node.name}
+    if isinstance(node, Section):
+        return {"section": node.name}
+    return {}
+
+def _diff_node(before: LayoutNode | dict, after: LayoutNode, changes: list):
+    before_view = _node_view(before) if isinstance(before, LayoutNode) else before
+    ops = diff_values(before_view, _node_view(after))
+    if not ops:
+        return
+    # Key by the names the patch's target will have before it is applied
+    key = _node_key(after)
+    if isinstance(after, VisualContainer):
+        key["visual"] = (before_view.get("config") or {}).get("name", key["visual"])
+    elif isinstance(after, Section):
+        key["section"] = before_view.get("name", key["section"])
+    changes.append({**key, "ops": ops})
+
+def _unchanged(before: LayoutNode, after: LayoutNode) -> bool:
+    # Equal raw dictionaries compare their encoded strings directly, without decoding
+    return not after.dirty and before.raw == after.raw
+
+def _diff_visuals(before: Section, after: Section, changes: list):
+    if len(before.visuals) == len(after.visuals) and \
+            all(_unchanged(old, new) for old, new in zip(before.visuals, after.visuals)):
+        return
+    # Match by stable visual name; only containers that differ get their config decoded
+    before_by_name = {visual.name: visual for visual in before.visuals}
+    after_names = set()
+    for index, visual in enumerate(after.visuals):
+        name = visual.name
+        if name is None:
+            logging.warning(f"Skipping unnamed visual on section {after.name}; it cannot be patched")
+            continue
+        after_names.add(name)
+        old = before_by_name.get(name)
+        if old is None:
+            changes.append({"section": after.name, "visual": name,
+                            "ops": [{"op": "add", "path": "", "index": index, "value": _raw_copy(visual)}]})
+        elif not _unchanged(old, visual):
+            _diff_node(old, visual, changes)
+    # Removals go last-first so the inverted patch re-inserts them in ascending position
+    for index, visual in reversed(list(enumerate(before.visuals))):
+        if visual.name is not None and visual.name not in after_names:
+            changes.append({"section": before.name, "visual": visual.name,
+                            "ops": [{"op": "remove", "path": "", "index": index, "old": _raw_copy(visual)}]})
+
+def _raw_copy(node: LayoutNode) -> dict:
+    node.flush() # Make the encoded strings current before copying them
+    return copy.deepcopy(node.raw)
+
+def diff_layouts(before: Layout, after: Layout) -> list[dict]:
+    """Compares two layouts of the same report template.
+
+    Sections are matched by name and visuals by their stable `config.name`
+    within a section. Nodes whose raw dictionaries are identical are skipped
+    without decoding anything, so diffing a large report with a few edits is
+    cheap.
+
+    Returns:
+        A list of changes, each `{"section"?, "visual"?, "ops": [...]}` with
+        JSON Patch operations whose paths point into the node's decoded
+        fields (e.g. `/config/singleVisual/visualType`). A whole visual or
+        section that was added or removed is one `add`/`remove` op with path ""
+        and its position in `"index"`.
+    """
+    changes = []
+    if not _unchanged_root(before, after):
+        _diff_node(before, after, changes)
+
+    before_sections = {section.name: section for section in before.sections}
+    after_names = set()
+    for index, section in enumerate(after.sections):
+        after_names.add(section.name)
+        old = before_sections.get(section.name)
+        if old is None:
+            changes.append({"section": section.name,
+                            "ops": [{"op": "add", "path": "", "index": index, "value": _section_raw(section)}]})
+            continue
+        if not _unchanged(old, section):
+            _diff_node(old, section, changes)
+        _diff_visuals(old, section, changes)
+    for index, section in reversed(list(enumerate(before.sections))):
+        if section.name not in after_names:
+            changes.append({"section": section.name,
+                            "ops": [{"op": "remove", "path": "", "index": index, "old": _section_raw(section)}]})
+    return changes
+
+def _unchanged_root(before: Layout, after: Layout) -> bool:
+    if after.dirty:
+        return False
+    return all(_same(value, after.raw.get(key)) for key, value in before.raw.items() if key != "sections") and \
+        set(before.raw) == set(after.raw)
+
+def _section_raw(section: Section) -> dict:
+    for visual in section.visuals:
+        visual.flush()
+    return _raw_copy(section)
+
+def layout_changes(layout: Layout) -> list[dict]:
+    """Diffs an edited layout against the document it was read from.
+
+    Only nodes touched since reading are compared; their original state is
+    decoded from the recorded source span, so the rest of the report is never
+    parsed again. Structural edits (added visuals or pages) fall back to a
+    full `diff_layouts` against a fresh parse of the source bytes.
+    """
+    modified = layout.modified_nodes()
+    if not modified and not layout.structure_changed:
+        return []
+    if layout.structure_changed or layout.source_text is None or \
+            any(node is not layout and node.span is None for node in modified):
+        if layout.source_bytes is None:
+            raise ValueError("Layout has no source document to diff against")
+        return diff_layouts(Layout.from_bytes(layout.source_bytes), layout)
+
+    changes = []
+    seen = set()
+    for node in modified:
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if node is layout:
+            original = json.loads(layout.source_text)
+        else:
+            start, end = node.span
+            original = json.loads(layout.source_text[start:end])
+        _diff_node(_view(original, node.encoded_fields), node, changes)
+    return changes
+
+def make_patch(changes: list[dict], base: dict | None = None, requests: list[str] | None = None) -> dict:
+    """Wraps changes in a versioned patch document."""
+    patch = {"format": PATCH_FORMAT, "version": PATCH_VERSION, "base": base or {}, "changes": changes}
+    if requests:
+        patch["requests"] = requests
+    return patch
+
+def invert_patch(patch: dict) -> dict:
+    """Builds the patch that undoes `patch` (applied to the patched layout)."""
+    changes = []
+    for change in reversed(patch["changes"]):
+        ops = []
+        for op in reversed(change["ops"]):
+            if op["op"] == "add":
+                inverted = {"op": "remove", "path": op["path"], "old": op["value"]}
+            elif op["op"] == "remove":
+                inverted = {"op": "add", "path": op["path"], "value": op["old"]}
+            else:
+                inverted = {"op": "replace", "path": op["path"], "value": op["old"], "old": op["value"]}
+            if "index" in op:
+                inverted["index"] = op["index"]
+            ops.append(inverted)
+        changes.append({**{key: value for key, value in change.items() if key != "ops"}, "ops": ops})
+    return dict(patch, changes=changes, inverted=not patch.get("inverted", False))
+
+# --- Applying ---
+
+def _resolve_node(layout: Layout, change: dict) -> LayoutNode | Section | None:
+    section = None
+    if change.get("section") is not None:
+        section = layout.get_section(change["section"])
+        if section is None:
+            return None
+    if change.get("visual") is None:
+        return section or layout
+    matches = layout.find_visuals_by_name(change["visual"], section)
+    matches = [visual for visual in matches if visual.name == change["visual"]] # The index also matches case-insensitively
+    if len(matches) > 1:
+        raise PatchConflictError(f"Visual {change['visual']!r} is not unique on section {change.get('section')}")
+    return matches[0] if matches else None
+
+def _apply_structural(layout: Layout, change: dict, op: dict, node, strict: bool):
+    if op["op"] == "add":
+        if node is not None:
+            raise PatchConflictError(f"Cannot add {_describe(change)}: it already exists")
+        if change.get("visual") is None:
+            layout.add_section(copy.deepcopy(op["value"]), op.get("index"))
+            return
+        section = layout.get_section(change["section"])
+        if section is None:
+            raise PatchConflictError(f"Cannot add {_describe(change)}: section not found")
+        layout.checkpoint(section)
+        section.add_visual(copy.deepcopy(op["value"]), op.get("index"))
+        return
+    if op["op"] != "remove":
+        raise PatchConflictError(f"Unsupported whole-node operation {op['op']!r} for {_describe(change)}")
+    if node is None:
+        raise PatchConflictError(f"Cannot remove {_describe(change)}: not found")
+    if strict and "old" in op and not _same(_raw_copy(node), op["old"]):
+        raise PatchConflictError(f"Cannot remove {_describe(change)}: it differs from the patch's base")
+    if isinstance(node, VisualContainer):
+        layout.checkpoint(node.section)
+        node.section.remove_visual(node)
+    else:
+        layout.remove_section(node)
+
+def _apply_op(node: LayoutNode, op: dict, strict: bool):
+    pointer = op["path"]
+    tokens = _tokens(pointer)
+    field = tokens[0]
+    encoded = field in node.encoded_fields and isinstance(node.raw.get(field), str)
+
+    if len(tokens) == 1:
+        # A whole top-level field
+        current = (node.decoded(field) if encoded else node.raw.get(field)) if field in node.raw else None
+        if strict and op["op"] in ("replace", "remove") and "old" in op and not _same(current, op["old"]):
+            raise PatchConflictError(f"Conflict at {pointer}: expected {op['old']!r}, found {current!r}")
+        if op["op"] == "remove":
+            node.remove_field(field)
+        elif field in node.encoded_fields:
+            node.raw.setdefault(field, "") # Re-encoded into the string on flush
+            node.set_decoded(field, copy.deepcopy(op["value"]))
+        else:
+            node.raw[field] = copy.deepcopy(op["value"])
+        return
+
+    container = node.decoded(field) if encoded else node.raw.get(field)
+    if container is None:
+        raise PatchConflictError(f"Path {pointer} does not exist")
+    for token in tokens[1:-1]:
+        container = _step(container, token, pointer)
+    last = tokens[-1]
+
+    if op["op"] == "add":
+        if isinstance(container, list):
+            index = len(container) if last == "-" else int(last)
+            if index > len(container):
+                raise PatchConflictError(f"Cannot add at {pointer}: index out of range")
+            container.insert(index, copy.deepcopy(op["value"]))
+        elif isinstance(container, dict):
+            if strict and last in container:
+                raise PatchConflictError(f"Conflict at {pointer}: value already exists")
+            container[last] = copy.deepcopy(op["value"])
+        else:
+            raise PatchConflictError(f"Cannot add at {pointer}: parent is not a container")
+        return
+
+    current = _step(container, last, pointer)
+    if strict and "old" in op and not _same(current, op["old"]):
+        raise PatchConflictError(f"Conflict at {pointer}: expected {op['old']!r}, found {current!r}")
+    key = int(last) if isinstance(container, list) else last
+    if op["op"] == "remove":
+        del container[key]
+    elif op["op"] == "replace":
+        container[key] = copy.deepcopy(op["value"])
+    else:
+        raise PatchConflictError(f"Unsupported operation {op['op']!r} at {pointer}")
+
+def _describe(change: dict) -> str:
+    if change.get("visual") is not None:
+        return f"visual {change['visual']!r} on section {change.get('section')!r}"
+    if change.get("section") is not None:
+        return f"section {change['section']!r}"
+    return "report"
+
+def apply_patch(layout: Layout, patch: dict, strict: bool = True) -> int:
+    """Replays a patch onto a layout as one transaction.
+
+    Nodes are found by section name and visual name, so a patch made on one
+    report applies to any report built from the same template. With `strict`,
+    every replaced or removed value must still equal the patch's recorded
+    `"old"` value; otherwise, or if a target is missing, nothing is applied.
+
+    Args:
+        layout: The layout to modify.
+        patch: A patch document from `make_patch`.
+        strict: Check recorded old values before overwriting them.
+
+    Returns:
+        The number of operations applied.
+
+    Raises:
+        PatchConflictError: If the patch does not fit the layout (the layout
+            is left unchanged).
+        ValueError: If the document is not a supported patch.
+    """
+    if patch.get("format") != PATCH_FORMAT or patch.get("version") != PATCH_VERSION:
+        raise ValueError(f"Not a {PATCH_FORMAT} v{PATCH_VERSION} document")
+
+    applied = 0
+    with layout.transaction():
+        for change in patch["changes"]:
+            node = _resolve_node(layout, change)
+            if any(op["path"] == "" for op in change["ops"]):
+                for op in change["ops"]:
+                    _apply_structural(layout, change, op, node, strict)
+                    applied += 1
+                continue
+            if node is None:
+                raise PatchConflictError(f"Patch target not found: {_describe(change)}")
+            layout.checkpoint(node)
+            for op in change["ops"]:
+                _apply_op(node, op, strict)
+                applied += 1
+            node.touch()
+            if isinstance(node, VisualContainer):
+                layout.invalidate_visual_index() # Names, titles or types may have changed
+            elif isinstance(node, Section):
+                layout.reindex_sections()
+    logging.info(f"Applied patch: {applied} operation(s) across {len(patch['changes'])} node(s)")
+    return applied
+
+def apply_patch_to_pbix(pbix_input_path: str, pbix_output_path: str, patch: dict, strict: bool = True) -> dict:
+    """Applies a layout patch to a PBIX and writes the result, without any AI call.
+
+    Returns:
+        `{"operations": applied, "base_matches": bool}` plus the repackaging
+        statistics; `base_matches` tells whether the input's layout is the
+        exact document the patch was made from.
+    """
+    with PbixPackage(pbix_input_path) as package:
+        layout = package.read_layout_document(cache=get_default_parse_cache())
+        if layout is None:
+            raise ValueError(f"No report layout found in {pbix_input_path}")
+        fingerprint = package.member_fingerprint(package.find_layout_member())
+        base_matches = fingerprint == patch.get("base", {}).get("layout_fingerprint")
+        if not base_matches:
+            logging.info("Patch was made from a different layout; relying on node keys and old-value checks.")
+        applied = apply_patch(layout, patch, strict=strict)
+        package.write_layout(layout)
+        stats = package.save(pbix_output_path)
+    return {"operations": applied, "base_matches": base_matches, **stats}
+
+def read_patch(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_patch(patch: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(patch, f, ensure_ascii=False, separators=(",", ":"))
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create, apply and invert PBIX layout patches.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    diff_parser = commands.add_parser("diff", help="Write the patch that turns one PBIX's layout into another's.")
+    diff_parser.add_argument("--before", required=True, help="Original PBIX file.")
+    diff_parser.add_argument("--after", required=True, help="Edited PBIX file.")
+    diff_parser.add_argument("--output", help="Patch file to write (default: print).")
+
+    apply_parser = commands.add_parser("apply", help="Replay a patch onto a PBIX.")
+    apply_parser.add_argument("--input", required=True, help="PBIX file to patch.")
+    apply_parser.add_argument("--patch", required=True, help="Patch file.")
+    apply_parser.add_argument("--output", required=True, help="Where to write the patched PBIX.")
+    apply_parser.add_argument("--force", action="store_true", help="Overwrite values even if they differ from the patch's base.")
+
+    invert_parser = commands.add_parser("invert", help="Write the patch that undoes a patch.")
+    invert_parser.add_argument("--patch", required=True, help="Patch file.")
+    invert_parser.add_argument("--output", required=True, help="Inverse patch file to write.")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "diff":
+            with PbixPackage(args.before) as before_package, PbixPackage(args.after) as after_package:
+                layout_member = before_package.find_layout_member()
+                result = make_patch(diff_layouts(before_package.read_layout_document(),
+                                                 after_package.read_layout_document()),
+                                    base={"layout_member": layout_member,
+                                          "layout_fingerprint": before_package.member_fingerprint(layout_member)})
+            if args.output:
+                write_patch(result, args.output)
+            else:
+                print(json.dumps(result, indent=2, ensure_ascii=False))
+        elif args.command == "apply":
+            print(json.dumps(apply_patch_to_pbix(args.input, args.output, read_patch(args.patch), strict=not args.force)))
+        else:
+            write_patch(invert_patch(read_patch(args.patch)), args.output)
+    except Exception as e:
+        logging.error(f"Patch {args.command} failed: {e}")
+        exit(1)
@@ -0,0 +1,179 @@
+
+import zipfile
+import os
+import json
+import logging
+
+from src.parser import LAYOUT_FILE_PATH, parse_layout_bytes, serialize_layout
+from src.layout import Layout
+from src.repackager import repackage_pbix
+from src.parse_cache import ParseCache
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+LEGACY_LAYOUT_FILE_PATH = "Report/layout.json" # Older PBIX versions might use this
+
+class PbixPackage:
+    """A PBIX archive opened once and read member-by-member, without extraction.
+
+    Members are decompressed only when a caller asks for them, and edits are
+    kept in memory until `save` rebuilds the archive, copying untouched
+    members from the source without recompressing them.
+
+    Example:
+        with PbixPackage("report.pbix") as package:
+            layout = package.read_layout()
+            ...
+            package.write_layout(layout)
+            package.save("report_edited.pbix")
+    """
+
+    def __init__(self, pbix_file_path: str):
+        if not os.path.exists(pbix_file_path):
+            logging.error(f"PBIX file not found: {pbix_file_path}")
+            raise FileNotFoundError(f"PBIX file not found: {pbix_file_path}")
+
+        try:
+            self._zip = zipfile.ZipFile(pbix_file_path, "r")
+        except zipfile.BadZipFile:
+            logging.error(f"Error: The file \"{pbix_file_path}\" is not a valid zip file or is corrupted.")
+            raise
+
+        self.path = pbix_file_path
+        self._modified: dict[str, bytes] = {}
+        self._layout_member: str | None = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Closes the underlying archive handle."""
+        self._zip.close()
+
+    def namelist(self) -> list[str]:
+        """Returns the member names of the package, including newly written ones."""
+        names = self._zip.namelist()
+        return names + [name for name in self._modified if name not in self._zip.NameToInfo]
+
+    def has_member(self, name: str) -> bool:
+        return name in self._modified or name in self._zip.NameToInfo
+
+    def read_member(self, name: str) -> bytes:
+        """Returns the (possibly modified) contents of a single archive member.
+
+        Raises:
+            KeyError: If the member does not exist in the package.
+        """
+        if name in self._modified:
+            return self._modified[name]
+        return self._zip.read(name)
+
+    def member_info(self, name: str) -> zipfile.ZipInfo:
+        """Returns the central directory entry of a source member."""
+        return self._zip.getinfo(name)
+
+    def member_fingerprint(self, name: str) -> str:
+        """Identifies a member's content from the central directory (CRC and size), without reading it."""
+        info = self._zip.getinfo(name)
+        return f"{info.CRC:08x}-{info.file_size}"
+
+    def open_member(self, name: str):
+        """Opens an unmodified member as a binary stream, decompressing as it is read."""
+        return self._zip.open(name)
+
+    def write_member(self, name: str, data: bytes):
+        """Stages new contents for a member; nothing is written until `save`."""
+        self._modified[name] = data
+
+    @property
+    def modified_members(self) -> dict[str, bytes]:
+        return dict(self._modified)
+
+    def find_layout_member(self) -> str | None:
+        """Finds the report layout member, mirroring `parser.find_layout_file`."""
+        if self._layout_member:
+            return self._layout_member
+
+        for name in (LAYOUT_FILE_PATH, LEGACY_LAYOUT_FILE_PATH):
+            if self.has_member(name):
+                self._layout_member = name
+                return name
+
+        # Fallback: any member named "Layout" or "layout.json" under "Report/"
+        for name in self._zip.namelist():
+            base = name.rsplit("/", 1)[-1].lower()
+            if name.startswith("Report/") and base in ("layout", "layout.json"):
+                logging.info(f"Found layout member via search: {name}")
+                self._layout_member = name
+                return name
+
+        logging.warning(f"Layout member not found in {self.path}")
+        return None
+
+    def read_layout(self) -> dict | None:
+        """Reads and parses the report layout directly from the archive."""
+        layout_member = self.find_layout_member()
+        if not layout_member:
+            return None
+        return parse_layout_bytes(self.read_member(layout_member), source=f"{self.path}:{layout_member}")
+
+    def read_layout_document(self, cache: ParseCache | None = None) -> Layout | None:
+        """Reads the report layout as an indexed, lazily decoded `Layout`.
+
+        Args:
+            cache: Parse cache keyed by the member's CRC/size. On a hit the
+                member is neither decompressed nor decoded; on a miss the
+                freshly parsed layout is stored for the next run.
+        """
+        layout_member = self.find_layout_member()
+        if not layout_member:
+            return None
+        source = f"{self.path}:{layout_member}"
+        fingerprint = None
+        if cache is not None and layout_member not in self._modified:
+            fingerprint = self.member_fingerprint(layout_member)
+            layout = cache.get("layout", fingerprint)
+            if layout is not None:
+                layout.from_cache = True
+                logging.info(f"Loaded parsed layout from cache ({fingerprint}): {source}")
+                return layout
+        try:
+            layout = Layout.from_bytes(self.read_member(layout_member))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            logging.error(f"Failed to parse {source}: {e}")
+            return None
+        logging.info(f"Successfully parsed layout file ({layout.encoding}): {source}")
+        if fingerprint is not None:
+            cache.put("layout", fingerprint, layout)
+        return layout
+
+    def write_layout(self, layout_data: dict | Layout):
+        """Stages a modified layout (raw dictionary or `Layout`) to be written on `save`.
+
+        An unmodified `Layout` is not staged at all, so the original member is
+        copied through untouched; a modified one splices only its changes.
+
+        Raises:
+            FileNotFoundError: If the package has no layout member to replace.
+        """
+        layout_member = self.find_layout_member()
+        if not layout_member:
+            raise FileNotFoundError(f"Original layout member not found in {self.path}")
+        if isinstance(layout_data, Layout):
+            if not layout_data.modified:
+                logging.info("Layout unchanged; keeping the original member.")
+                return
+            self.write_member(layout_member, layout_data.to_bytes())
+        else:
+            self.write_member(layout_member, serialize_layout(layout_data))
+
+    def save(self, output_path: str) -> dict:
+        """Writes the package to `output_path` atomically.
+
+        Untouched members are copied as raw compressed bytes by
+        `repackager.repackage_pbix`; only staged members are recompressed.
+        """
+        return repackage_pbix(self.path, output_path, self._modified)
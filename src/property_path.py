@@ -0,0 +1,449 @@
+
+import json
+import logging
+from functools import lru_cache
+
+from src.layout import Layout, LayoutNode, Section, encode_nested_json
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+PATH_CACHE_SIZE = 512
+
+_MISSING = object()
+_COMPARISONS = ("!=", "<=", ">=", "=", "<", ">")
+
+class PropertyPathError(ValueError):
+    """Raised for a malformed property path."""
+
+# --- Path segments ---
+
+class _Key:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return f"Key({self.name!r})"
+
+class _Index:
+    def __init__(self, index: int):
+        self.index = index
+
+    def __repr__(self):
+        return f"Index({self.index})"
+
+class _Wildcard:
+    def __repr__(self):
+        return "Wildcard()"
+
+class _Filter:
+    """`[?path op value]`: keeps the items of the current list (or dict values) that match."""
+
+    def __init__(self, path: "CompiledPath", operator: str | None, value):
+        self.path = path
+        self.operator = operator
+        self.value = value
+
+    def matches(self, item) -> bool:
+        found = self.path.get(item)
+        if self.operator is None:
+            return any(value not in (None, False, "") for value in found)
+        if self.operator == "=":
+            return any(value == self.value for value in found)
+        if self.operator == "!=":
+            return all(value != self.value for value in found)
+        comparable = [value for value in found if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        if not isinstance(self.value, (int, float)):
+            return False
+        if self.operator == "<":
+            return any(value < self.value for value in comparable)
+        if self.operator == "<=":
+            return any(value <= self.value for value in comparable)
+        if self.operator == ">":
+            return any(value > self.value for value in comparable)
+        return any(value >= self.value for value in comparable)
+
+    def __repr__(self):
+        return f"Filter({self.path.path!r} {self.operator} {self.value!r})"
+
+# --- Parsing ---
+
+def _parse_literal(text: str):
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] == "'":
+        return text[1:-1].replace("''", "'")
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text # Bare words compare as strings
+
+def _find_closing_bracket(path: str, start: int) -> int:
+    """Returns the index of the `]` closing the bracket opened before `start`, skipping quoted text."""
+    quote = None
+    i = start
+    while i < len(path):
+        char = path[i]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "]":
+            return i
+        i += 1
+    raise PropertyPathError(f"Unclosed '[' in property path: {path}")
+
+def _parse_filter(expression: str, path: str) -> _Filter:
+    quote = None
+    for i, char in enumerate(expression):
+        if quote:
+            if char == quote:
+                quote = None
+            continue
+        if char in "'\"":
+            quote = char
+            continue
+        for operator in _COMPARISONS:
+            if expression.startswith(operator, i):
+                left = expression[:i].strip()
+                if not left:
+                    raise PropertyPathError(f"Filter without a property in path: {path}")
+                return _Filter(compile_path(left), operator, _parse_literal(expression[i + len(operator):]))
+    if not expression.strip():
+        raise PropertyPathError(f"Empty filter in property path: {path}")
+    return _Filter(compile_path(expression.strip()), None, None)
+
+def _parse(path: str) -> tuple[list, bool]:
+    """Splits a path into segments; returns `(segments, absolute)`."""
+    text = path.strip()
+    absolute = text.startswith("$")
+    if absolute:
+        text = text[1:].lstrip(".")
+    segments = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == ".":
+            i += 1
+            if i == len(text) or text[i] == ".":
+                raise PropertyPathError(f"Empty segment in property path: {path}")
+            continue
+        if char == "[":
+            end = _find_closing_bracket(text, i + 1)
+            inner = text[i + 1:end].strip()
+            if inner == "*":
+                segments.append(_Wildcard())
+            elif inner.startswith("?"):
+                segments.append(_parse_filter(inner[1:], path))
+            elif len(inner) >= 2 and inner[0] == inner[-1] and inner[0] in "'\"":
+                segments.append(_Key(inner[1:-1]))
+            else:
+                try:
+                    segments.append(_Index(int(inner)))
+                except ValueError:
+                    raise PropertyPathError(f"Invalid index [{inner}] in property path: {path}") from None
+            i = end + 1
+            continue
+        end = i
+        while end < len(text) and text[end] not in ".[":
+            end += 1
+        name = text[i:end]
+        segments.append(_Wildcard() if name == "*" else _Key(name))
+        i = end
+    if not segments and not absolute:
+        raise PropertyPathError(f"Empty property path: {path!r}")
+    return segments, absolute
+
+@lru_cache(maxsize=PATH_CACHE_SIZE)
+def compile_path(path: str) -> "CompiledPath":
+    """Parses a property path once; repeated calls with the same string return the cached result.
+
+    Syntax: dotted keys (`config.singleVisual.visualType`), list indexes
+    (`layouts[0]`, `[-1]`), quoted keys (`["odd.key"]`), wildcards (`*` or
+    `[*]`) and filters over list items (`[?config.singleVisual.visualType=barChart]`,
+    `[?displayName='Page 1']`, `[?width>300]`, `[?filters]`). A leading `$`
+    marks a path that starts at the report layout rather than at a visual.
+
+    Raises:
+        PropertyPathError: If the path is malformed.
+    """
+    segments, absolute = _parse(path)
+    return CompiledPath(path, segments, absolute)
+
+# --- Traversal ---
+
+def _child(container, key):
+    """Returns `container[key]`, looking through layout nodes and JSON-encoded strings."""
+    if isinstance(container, LayoutNode):
+        if isinstance(key, str):
+            if key in container.encoded_fields and isinstance(container.raw.get(key), str):
+                return container.decoded(key)
+            if key == "sections" and isinstance(container, Layout):
+                return container.sections
+            if key == "visualContainers" and isinstance(container, Section):
+                return container.visuals
+        container = container.raw
+    if isinstance(container, dict):
+        return container.get(key, _MISSING) if isinstance(key, str) else _MISSING
+    if isinstance(container, list) and isinstance(key, int):
+        return container[key] if -len(container) <= key < len(container) else _MISSING
+    return _MISSING
+
+def _children(container):
+    """Yields `(key, value)` for every child of a dict, list or layout node."""
+    if isinstance(container, LayoutNode):
+        for key in list(container.raw):
+            yield key, _child(container, key)
+    elif isinstance(container, dict):
+        yield from list(container.items())
+    elif isinstance(container, list):
+        yield from enumerate(list(container))
+
+def _node_list_owner(container, owner):
+    """Returns `owner` if `container` is its list of sections or visuals, else None."""
+    if isinstance(owner, Layout) and container is owner.sections:
+        return owner
+    if isinstance(owner, Section) and container is owner.visuals:
+        return owner
+    return None
+
+def _check_node_list_key(container, key):
+    if (key == "sections" and isinstance(container, Layout)) or \
+            (key == "visualContainers" and isinstance(container, Section)):
+        raise PropertyPathError(f"Cannot replace the whole {key!r} list; write or delete its items instead")
+
+def _assign(container, key, value, owner=None):
+    if _node_list_owner(container, owner) is not None:
+        # Replacing a whole page or visual goes through the model so the raw
+        # layout, the wrappers and the indexes stay in step
+        if not isinstance(value, dict):
+            raise PropertyPathError("A section or visual container can only be replaced by an object")
+        index = key % len(container)
+        if isinstance(owner, Layout):
+            owner.remove_section(container[index])
+            owner.add_section(value, index)
+        else:
+            owner.remove_visual(container[index])
+            owner.add_visual(value, index)
+        return
+    if isinstance(container, LayoutNode):
+        _check_node_list_key(container, key)
+        if key in container.encoded_fields and isinstance(container.raw.get(key), str):
+            container.decoded(key)
+            container._decoded[key] = value
+            return
+        container = container.raw
+    container[key] = value
+
+def _remove(container, key, owner=None):
+    if _node_list_owner(container, owner) is not None:
+        if isinstance(owner, Layout):
+            owner.remove_section(container[key])
+        else:
+            owner.remove_visual(container[key])
+        return
+    if isinstance(container, LayoutNode):
+        _check_node_list_key(container, key)
+        if key in container.encoded_fields and isinstance(container.raw.get(key), str):
+            raise PropertyPathError(f"Cannot delete the encoded field {key!r} of a layout node")
+        container = container.raw
+    del container[key]
+
+def _decode_embedded(value):
+    """Decodes a string holding a JSON object or array; returns _MISSING for other values."""
+    if isinstance(value, str) and value[:1] in ("{", "["):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return _MISSING
+    return _MISSING
+
+class CompiledPath:
+    """A parsed property path that can be evaluated against many roots.
+
+    Roots may be plain JSON values or layout model nodes (`Layout`,
+    `Section`, `VisualContainer`). Traversal crosses the JSON-encoded string
+    fields Power BI uses (`config`, `filters`, `query`, ...) transparently:
+    on layout nodes via their decoded-value cache, elsewhere by decoding and
+    re-encoding the string. Writes touch the layout node that owns the
+    changed value so it is re-encoded on save; replacing or deleting a whole
+    section or visual container goes through `Layout`/`Section` so the page
+    and visual lists stay consistent with the raw document.
+
+    Example:
+        path = compile_path("config.singleVisual.vcObjects.title[*].properties.show")
+        changed = path.set_many(layout.find_visuals_by_type("barChart"), {"expr": {"Literal": {"Value": "false"}}})
+    """
+
+    def __init__(self, path: str, segments: list, absolute: bool = False):
+        self.path = path
+        self.segments = segments
+        self.absolute = absolute
+
+    def __repr__(self):
+        return f"CompiledPath({self.path!r})"
+
+    # --- Reads ---
+
+    def get(self, root) -> list:
+        """Returns every value the path matches under `root` (empty if none)."""
+        found = []
+        self._collect(root, 0, found)
+        return found
+
+    def get_one(self, root, default=None):
+        """Returns the first match under `root`, or `default`."""
+        found = self.get(root)
+        return found[0] if found else default
+
+    def get_many(self, roots) -> list:
+        """Returns the matches under each root, flattened in order."""
+        found = []
+        for root in roots:
+            self._collect(root, 0, found)
+        return found
+
+    def _collect(self, current, index: int, found: list):
+        if index == len(self.segments):
+            found.append(current)
+            return
+        for _, child in self._step(current, self.segments[index]):
+            if child is _MISSING:
+                continue
+            if index + 1 < len(self.segments) and not isinstance(child, (dict, list, LayoutNode)):
+                child = _decode_embedded(child)
+                if child is _MISSING:
+                    continue
+            self._collect(child, index + 1, found)
+
+    def _step(self, current, segment):
+        """Yields `(key, child)` for the children of `current` selected by one segment."""
+        if isinstance(segment, _Key):
+            yield segment.name, _child(current, segment.name)
+        elif isinstance(segment, _Index):
+            yield segment.index, _child(current, segment.index)
+        elif isinstance(segment, _Wildcard):
+            yield from _children(current)
+        else:
+            for key, child in _children(current):
+                if segment.matches(child):
+                    yield key, child
+
+    # --- Writes ---
+
+    def set(self, root, value, create: bool = True, before_write=None) -> int:
+        """Sets every match under `root` to `value`.
+
+        Args:
+            root: A JSON value or layout node.
+            value: The new value; each match receives its own deep copy.
+            create: Create missing dictionary keys along the path (list
+                indexes, wildcards and filters never create anything).
+            before_write: Called with each layout node just before the first
+                change to it (e.g. `Layout.checkpoint` inside a transaction).
+
+        Returns:
+            The number of values set.
+        """
+        return self.set_many([root], value, create, before_write)
+
+    def set_many(self, roots, value, create: bool = True, before_write=None) -> int:
+        """Sets the path to `value` under each root in one sweep; returns the number of values set."""
+        encoded = json.dumps(value) # Copy per match so matches never share mutable state
+        return self._write_many(roots, lambda container, key, owner: _assign(container, key, json.loads(encoded), owner),
+                                create, before_write)
+
+    def delete(self, root, before_write=None) -> int:
+        """Deletes every match under `root`; returns the number of values removed."""
+        return self.delete_many([root], before_write)
+
+    def delete_many(self, roots, before_write=None) -> int:
+        """Deletes the path under each root in one sweep; returns the number of values removed."""
+        if isinstance(self.segments[-1], (_Wildcard, _Filter)):
+            raise PropertyPathError(f"Delete paths must end with a key or index: {self.path}")
+        return self._write_many(roots, _remove, False, before_write)
+
+    def _write_many(self, roots, write, create: bool, before_write) -> int:
+        if not self.segments:
+            raise PropertyPathError("Cannot write to the root of a property path")
+        touched: dict[int, LayoutNode] = {}
+        count = 0
+        for root in roots:
+            owner = root if isinstance(root, LayoutNode) else None
+            count += self._write(root, 0, write, create, owner, touched, before_write)
+        reindex = set()
+        for node in touched.values():
+            node.touch()
+            if isinstance(node.layout, Layout):
+                node.layout.invalidate_visual_index() # A name, title or type may have changed
+                if isinstance(node, Section):
+                    reindex.add(id(node.layout)) # ...and so may a page name
+        for node in touched.values():
+            if id(node.layout) in reindex:
+                reindex.discard(id(node.layout))
+                node.layout.reindex_sections()
+        return count
+
+    def _write(self, current, index: int, write, create: bool, owner, touched: dict, before_write) -> int:
+        if isinstance(current, LayoutNode):
+            owner = current
+        segment = self.segments[index]
+        last = index == len(self.segments) - 1
+        count = 0
+        for key, child in list(self._step(current, segment)):
+            if last:
+                if child is _MISSING and not (create and isinstance(segment, _Key) and self._writable(current)):
+                    continue
+                self._before_change(owner, touched, before_write)
+                write(current, key, owner)
+                count += 1
+                continue
+
+            if child is _MISSING:
+                if not (create and isinstance(segment, _Key) and self._writable(current)
+                        and isinstance(self.segments[index + 1], _Key)):
+                    continue
+                self._before_change(owner, touched, before_write)
+                child = {}
+                _assign(current, key, child)
+                child = _child(current, key)
+
+            if isinstance(child, (dict, list, LayoutNode)):
+                count += self._write(child, index + 1, write, create, owner, touched, before_write)
+                continue
+
+            # A JSON document encoded as a string outside the layout model: decode, write, re-encode
+            decoded = _decode_embedded(child)
+            if decoded is _MISSING:
+                continue
+            changed = self._write(decoded, index + 1, write, create, owner, touched, before_write)
+            if changed:
+                self._before_change(owner, touched, before_write)
+                _assign(current, key, encode_nested_json(decoded))
+                count += changed
+        return count
+
+    @staticmethod
+    def _writable(container) -> bool:
+        return isinstance(container, (dict, LayoutNode))
+
+    @staticmethod
+    def _before_change(owner, touched: dict, before_write):
+        if owner is None or id(owner) in touched:
+            return
+        if before_write is not None:
+            before_write(owner)
+        touched[id(owner)] = owner
+
+# --- Convenience functions ---
+
+def get_path(root, path: str) -> list:
+    """Returns every value matched by `path` under `root`."""
+    return compile_path(path).get(root)
+
+def set_path(root, path: str, value, create: bool = True) -> int:
+    """Sets every value matched by `path` under `root`; returns how many were set."""
+    return compile_path(path).set(root, value, create)
+
+def delete_path(root, path: str) -> int:
+    """Deletes every value matched by `path` under `root`; returns how many were removed."""
+    return compile_path(path).delete(root)
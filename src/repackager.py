@@ -0,0 +1,188 @@
+
+import zipfile
+import os
+import stat
+import struct
+import tempfile
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+COPY_CHUNK_SIZE = 1024 * 1024
+SUPPORTED_COMPRESSION = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED, zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA)
+
+_DATA_DESCRIPTOR_FLAG = 0x08
+_ZIP64_EXTRA_ID = 0x0001
+
+def _strip_zip64_extra(extra: bytes) -> bytes:
+    """Removes any ZIP64 extra record; zipfile re-adds one when the sizes need it."""
+    kept = []
+    i = 0
+    while i + 4 <= len(extra):
+        header_id, size = struct.unpack("<HH", extra[i:i + 4])
+        if header_id != _ZIP64_EXTRA_ID:
+            kept.append(extra[i:i + 4 + size])
+        i += 4 + size
+    return b"".join(kept)
+
+def _clone_info(info: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    """Copies the metadata of a source member into a fresh ZipInfo for the output."""
+    clone = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    clone.compress_type = info.compress_type
+    clone.comment = info.comment
+    clone.extra = _strip_zip64_extra(info.extra)
+    clone.create_system = info.create_system
+    clone.create_version = info.create_version
+    clone.extract_version = info.extract_version
+    clone.internal_attr = info.internal_attr
+    clone.external_attr = info.external_attr
+    # Sizes and CRC go into the local header, so no trailing data descriptor is needed
+    clone.flag_bits = info.flag_bits & ~_DATA_DESCRIPTOR_FLAG
+    return clone
+
+def _member_data_offset(source_fh, info: zipfile.ZipInfo) -> int:
+    """Returns the offset of a member's compressed bytes from its local file header."""
+    source_fh.seek(info.header_offset)
+    header = source_fh.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader:
+        raise zipfile.BadZipFile(f"Truncated local header for member {info.filename}")
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    if fields[0] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad magic number for local header of member {info.filename}")
+    filename_length, extra_length = fields[10], fields[11]
+    return info.header_offset + zipfile.sizeFileHeader + filename_length + extra_length
+
+def _copy_raw_member(source_fh, zout: zipfile.ZipFile, info: zipfile.ZipInfo):
+    """Copies a member's compressed bytes into `zout` without decompressing them."""
+    data_offset = _member_data_offset(source_fh, info)
+    target_info = _clone_info(info)
+    target_info.CRC = info.CRC
+    target_info.compress_size = info.compress_size
+    target_info.file_size = info.file_size
+
+    target_info.header_offset = zout.fp.tell()
+    zout.fp.write(target_info.FileHeader())
+
+    source_fh.seek(data_offset)
+    remaining = info.compress_size
+    while remaining:
+        chunk = source_fh.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated data for member {info.filename}")
+        zout.fp.write(chunk)
+        remaining -= len(chunk)
+
+    # Register the member so ZipFile.close() writes it into the central directory
+    zout.filelist.append(target_info)
+    zout.NameToInfo[target_info.filename] = target_info
+    zout.start_dir = zout.fp.tell()
+
+# Read once at import: os.umask can only be queried by setting it, which is not thread-safe later on
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+def _output_mode(pbix_output_path: str) -> int:
+    """Permission bits for the output: those of the file being replaced, else what `open()` would use."""
+    try:
+        return stat.S_IMODE(os.stat(pbix_output_path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+def repackage_pbix(source_pbix_path: str, pbix_output_path: str, modified_members: dict[str, bytes] | None = None) -> dict:
+    """Rebuilds a PBIX from its source archive plus a set of modified members.
+
+    Untouched members (DataModel, StaticResources, [Content_Types].xml, ...)
+    are copied as raw compressed bytes, so they are never inflated or
+    recompressed. Modified members keep their original position, timestamp
+    and compression method. Members in `modified_members` that do not exist
+    in the source are appended. The output is written to a temporary file in
+    the destination directory and moved into place only once it is complete,
+    so readers never observe a partially written PBIX.
+
+    Args:
+        source_pbix_path: The path to the original .pbix file.
+        pbix_output_path: The path where the rebuilt .pbix should be written.
+            May be the same as the source path.
+        modified_members: Member name to new (uncompressed) contents.
+
+    Returns:
+        A dictionary with the number of members copied raw, rewritten and
+        added, the bytes copied raw and compressed, and the output size.
+
+    Raises:
+        FileNotFoundError: If the source PBIX does not exist.
+        zipfile.BadZipFile: If the source archive is corrupted.
+    """
+    modified_members = modified_members or {}
+    if not os.path.exists(source_pbix_path):
+        logging.error(f"PBIX file not found: {source_pbix_path}")
+        raise FileNotFoundError(f"PBIX file not found: {source_pbix_path}")
+
+    output_dir = os.path.dirname(os.path.abspath(pbix_output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".pbix_", suffix=".tmp", dir=output_dir)
+    stats = {"copied_raw": 0, "rewritten": 0, "added": 0, "bytes_copied_raw": 0, "bytes_compressed": 0,
+             "bytes_written": 0}
+
+    try:
+        with os.fdopen(fd, "w+b") as out_fh, \
+                open(source_pbix_path, "rb") as source_fh, \
+                zipfile.ZipFile(source_pbix_path, "r") as zin, \
+                zipfile.ZipFile(out_fh, "w") as zout:
+            for info in zin.infolist():
+                if info.filename in modified_members:
+                    target_info = _clone_info(info)
+                    if target_info.compress_type not in SUPPORTED_COMPRESSION:
+                        target_info.compress_type = zipfile.ZIP_DEFLATED
+                    zout.writestr(target_info, modified_members[info.filename])
+                    stats["rewritten"] += 1
+                    stats["bytes_compressed"] += len(modified_members[info.filename])
+                else:
+                    _copy_raw_member(source_fh, zout, info)
+                    stats["copied_raw"] += 1
+                    stats["bytes_copied_raw"] += info.compress_size
+
+            for name, data in modified_members.items():
+                if name not in zin.NameToInfo:
+                    zout.writestr(name, data, compress_type=zipfile.ZIP_DEFLATED)
+                    stats["added"] += 1
+                    stats["bytes_compressed"] += len(data)
+
+            zout.close()
+            stats["bytes_written"] = out_fh.tell()
+            out_fh.flush()
+            os.fsync(out_fh.fileno())
+
+        os.chmod(temp_path, _output_mode(pbix_output_path)) # mkstemp creates the file as 0600
+        os.replace(temp_path, pbix_output_path)
+    except Exception as e:
+        logging.error(f"Failed to repackage {source_pbix_path} into {pbix_output_path}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    logging.info(f"Repackaged PBIX written to {pbix_output_path} "
+                 f"({stats['copied_raw']} copied raw, {stats['rewritten']} rewritten, {stats['added']} added)")
+    return stats
+
+# Example usage (can be run as a script)
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild a PBIX, replacing selected members with files from disk.")
+    parser.add_argument("--input", required=True, help="Path to the source PBIX file.")
+    parser.add_argument("--output", required=True, help="Path to write the rebuilt PBIX file.")
+    parser.add_argument("--replace", nargs=2, action="append", default=[], metavar=("MEMBER", "FILE"),
+                        help="Replace archive MEMBER with the contents of FILE (repeatable).")
+
+    args = parser.parse_args()
+
+    try:
+        replacements = {}
+        for member, file_path in args.replace:
+            with open(file_path, "rb") as f:
+                replacements[member] = f.read()
+        repackage_pbix(args.input, args.output, replacements)
+    except Exception as e:
+        logging.error(f"Repackaging failed: {e}")
+        exit(1)
@@ -0,0 +1,162 @@
+
+import json
+import logging
+
+from src.json_stream import JsonStreamReader
+from src.layout import Layout, query_fields
+from src.pbix_package import PbixPackage
+from src.parse_cache import ParseCache
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DATA_MODEL_SCHEMA_PATH = "DataModelSchema"
+DATA_MODEL_PATH = "DataModel"
+SCHEMA_CACHE_KIND = "schema-1" # Bump when the schema format changes
+
+# Tables Power BI generates for auto date/time; they only add noise to the summary
+AUTO_DATE_TABLE_PREFIXES = ("LocalDateTable_", "DateTableTemplate_")
+
+def _read_columns(reader: JsonStreamReader) -> list[str]:
+    columns = []
+    for _ in reader.iter_array():
+        name, column_type = None, None
+        for key in reader.iter_object():
+            if key == "name":
+                name = reader.read_value()
+            elif key == "type":
+                column_type = reader.read_value()
+            else:
+                reader.skip_value()
+        if name and column_type != "rowNumber":
+            columns.append(name)
+    return columns
+
+def _read_measures(reader: JsonStreamReader) -> list[str]:
+    measures = []
+    for _ in reader.iter_array():
+        for key in reader.iter_object():
+            if key == "name":
+                measures.append(reader.read_value())
+            else:
+                reader.skip_value() # Expressions, format strings, annotations
+    return measures
+
+def _read_tables(reader: JsonStreamReader) -> list[dict]:
+    tables = []
+    for _ in reader.iter_array():
+        table = {"name": None, "columns": [], "measures": []}
+        for key in reader.iter_object():
+            if key == "name":
+                table["name"] = reader.read_value()
+            elif key == "columns":
+                table["columns"] = _read_columns(reader)
+            elif key == "measures":
+                table["measures"] = _read_measures(reader)
+            else:
+                reader.skip_value() # Partitions (M queries), hierarchies, annotations
+        if table["name"] and not table["name"].startswith(AUTO_DATE_TABLE_PREFIXES):
+            tables.append(table)
+    return tables
+
+def read_data_model_schema(stream) -> dict:
+    """Streams table, column and measure names out of a DataModelSchema document.
+
+    The document is walked with `JsonStreamReader`, so only one column or
+    measure object is held in memory at a time; partitions, annotations and
+    other large values are skipped without being materialized.
+
+    Args:
+        stream: A binary stream of the DataModelSchema member (UTF-16 or UTF-8 JSON).
+
+    Returns:
+        `{"tables": [{"name", "columns", "measures"}], "source": "DataModelSchema", "complete": True}`.
+    """
+    reader = JsonStreamReader(stream)
+    tables = []
+    for key in reader.iter_object():
+        if key != "model":
+            reader.skip_value()
+            continue
+        for model_key in reader.iter_object():
+            if model_key == "tables":
+                tables = _read_tables(reader)
+            else:
+                reader.skip_value()
+    return {"tables": tables, "source": DATA_MODEL_SCHEMA_PATH, "complete": True}
+
+def schema_from_layout(layout: Layout) -> dict:
+    """Derives the tables, columns and measures a report's visuals reference.
+
+    Used when the model metadata is not readable: only fields bound to
+    visuals appear, so the result is marked incomplete. Measures are told
+    apart from columns by their prototype query expression kind.
+    """
+    tables: dict[str, dict] = {}
+    for visual in layout.iter_visuals():
+        try:
+            query = visual.config.get("singleVisual", {}).get("prototypeQuery") or {}
+        except json.JSONDecodeError:
+            continue
+        for ref, kind in query_fields(query):
+            table_name, _, field = ref.partition(".")
+            table = tables.setdefault(table_name, {"name": table_name, "columns": [], "measures": []})
+            fields = table["measures" if kind == "measure" else "columns"]
+            if field not in fields:
+                fields.append(field)
+    return {"tables": list(tables.values()), "source": "layout", "complete": False}
+
+def read_model_schema(package: PbixPackage, layout: Layout | None = None,
+                      cache: ParseCache | None = None) -> dict | None:
+    """Reads the data model schema of a PBIX without inflating the VertiPaq payload.
+
+    Reports saved with a `DataModelSchema` member (templates, live-connected
+    and thin reports) are streamed with bounded memory. Imported models keep
+    their metadata inside the XPress9-compressed `DataModel` backup, which
+    this reader never decompresses (there is no Python XPress9 decoder and
+    the blob can be gigabytes); for those the schema falls back to the
+    fields referenced by the report's visuals when `layout` is given.
+
+    Args:
+        package: The open PBIX package.
+        layout: The parsed layout, used for the fallback.
+        cache: Parse cache; DataModelSchema results are cached by the
+            member's CRC/size fingerprint.
+
+    Returns:
+        The schema dictionary (see `read_data_model_schema`), or None if
+        neither source is available.
+    """
+    if package.has_member(DATA_MODEL_SCHEMA_PATH):
+        fingerprint = package.member_fingerprint(DATA_MODEL_SCHEMA_PATH)
+        if cache is not None:
+            schema = cache.get(SCHEMA_CACHE_KIND, fingerprint)
+            if schema is not None:
+                return schema
+        try:
+            with package.open_member(DATA_MODEL_SCHEMA_PATH) as stream:
+                schema = read_data_model_schema(stream)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            logging.warning(f"Could not read {DATA_MODEL_SCHEMA_PATH} from {package.path}: {e}")
+        else:
+            logging.info(f"Read {len(schema['tables'])} table(s) from {DATA_MODEL_SCHEMA_PATH}")
+            if cache is not None:
+                cache.put(SCHEMA_CACHE_KIND, fingerprint, schema)
+            return schema
+
+    if layout is None:
+        return None
+    if package.has_member(DATA_MODEL_PATH):
+        logging.info("DataModel is XPress9-compressed; deriving schema from fields used by visuals.")
+    return schema_from_layout(layout)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print the tables, columns and measures of a PBIX data model.")
+    parser.add_argument("--input", required=True, help="Path to the PBIX (or PBIT) file.")
+
+    args = parser.parse_args()
+
+    with PbixPackage(args.input) as package:
+        schema = read_model_schema(package, package.read_layout_document())
+    print(json.dumps(schema, indent=2, ensure_ascii=False))
@@ -0,0 +1,500 @@
+
+import os
+import json
+import math
+import time
+import hmac
+import uuid
+import queue
+import secrets
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from src import ai_handler
+from src.metrics import PipelineMetrics
+from src.parse_cache import get_default_parse_cache
+from src.transformer import process_pbix_edit_requests
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+FINISHED_STATES = ("done", "failed", "timed_out", "cancelled")
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity; clients should retry later."""
+
+class PathNotAllowedError(ValueError):
+    """Raised when a job names a file outside the service's allowed root."""
+
+def token_from_env() -> str:
+    """Returns the API token from PBIX_SERVICE_TOKEN, or a fresh random one if unset."""
+    return os.getenv("PBIX_SERVICE_TOKEN") or secrets.token_urlsafe(32)
+
+def allowed_root_from_env() -> str:
+    """Returns the directory jobs may read and write (PBIX_SERVICE_ROOT, default: the working directory)."""
+    return os.getenv("PBIX_SERVICE_ROOT") or os.getcwd()
+
+class Job:
+    """One queued transform: input/output paths plus the requests to apply.
+
+    Every state change is appended to `events`, which `wait_for_events`
+    hands out incrementally so clients can stream progress.
+    """
+
+    def __init__(self, input_path: str, output_path: str | None, requests: list[str], timeout: float,
+                 bypass_cache: bool = False, patch_path: str | None = None):
+        self.id = uuid.uuid4().hex
+        self.input = input_path
+        self.output = output_path
+        self.patch = patch_path
+        self.requests = requests
+        self.timeout = timeout
+        self.bypass_cache = bypass_cache
+        self.status = "queued"
+        self.stage = None
+        self.created = time.time()
+        self.started: float | None = None
+        self.finished: float | None = None
+        self.results: list[dict] | None = None
+        self.error: str | None = None
+        self.metrics: dict | None = None
+        self.events: list[dict] = []
+        self._condition = threading.Condition()
+        self._emit()
+
+    def _emit(self):
+        self.events.append({"seq": len(self.events), "time": time.time(), "status": self.status, "stage": self.stage})
+
+    def update(self, **fields):
+        with self._condition:
+            for key, value in fields.items():
+                setattr(self, key, value)
+            self._emit()
+            self._condition.notify_all()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def wait_for_events(self, after: int, timeout: float | None = None) -> list[dict]:
+        """Returns events with `seq >= after`, blocking up to `timeout` seconds for new ones."""
+        with self._condition:
+            if len(self.events) <= after and not self.done:
+                self._condition.wait(timeout)
+            return self.events[after:]
+
+    def wait(self, timeout: float | None = None) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: self.done, timeout)
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "status": self.status, "stage": self.stage, "input": self.input,
+                "output": self.output, "patch": self.patch, "requests": self.requests, "created": self.created,
+                "started": self.started, "finished": self.finished, "results": self.results,
+                "error": self.error, "metrics": self.metrics}
+
+class _JobMetrics(PipelineMetrics):
+    """Pipeline metrics that also publish each stage to the job's event stream."""
+
+    def __init__(self, job: Job):
+        super().__init__()
+        self.job = job
+
+    @contextmanager
+    def stage(self, name: str):
+        self.job.update(stage=name)
+        with super().stage(name) as entry:
+            yield entry
+
+class TransformService:
+    """Long-running transform worker pool with warm state.
+
+    The AI client, instruction cache and parse cache are created once and
+    shared by every job; AI calls from all workers run on one background
+    event loop, so the client's concurrency and rate limits apply across
+    jobs. Jobs wait in a bounded queue (submitting to a full queue raises
+    `QueueFullError`) and each job runs under a deadline that is enforced
+    between pipeline stages and while waiting for the AI; an overdue job is
+    reported as `timed_out` and never writes its output.
+
+    With `allowed_root` set, every input, output and patch path is resolved
+    (following symlinks) and must lie inside that directory.
+
+    Example:
+        service = TransformService(workers=4, queue_size=32, job_timeout=120)
+        service.start()
+        job = service.submit("in.pbix", "out.pbix", ["Change the title of Sales Chart to Revenue"])
+        job.wait()
+    """
+
+    def __init__(self, workers: int = 4, queue_size: int = 64, job_timeout: float = 300.0, history: int = 1000,
+                 allowed_root: str | None = None):
+        self.workers = workers
+        self.job_timeout = job_timeout
+        self.history = history
+        self.allowed_root = os.path.realpath(allowed_root) if allowed_root else None
+        self._queue: "queue.Queue[Job | None]" = queue.Queue(maxsize=queue_size)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._jobs_lock = threading.Lock() # Also guards `_running` and `counters`, which workers update
+        self._threads: list[threading.Thread] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._running = 0
+        self.counters = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0, "timed_out": 0, "cancelled": 0}
+
+    # --- Lifecycle ---
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        loop_thread = threading.Thread(target=self._loop.run_forever, name="ai-event-loop", daemon=True)
+        loop_thread.start()
+        self._threads.append(loop_thread)
+        ai_handler.use_event_loop(self._loop)
+
+        # Warm everything a job would otherwise build on first use
+        ai_handler.get_default_client()
+        ai_handler.get_default_cache()
+        get_default_parse_cache()
+
+        for index in range(self.workers):
+            worker = threading.Thread(target=self._work, name=f"transform-worker-{index}", daemon=True)
+            worker.start()
+            self._threads.append(worker)
+        logging.info(f"Transform service started with {self.workers} worker(s), queue size {self._queue.maxsize}")
+
+    def shutdown(self, wait: bool = True):
+        """Stops accepting work, lets running jobs finish and stops the event loop."""
+        for _ in range(self.workers):
+            self._queue.put(None) # Queued jobs ahead of the sentinels still run
+        if wait:
+            for thread in self._threads[1:]:
+                thread.join()
+        ai_handler.use_event_loop(None)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    # --- Jobs ---
+
+    def _count(self, name: str, delta: int = 1):
+        with self._jobs_lock:
+            self.counters[name] += delta
+
+    def _resolve_path(self, path: str | None) -> str | None:
+        if path is None or self.allowed_root is None:
+            return path
+        if not isinstance(path, str):
+            raise ValueError(f"Paths must be strings, got {type(path).__name__}")
+        resolved = os.path.realpath(os.path.join(self.allowed_root, path))
+        if resolved != self.allowed_root and not resolved.startswith(self.allowed_root + os.sep):
+            raise PathNotAllowedError(f"Path {path!r} is outside the allowed root")
+        return resolved
+
+    def submit(self, input_path: str, output_path: str | None, requests: list[str], timeout: float | None = None,
+               bypass_cache: bool = False, patch_path: str | None = None) -> Job:
+        """Queues a job.
+
+        Relative paths are taken relative to `allowed_root` when one is set.
+
+        Raises:
+            ValueError: If the job is malformed (including a `timeout` that is
+                not a positive number).
+            PathNotAllowedError: If a path resolves outside `allowed_root`.
+            QueueFullError: If the queue is at capacity.
+        """
+        if not input_path or not (output_path or patch_path) or not requests:
+            raise ValueError("A job needs 'input', 'output' and/or 'patch', and at least one request")
+        if not all(isinstance(request, str) and request.strip() for request in requests):
+            raise ValueError("Requests must be non-empty strings")
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float))
+                                    or not math.isfinite(timeout) or timeout <= 0):
+            raise ValueError(f"'timeout' must be a positive number of seconds, got {timeout!r}")
+        input_path, output_path, patch_path = (self._resolve_path(path) for path in (input_path, output_path, patch_path))
+        job = Job(input_path, output_path, requests, timeout or self.job_timeout, bypass_cache, patch_path)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._count("rejected")
+            raise QueueFullError(f"Job queue is full ({self._queue.maxsize} jobs waiting)") from None
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if not oldest.done:
+                    break
+                del self._jobs[oldest_id]
+            self.counters["submitted"] += 1
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancels a job that has not started yet."""
+        job = self.get(job_id)
+        if job is None or job.status != "queued":
+            return False
+        job.update(status="cancelled", finished=time.time())
+        self._count("cancelled")
+        return True
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if job.status == "cancelled":
+                continue
+            with self._jobs_lock:
+                self._running += 1
+            try:
+                self._run(job)
+            finally:
+                with self._jobs_lock:
+                    self._running -= 1
+
+    def _run(self, job: Job):
+        started = time.monotonic()
+        job.update(status="running", started=time.time())
+        metrics = _JobMetrics(job)
+        try:
+            results = process_pbix_edit_requests(job.input, job.output, job.requests, bypass_cache=job.bypass_cache,
+                                                 metrics=metrics, deadline=started + job.timeout, patch_path=job.patch)
+        except TimeoutError as e:
+            self._count("timed_out")
+            job.update(status="timed_out", error=str(e), metrics=metrics.to_dict(), finished=time.time())
+        except Exception as e:
+            self._count("failed")
+            job.update(status="failed", error=str(e), metrics=metrics.to_dict(), finished=time.time())
+        else:
+            status = "done" if any(result["status"] == "ok" for result in results) else "failed"
+            self._count(status)
+            job.update(status=status, results=results, metrics=metrics.to_dict(), finished=time.time())
+        logging.info(f"Job {job.id} {job.status} in {time.monotonic() - started:.3f}s")
+
+    def health(self) -> dict:
+        cache = ai_handler.get_default_cache()
+        parse_cache = get_default_parse_cache()
+        with self._jobs_lock:
+            running, counters = self._running, dict(self.counters)
+        return {
+            "status": "ok",
+            "workers": self.workers,
+            "running": running,
+            "queued": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "jobs": counters,
+            "ai_cache": cache.stats() if cache is not None else None,
+            "parse_cache": parse_cache.stats() if parse_cache is not None else None,
+        }
+
+# --- HTTP front end ---
+
+class TransformRequestHandler(BaseHTTPRequestHandler):
+    """JSON-over-HTTP API for `TransformService`.
+
+    - `POST /jobs` with `{"input", "output" and/or "patch", "requests" | "request", "timeout"?, "no_cache"?}`
+      queues a job (202), or answers 429 with `Retry-After` when the queue is
+      full. Add `?wait=1` to block until the job finishes and get its result.
+    - `GET /jobs/<id>` returns the job's state and results.
+    - `GET /jobs/<id>/events` streams state changes as newline-delimited JSON
+      until the job finishes.
+    - `DELETE /jobs/<id>` cancels a job that is still queued.
+    - `GET /health` reports queue depth, job counters and cache statistics.
+
+    Every request must carry `Authorization: Bearer <token>` and a `Host`
+    (and `Origin`, if sent) naming this server, which blocks cross-site
+    requests and DNS rebinding from a browser; `POST` bodies must be
+    `application/json`.
+    """
+
+    server_version = "PbixTransformService/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self) -> TransformService:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status: int, payload: dict, headers: dict | None = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorize(self) -> bool:
+        """Checks the Host/Origin headers and the bearer token, answering 403/401 on failure."""
+        allowed_hosts = self.server.allowed_hosts
+        host = urlparse(f"//{self.headers.get('Host', '')}").hostname
+        if host not in allowed_hosts:
+            self._send_json(403, {"error": "Unexpected Host header"})
+            return False
+        origin = self.headers.get("Origin")
+        if origin is not None and urlparse(origin).hostname not in allowed_hosts:
+            self._send_json(403, {"error": "Cross-origin requests are not allowed"})
+            return False
+        scheme, _, token = self.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode("utf-8"),
+                                                                 self.server.token.encode("utf-8")):
+            self._send_json(401, {"error": "Missing or invalid bearer token"}, headers={"WWW-Authenticate": "Bearer"})
+            return False
+        return True
+
+    def _job_from_path(self, path: str) -> Job | None:
+        parts = path.strip("/").split("/")
+        job = self.service.get(parts[1]) if len(parts) >= 2 and parts[0] == "jobs" else None
+        if job is None:
+            self._send_json(404, {"error": "Job not found"})
+        return job
+
+    def do_GET(self):
+        if not self._authorize():
+            return
+        url = urlparse(self.path)
+        if url.path == "/health":
+            self._send_json(200, self.service.health())
+            return
+        if url.path.startswith("/jobs/"):
+            job = self._job_from_path(url.path)
+            if job is None:
+                return
+            if url.path.rstrip("/").endswith("/events"):
+                self._stream_events(job)
+            else:
+                self._send_json(200, job.to_dict())
+            return
+        self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if not self._authorize():
+            return
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            self._send_json(404, {"error": "Not found"})
+            return
+        if self.headers.get("Content-Type", "").split(";")[0].strip().lower() != "application/json":
+            self._send_json(415, {"error": "Content-Type must be application/json"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            spec = json.loads(self.rfile.read(length) or b"{}")
+            requests = spec.get("requests") or ([spec["request"]] if spec.get("request") else [])
+            job = self.service.submit(spec.get("input"), spec.get("output"), requests, timeout=spec.get("timeout"),
+                                      bypass_cache=bool(spec.get("no_cache")), patch_path=spec.get("patch"))
+        except QueueFullError as e:
+            self._send_json(429, {"error": str(e)}, headers={"Retry-After": "1"})
+            return
+        except PathNotAllowedError as e:
+            self._send_json(403, {"error": str(e)})
+            return
+        except (ValueError, AttributeError, TypeError) as e:
+            self._send_json(400, {"error": f"Invalid job: {e}"})
+            return
+
+        if parse_qs(url.query).get("wait", ["0"])[0] not in ("0", "false", ""):
+            job.wait(job.timeout + 5)
+            self._send_json(200, job.to_dict())
+        else:
+            self._send_json(202, {"id": job.id, "status": job.status}, headers={"Location": f"/jobs/{job.id}"})
+
+    def do_DELETE(self):
+        if not self._authorize():
+            return
+        job = self._job_from_path(urlparse(self.path).path)
+        if job is None:
+            return
+        if self.service.cancel(job.id):
+            self._send_json(200, job.to_dict())
+        else:
+            self._send_json(409, {"error": f"Job is {job.status} and can no longer be cancelled"})
+
+    def _stream_events(self, job: Job):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_chunk(data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        seen = 0
+        try:
+            while True:
+                events = job.wait_for_events(seen, timeout=15)
+                for event in events:
+                    write_chunk((json.dumps(event) + "\n").encode("utf-8"))
+                seen += len(events)
+                if job.done and seen >= len(job.events):
+                    write_chunk((json.dumps({"final": job.to_dict()}) + "\n").encode("utf-8"))
+                    break
+                if not events:
+                    write_chunk(b"\n") # Keep-alive while a stage runs
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            logging.debug(f"Event stream for job {job.id} closed by client")
+
+def make_server(service: TransformService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                token: str | None = None, allowed_hosts: list[str] | None = None) -> ThreadingHTTPServer:
+    """Creates (but does not start) the HTTP server for a started service.
+
+    Args:
+        service: The started service.
+        host: Interface to bind.
+        port: Port to listen on (0 picks a free one).
+        token: Bearer token clients must send (see `token_from_env`).
+        allowed_hosts: Host names accepted in `Host`/`Origin` headers, in
+            addition to the loopback names and `host`.
+    """
+    server = ThreadingHTTPServer((host, port), TransformRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.token = token or token_from_env()
+    server.allowed_hosts = {*LOCAL_HOSTS, host, *(allowed_hosts or [])}
+    return server
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the PBIX transformer as a long-lived local HTTP service.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Interface to bind (default: localhost only).")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PBIX_SERVICE_PORT", DEFAULT_PORT)), help="Port to listen on.")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent transform jobs.")
+    parser.add_argument("--queue-size", type=int, default=64, help="Jobs allowed to wait before submissions get 429.")
+    parser.add_argument("--job-timeout", type=float, default=300.0, help="Default per-job timeout in seconds.")
+    parser.add_argument("--allowed-root", default=allowed_root_from_env(),
+                        help="Directory jobs may read and write (env PBIX_SERVICE_ROOT; default: working directory).")
+    parser.add_argument("--allowed-host", action="append", dest="allowed_hosts",
+                        help="Extra host name accepted in Host/Origin headers (repeatable).")
+
+    args = parser.parse_args()
+
+    token = os.getenv("PBIX_SERVICE_TOKEN")
+    if not token:
+        token = token_from_env()
+        logging.info(f"PBIX_SERVICE_TOKEN not set; generated API token: {token}")
+
+    transform_service = TransformService(workers=args.workers, queue_size=args.queue_size, job_timeout=args.job_timeout,
+                                         allowed_root=args.allowed_root)
+    transform_service.start()
+    http_server = make_server(transform_service, args.host, args.port, token=token, allowed_hosts=args.allowed_hosts)
+    logging.info(f"Listening on http://{args.host}:{http_server.server_port} (jobs limited to {transform_service.allowed_root})")
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down...")
+    finally:
+        http_server.server_close()
+        transform_service.shutdown()
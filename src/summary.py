@@ -0,0 +1,201 @@
+
+import re
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from src.layout import Layout
+from src.parse_cache import ParseCache
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DEFAULT_MAX_BYTES = 8000 # Roughly 2k prompt tokens
+BYTES_PER_TOKEN = 4
+VISUAL_COLUMNS = ["name", "type", "title", "fields"]
+INVENTORY_CACHE_SIZE = 32
+INVENTORY_CACHE_KIND = "inventory-1" # Bump when the inventory format changes
+
+_inventory_cache: "OrderedDict[str, dict]" = OrderedDict()
+_inventory_lock = threading.Lock() # Worker threads of the transform service share the cache
+
+def _compact(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+def _words(text: str | None) -> set[str]:
+    return set(re.findall(r"[a-z0-9]+", (text or "").lower()))
+
+def _remember_inventory(cache_key: str, inventory: dict):
+    with _inventory_lock:
+        _inventory_cache[cache_key] = inventory
+        if len(_inventory_cache) > INVENTORY_CACHE_SIZE:
+            _inventory_cache.popitem(last=False)
+
+def _recall_inventory(cache_key: str) -> dict | None:
+    with _inventory_lock:
+        inventory = _inventory_cache.get(cache_key)
+        if inventory is not None:
+            _inventory_cache.move_to_end(cache_key)
+        return inventory
+
+def build_layout_inventory(layout: Layout, cache_key: str | None = None,
+                           parse_cache: ParseCache | None = None) -> dict:
+    """Walks the layout once and collects pages, visuals, titles and bound fields.
+
+    The inventory is independent of any request, so it is cached under
+    `cache_key` (e.g. the Layout member's CRC/size fingerprint) and reused
+    for every request against the same file, in memory and, when
+    `parse_cache` is given, across runs.
+    """
+    if cache_key:
+        inventory = _recall_inventory(cache_key)
+        if inventory is not None:
+            return inventory
+    if cache_key and parse_cache is not None:
+        inventory = parse_cache.get(INVENTORY_CACHE_KIND, cache_key)
+        if inventory is not None:
+            _remember_inventory(cache_key, inventory)
+            return inventory
+
+    pages = []
+    tables: dict[str, list[str]] = {}
+    for section in layout.sections:
+        visuals = []
+        for visual in section.visuals:
+            try:
+                fields = visual.bound_fields
+                visuals.append([visual.name, visual.visual_type, visual.title, fields])
+            except (json.JSONDecodeError, AttributeError) as e:
+                logging.warning(f"Skipping visual with unreadable config on {section.display_name}: {e}")
+                continue
+            for field in fields:
+                table, _, column = field.partition(".")
+                columns = tables.setdefault(table, [])
+                if column not in columns:
+                    columns.append(column)
+        pages.append({"name": section.name, "title": section.display_name, "visuals": visuals})
+
+    inventory = {"pages": pages, "tables": tables}
+    if cache_key:
+        _remember_inventory(cache_key, inventory)
+        if parse_cache is not None:
+            parse_cache.put(INVENTORY_CACHE_KIND, cache_key, inventory)
+    return inventory
+
+def _merge_schema(tables: dict[str, list[str]], schema: dict | None) -> dict[str, dict]:
+    """Combines layout-bound fields with data model tables/columns/measures."""
+    merged = {name: {"columns": list(columns)} for name, columns in tables.items()}
+    for table in (schema or {}).get("tables", []):
+        entry = merged.setdefault(table["name"], {"columns": []})
+        for column in table.get("columns", []):
+            if column not in entry["columns"]:
+                entry["columns"].append(column)
+        if table.get("measures"):
+            entry["measures"] = list(table["measures"])
+            # Visuals bind measures like columns; list them once, as measures
+            entry["columns"] = [column for column in entry["columns"] if column not in entry["measures"]]
+    return merged
+
+def _score(words: set[str], *texts) -> int:
+    if not words:
+        return 0
+    return sum(len(words & _words(text)) for text in texts)
+
+def build_structure_summary(layout: Layout, user_request: str | None = None, schema: dict | None = None,
+                            max_bytes: int | None = DEFAULT_MAX_BYTES, max_tokens: int | None = None,
+                            cache_key: str | None = None, parse_cache: ParseCache | None = None) -> dict:
+    """Builds a compact, size-budgeted PBIX structure summary for the AI prompt.
+
+    Visuals are emitted as rows following `visual_columns` rather than as
+    repeated objects, and every table appears once with its bound columns
+    (plus the data model's columns and measures when `schema` is given).
+    When the summary would exceed the budget, pages, visuals and tables are
+    kept in order of relevance to `user_request` (word overlap with names,
+    titles, types and fields), and `omitted` records what was dropped.
+
+    Args:
+        layout: The parsed report layout.
+        user_request: The request the summary is for; drives prioritization.
+        schema: Optional data model schema, `{"tables": [{"name", "columns", "measures"}]}`
+            (see `schema.read_model_schema`).
+        max_bytes: Hard limit on the compact JSON size of the summary.
+        max_tokens: Alternative limit in approximate tokens; overrides `max_bytes`.
+        cache_key: Fingerprint of the layout content for inventory caching.
+        parse_cache: Persists the inventory across runs under `cache_key`.
+
+    Returns:
+        The summary dictionary.
+    """
+    if max_tokens is not None:
+        max_bytes = max_tokens * BYTES_PER_TOKEN
+    inventory = build_layout_inventory(layout, cache_key, parse_cache)
+    words = _words(user_request)
+    tables = _merge_schema(inventory["tables"], schema)
+
+    # Rank pages and visuals by relevance; ties keep report order
+    ranked_pages = sorted(range(len(inventory["pages"])),
+                          key=lambda i: -_score(words, inventory["pages"][i]["title"], inventory["pages"][i]["name"]))
+    ranked_visuals = []
+    for page_index, page in enumerate(inventory["pages"]):
+        page_score = _score(words, page["title"], page["name"])
+        for visual_index, (name, visual_type, title, fields) in enumerate(page["visuals"]):
+            score = _score(words, name, visual_type, title, " ".join(fields)) * 2 + page_score
+            ranked_visuals.append((-score, page_index, visual_index))
+    ranked_visuals.sort()
+    ranked_tables = sorted(tables, key=lambda name: -_score(words, name, " ".join(tables[name]["columns"]),
+                                                            " ".join(tables[name].get("measures", []))))
+
+    summary = {"visual_columns": VISUAL_COLUMNS, "pages": [], "tables": {}}
+    omitted = {"pages": 0, "visuals": 0, "tables": 0}
+    used = summary_size(summary) + summary_size({"omitted": omitted}) + 1
+
+    def fits(fragment) -> bool:
+        nonlocal used
+        cost = summary_size(fragment) + 1 # Separator
+        if max_bytes is not None and used + cost > max_bytes:
+            return False
+        used += cost
+        return True
+
+    included_pages: dict[int, dict] = {}
+    for page_index in ranked_pages:
+        page = inventory["pages"][page_index]
+        entry = {"name": page["name"], "title": page["title"], "visuals": []}
+        if fits(entry):
+            included_pages[page_index] = entry
+        else:
+            omitted["pages"] += 1
+
+    def add_tables(names):
+        for name in names:
+            if fits({name: tables[name]}):
+                summary["tables"][name] = tables[name]
+            else:
+                omitted["tables"] += 1
+
+    # Tables the request mentions go in before visuals, the rest only if space remains
+    relevant_tables = [name for name in ranked_tables if _score(words, name) > 0]
+    add_tables(relevant_tables)
+
+    for _, page_index, visual_index in ranked_visuals:
+        visual_row = inventory["pages"][page_index]["visuals"][visual_index]
+        if page_index in included_pages and fits(visual_row):
+            included_pages[page_index]["visuals"].append((visual_index, visual_row))
+        else:
+            omitted["visuals"] += 1
+
+    add_tables([name for name in ranked_tables if name not in summary["tables"] and name not in relevant_tables])
+
+    # Emit in report order so the model sees pages and visuals as they appear
+    for page_index in sorted(included_pages):
+        entry = included_pages[page_index]
+        entry["visuals"] = [row for _, row in sorted(entry["visuals"], key=lambda item: item[0])]
+        summary["pages"].append(entry)
+    if any(omitted.values()):
+        summary["omitted"] = omitted
+        logging.info(f"Structure summary trimmed to {max_bytes} bytes; omitted {omitted}")
+    return summary
+
+def summary_size(summary) -> int:
+    """Returns the size in bytes of a summary as it is embedded in the prompt."""
+    return len(_compact(summary).encode("utf-8"))
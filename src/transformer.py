@@ -1,143 +1,397 @@
-'''
+
 import os
 import logging
 import argparse
-import shutil
 import json
+import time
 
-from src.extractor import extract_pbix
-from src.parser import parse_report_layout, save_report_layout # Assuming parser handles layout for now
-from src.ai_handler import get_ai_edit_instructions
-# Need to import repackaging logic later
-# from src.repackager import repackage_pbix 
+from src.pbix_package import PbixPackage
+from src.layout import Layout, VisualContainer
+from src.ai_handler import get_many_ai_edit_instructions, run_ai_coroutine
+from src.summary import build_structure_summary
+from src.property_path import compile_path
+from src.metrics import PipelineMetrics
+from src.parse_cache import get_default_parse_cache
+from src.schema import read_model_schema
+from src.intent import route_requests, min_confidence_from_env
+from src.patch import layout_changes, make_patch, write_patch
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-TEMP_DIR_BASE = "./temp_pbix_work"
+def _set_visual_title(visual: VisualContainer, new_title: str):
+    """Sets the literal title text of a visual and shows the title.
 
-def apply_edits(layout_data: dict, instructions: dict) -> dict:
-    """Applies the edits specified by AI instructions to the layout data.
+    Only `text` and `show` are replaced; other title properties (font,
+    colour, alignment, ...) are kept.
+    """
+    single_visual = visual.config.setdefault("singleVisual", {})
+    vc_objects = single_visual.setdefault("vcObjects", {})
+    titles = vc_objects.get("title")
+    if not isinstance(titles, list) or not titles or not isinstance(titles[0], dict):
+        titles = vc_objects["title"] = [{}]
+    properties = titles[0].setdefault("properties", {})
+    literal = "'" + new_title.replace("'", "''") + "'"
+    properties["show"] = {"expr": {"Literal": {"Value": "true"}}}
+    properties["text"] = {"expr": {"Literal": {"Value": literal}}}
+    visual.touch()
+    visual.layout.invalidate_visual_index()
 
-    Args:
-        layout_data: The parsed layout dictionary.
-        instructions: The structured instructions from the AI.
+# Actions whose target must resolve to a visual before the plan starts
+VISUAL_ACTIONS = ("change_title",)
+
+def plan_operations(instructions: dict) -> list[dict]:
+    """Returns the ordered operations of an instruction set.
+
+    Accepts a single `{action, target, parameters}` instruction or a plan
+    `{"operations": [...]}` of such instructions.
+
+    Raises:
+        ValueError: If an operation is not an instruction dictionary.
+    """
+    operations = instructions.get("operations") if "operations" in instructions else [instructions]
+    if not isinstance(operations, list) or not operations:
+        raise ValueError(f"Edit plan has no operations: {instructions}")
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or "action" not in operation:
+            raise ValueError(f"Operation {index + 1} of the edit plan is not a valid instruction: {operation}")
+    return operations
+
+def _property_roots(layout: Layout, target: dict, property_path: str) -> tuple:
+    """Resolves the visuals a `modify_visual_property` path is evaluated against.
+
+    A visual name or title selects that one visual; otherwise every visual of
+    the target page (or of the whole report), narrowed by `visual_type` when
+    given. Paths starting with `$` are evaluated against the layout itself.
+    """
+    if compile_path(property_path).absolute:
+        return None, [layout]
+    if target.get("visual_name") or target.get("visual_title"):
+        section, visual = layout.resolve(target)
+        return section, [visual] if visual is not None else []
+    section_key = target.get("section_name") or target.get("page_name")
+    section = layout.get_section(section_key) if section_key else None
+    if section_key and section is None:
+        return None, []
+    if target.get("visual_type"):
+        return section, layout.find_visuals_by_type(target["visual_type"], section)
+    return section, list(section.visuals if section else layout.iter_visuals())
+
+def _resolve_targets(layout: Layout, operations: list[dict]) -> list[tuple]:
+    """Resolves every operation's target once, before anything is modified.
+
+    Identical targets share one lookup. Raises ValueError if an action that
+    needs a visual names one that does not exist, so an unresolvable plan
+    fails without touching the layout.
 
     Returns:
-        The modified layout dictionary.
+        One `(section, visuals)` tuple per operation.
+    """
+    resolved_by_key = {}
+    resolved = []
+    for index, operation in enumerate(operations):
+        action = operation["action"]
+        target = operation.get("target") or {}
+        property_path = (operation.get("parameters") or {}).get("property_path")
+        key = json.dumps([target, property_path if action == "modify_visual_property" else None], sort_keys=True)
+        if key not in resolved_by_key:
+            if action == "modify_visual_property":
+                if not property_path:
+                    raise ValueError(f"modify_visual_property without a property_path (operation {index + 1})")
+                resolved_by_key[key] = _property_roots(layout, target, property_path)
+            else:
+                section, visual = layout.resolve(target) if target else (None, None)
+                resolved_by_key[key] = (section, [visual] if visual is not None else [])
+        section, visuals = resolved_by_key[key]
+        if (action in VISUAL_ACTIONS or action == "modify_visual_property") and not visuals:
+            raise ValueError(f"Could not resolve visual for {action} target (operation {index + 1}): {target}")
+        resolved.append((section, visuals))
+    return resolved
+
+def _apply_operation(layout: Layout, instructions: dict, section, visuals: list):
+    """Applies one resolved instruction to the layout.
+
+    Raises:
+        ValueError: If the action is unknown or not implemented yet; nothing
+            is written for it, so the surrounding transaction rolls back.
     """
     action = instructions.get("action")
-    target = instructions.get("target")
-    parameters = instructions.get("parameters")
+    parameters = instructions.get("parameters") or {}
 
     logging.info(f"Applying action: {action} with parameters: {parameters}")
 
-    # --- Placeholder Edit Logic --- 
-    # This needs to be significantly expanded based on the possible actions
-    # defined in the AI prompt and the structure of the layout JSON.
-    if action == "add_visual" and parameters.get("visual_type") == "textbox":
-        # Very basic example: Add a comment indicating a textbox should be added
-        # A real implementation would need to construct the full JSON for a textbox visual
-        # and insert it into the correct section/page.
-        page_name = target.get("section_name", "Unknown Page")
-        layout_data[f"_ai_instruction_add_textbox_on_{page_name}"] = parameters
-        logging.info(f'Placeholder: Marked layout to add textbox: {parameters.get("properties")}')
+    if action == "change_title":
+        visual = visuals[0]
+        _set_visual_title(visual, parameters.get("new_title", ""))
+        logging.info(f'Changed title of visual {visual.name} to "{parameters.get("new_title")}"')
 
     elif action == "modify_visual_property":
-        # Equally basic example: Add a comment indicating property modification
-        # Real implementation needs to navigate the JSON structure based on "target" 
-        # and "property_path" to update the "new_value".
-        visual_name = target.get("visual_name", "Unknown Visual")
-        layout_data[f"_ai_instruction_modify_{visual_name}"] = parameters
-        logging.info(f'Placeholder: Marked layout to modify property: {parameters.get("property_path")}')
-        
+        # One compiled-path sweep over every targeted visual; nodes are
+        # checkpointed only when the path actually changes them
+        path = compile_path(parameters["property_path"])
+        if parameters.get("delete"):
+            changed = path.delete_many(visuals, before_write=layout.checkpoint)
+        else:
+            value = parameters["new_value"] if "new_value" in parameters else parameters.get("value")
+            changed = path.set_many(visuals, value, before_write=layout.checkpoint)
+        if not changed:
+            raise ValueError(f'Property path {parameters["property_path"]} matched nothing on {len(visuals)} visual(s)')
+        logging.info(f'{"Deleted" if parameters.get("delete") else "Set"} {parameters["property_path"]} '
+                     f'at {changed} location(s) across {len(visuals)} visual(s)')
+
     else:
-        logging.warning(f'Edit action "{action}" not implemented yet.')
-        layout_data[f"_ai_instruction_unimplemented_{action}"] = instructions
+        # add_visual needs a complete visual container (config, query, projections)
+        # built from the model schema; until then it fails like any unknown action
+        raise ValueError(f'Edit action "{action}" is not implemented')
+
+def apply_edits(layout: Layout, instructions: dict) -> Layout:
+    """Applies the edits specified by AI instructions to the layout data.
+
+    `instructions` is either one `{action, target, parameters}` instruction
+    or a plan `{"operations": [...]}`. A plan is applied as one transaction:
+    every target is resolved up front through the layout's indexes, the
+    operations run in order against the resolved sections and visuals, and
+    if any operation fails the layout is rolled back to its prior state.
 
-    # --- End Placeholder Edit Logic ---
+    Args:
+        layout: The parsed layout, wrapped in the indexed `Layout` model.
+        instructions: The structured instructions from the AI.
+
+    Returns:
+        The modified layout.
+
+    Raises:
+        ValueError: If the plan is malformed, a target cannot be resolved, or
+            an operation fails (the layout is left unchanged).
+    """
+    operations = plan_operations(instructions)
+    resolved = _resolve_targets(layout, operations)
 
-    return layout_data
+    with layout.transaction():
+        for operation, (section, visuals) in zip(operations, resolved):
+            if operation["action"] == "modify_visual_property":
+                continue # Checkpointed lazily by the path engine
+            for node in [section, *visuals]:
+                if node is not None:
+                    layout.checkpoint(node)
+        for index, (operation, (section, visuals)) in enumerate(zip(operations, resolved)):
+            try:
+                _apply_operation(layout, operation, section, visuals)
+            except Exception as e:
+                raise ValueError(f"Operation {index + 1} of {len(operations)} ({operation.get('action')}) failed; "
+                                 f"edit plan rolled back: {e}") from e
 
-def process_pbix_edit_request(pbix_input_path: str, pbix_output_path: str, user_request: str):
-    """Orchestrates the end-to-end process of editing a PBIX file based on a user request."""
-    
-    temp_dir = None
+    if len(operations) > 1:
+        logging.info(f"Applied edit plan with {len(operations)} operations")
+    return layout
+
+def _check_deadline(deadline: float | None, stage: str):
+    if deadline is not None and time.monotonic() > deadline:
+        raise TimeoutError(f"Deadline passed before the {stage} stage")
+
+def process_pbix_edit_requests(pbix_input_path: str, pbix_output_path: str | None, user_requests: list[str],
+                               stop_on_error: bool = False, bypass_cache: bool = False,
+                               metrics: PipelineMetrics | None = None,
+                               deadline: float | None = None, patch_path: str | None = None) -> list[dict]:
+    """Applies several edit requests to one PBIX, parsing it once and saving it once.
+
+    The PBIX is opened once as a zip archive; only the members the edit needs
+    (currently just the report layout) are read, and the output is written by
+    copying every untouched member from the source archive without recompressing it.
+
+    Requests the local intent rules recognise with enough confidence (see
+    `src.intent`) get their instructions without an LLM round-trip; only the
+    rest are summarized and sent to the AI.
+
+    Args:
+        pbix_input_path: The path to the source .pbix file.
+        pbix_output_path: Where to write the edited .pbix file; None to only
+            write the patch.
+        user_requests: Natural language requests, applied in order.
+        stop_on_error: Re-raise the first failing request instead of recording
+            it and continuing with the rest.
+        bypass_cache: Always ask the LLM instead of reusing cached instructions.
+        metrics: Collects per-stage timings, bytes, LLM usage and cache hits.
+        deadline: `time.monotonic()` value after which the run is abandoned.
+            It is checked between stages and bounds the wait for the AI, so
+            an overdue run never writes its output.
+        patch_path: Also write the edits as a layout patch (see `src.patch`)
+            to this path; it can be replayed with `python -m src.patch apply`.
+
+    Returns:
+        One result per request: `{"request", "status", "route", "intent",
+        "confidence", "seconds", "ai_seconds"}` plus an `"error"` message for
+        failed requests. `route` is "rules" or "llm"; `seconds` covers applying
+        the edit; `ai_seconds` is the wall time of the shared, concurrent
+        instruction fetch (0 for rule-routed requests). The output is only
+        written if at least one request succeeded.
+
+    Raises:
+        TimeoutError: If `deadline` passes before the output is written.
+    """
+    if pbix_output_path is None and patch_path is None:
+        raise ValueError("Nothing to write: give an output PBIX path, a patch path or both")
+    metrics = metrics or PipelineMetrics()
+    results = []
     try:
-        # 1. Create a unique temporary directory for this operation
-        temp_dir_name = os.path.basename(pbix_input_path) + "_" + str(os.getpid())
-        temp_dir = os.path.join(TEMP_DIR_BASE, temp_dir_name)
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        os.makedirs(temp_dir)
-        logging.info(f"Created temporary working directory: {temp_dir}")
-
-        # 2. Extract PBIX
-        logging.info(f"Extracting {pbix_input_path} to {temp_dir}...")
-        extract_pbix(pbix_input_path, temp_dir)
-
-        # 3. Parse relevant components (starting with layout)
-        logging.info("Parsing report layout...")
-        layout_data = parse_report_layout(temp_dir)
-        if not layout_data:
-            raise ValueError("Failed to parse report layout. Cannot proceed.")
-
-        # 4. Generate structure summary for AI (Simplified example)
-        #    A real version would parse DataModel, Connections etc. as needed
-        structure_summary = {
-            "layout_sections": [s.get("displayName") for s in layout_data.get("sections", [])]
-            # Add more relevant structure info here
-        }
-        logging.info("Generated structure summary for AI.")
-
-        # 5. Get AI Edit Instructions
-        logging.info(f"Getting AI instructions for request: {user_request}")
-        ai_instructions = get_ai_edit_instructions(user_request, structure_summary)
-        if not ai_instructions:
-            raise ValueError("Failed to get valid instructions from AI. Cannot proceed.")
-
-        # 6. Apply Edits (using placeholder logic for now)
-        logging.info("Applying AI-driven edits...")
-        modified_layout_data = apply_edits(layout_data, ai_instructions)
-
-        # 7. Save Modified Components
-        logging.info("Saving modified layout...")
-        save_report_layout(temp_dir, modified_layout_data)
-        # Save other modified components here (DataModel, etc.) when implemented
-
-        # 8. Repackage PBIX (Placeholder - Requires repackager module)
-        logging.warning("Repackaging step is not implemented yet.")
-        # repackage_pbix(temp_dir, pbix_output_path)
-        # For now, we can copy the original file to simulate output
-        logging.info(f"Simulating repackaging: Copying {pbix_input_path} to {pbix_output_path}")
-        shutil.copyfile(pbix_input_path, pbix_output_path)
-        logging.info(f"Placeholder output file created at {pbix_output_path}. Contains original content + modified layout in temp dir.")
-
-        logging.info("PBIX edit process completed (with placeholders).")
+        # 1. Open the PBIX archive (nothing is extracted to disk)
+        logging.info(f"Opening {pbix_input_path}...")
+        with metrics.stage("open"):
+            package = PbixPackage(pbix_input_path)
+        with package:
+
+            # 2. Parse relevant components (starting with layout)
+            logging.info("Parsing report layout...")
+            parse_cache = get_default_parse_cache()
+            with metrics.stage("parse"):
+                layout = package.read_layout_document(cache=parse_cache)
+            if not layout:
+                raise ValueError("Failed to parse report layout. Cannot proceed.")
+            layout_info = package.member_info(package.find_layout_member())
+            if parse_cache is not None:
+                metrics.record_cache("parse", hit=layout.from_cache)
+            if not layout.from_cache:
+                metrics.add_bytes("parse", read=layout_info.compress_size)
+
+            # 3. Route requests: formulaic ones get instructions from the local
+            #    intent rules, the rest go to the LLM
+            with metrics.stage("intent"):
+                routes = route_requests(user_requests, layout, min_confidence_from_env())
+            llm_requests = [user_request for user_request, route in zip(user_requests, routes) if route["route"] == "llm"]
+            for route in routes:
+                metrics.record_route(route["route"])
+
+            ai_seconds = 0.0
+            llm_instructions = []
+            if llm_requests:
+                # 4. Read the data model's tables, columns and measures (never inflating the VertiPaq blob)
+                with metrics.stage("schema"):
+                    model_schema = read_model_schema(package, layout, cache=parse_cache)
+
+                # 5. Generate a compact, size-budgeted structure summary per request
+                #    (the layout inventory behind it is built once per file content)
+                with metrics.stage("summarize"):
+                    layout_fingerprint = package.member_fingerprint(layout_info.filename)
+                    structure_summaries = [
+                        build_structure_summary(layout, user_request, schema=model_schema, cache_key=layout_fingerprint,
+                                                parse_cache=parse_cache)
+                        for user_request in llm_requests
+                    ]
+                logging.info("Generated structure summary for AI.")
+
+                # 6. Get AI Edit Instructions (every request is in flight at once)
+                logging.info(f"Getting AI instructions for {len(llm_requests)} request(s): {llm_requests}")
+                _check_deadline(deadline, "ai")
+                with metrics.stage("ai") as ai_stage:
+                    llm_instructions = run_ai_coroutine(get_many_ai_edit_instructions(
+                        list(zip(llm_requests, structure_summaries)), bypass_cache=bypass_cache, metrics=metrics),
+                        timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+                ai_seconds = ai_stage["seconds"]
+
+            llm_answers = iter(llm_instructions)
+            for user_request, route in zip(user_requests, routes):
+                _check_deadline(deadline, "apply")
+                instructions = route["instructions"] if route["route"] == "rules" else next(llm_answers)
+                result = {"request": user_request, "route": route["route"], "intent": route["intent"],
+                          "confidence": route["confidence"],
+                          "ai_seconds": ai_seconds if route["route"] == "llm" else 0.0}
+                started = time.perf_counter()
+                try:
+                    if not instructions:
+                        raise ValueError("Failed to get valid instructions from AI. Cannot proceed.")
+
+                    # 7. Apply Edits (using placeholder logic for now)
+                    logging.info("Applying AI-driven edits...")
+                    with metrics.stage("apply"):
+                        layout = apply_edits(layout, instructions)
+                    results.append(dict(result, status="ok", seconds=time.perf_counter() - started))
+                except Exception as e:
+                    if stop_on_error:
+                        raise
+                    logging.error(f"Request failed for {pbix_input_path}: {user_request!r}: {e}")
+                    results.append(dict(result, status="error", error=str(e), seconds=time.perf_counter() - started))
+
+            if not any(result["status"] == "ok" for result in results):
+                logging.warning(f"No request succeeded for {pbix_input_path}; output not written.")
+                return results
+
+            # 8. Record the edits as a compact layout patch
+            if patch_path:
+                with metrics.stage("patch"):
+                    patch = make_patch(layout_changes(layout), requests=[
+                        result["request"] for result in results if result["status"] == "ok"],
+                        base={"source": os.path.basename(pbix_input_path), "layout_member": layout_info.filename,
+                              "layout_fingerprint": package.member_fingerprint(layout_info.filename)})
+                    write_patch(patch, patch_path)
+                metrics.add_bytes("patch", written=os.path.getsize(patch_path))
+                logging.info(f"Wrote layout patch with {len(patch['changes'])} change(s) to {patch_path}")
+                if pbix_output_path is None:
+                    return results
+
+            # 9. Stage Modified Components
+            logging.info("Saving modified layout...")
+            with metrics.stage("save"):
+                package.write_layout(layout)
+                # Stage other modified components here (DataModel, etc.) when implemented
+            metrics.add_bytes("save", written=sum(len(data) for data in package.modified_members.values()))
+
+            # 10. Repackage the output PBIX, copying unchanged members raw from the source
+            _check_deadline(deadline, "repackage")
+            with metrics.stage("repackage"):
+                repackage_stats = package.save(pbix_output_path)
+            metrics.add_bytes("repackage", read=repackage_stats["bytes_copied_raw"],
+                              written=repackage_stats["bytes_written"])
+
+        logging.info(f"PBIX edit process completed. Output written to {pbix_output_path}")
+        return results
 
     except Exception as e:
         logging.error(f"Error during PBIX processing: {e}", exc_info=True)
         raise # Re-raise the exception after logging
     finally:
-        # 9. Cleanup Temporary Directory (Optional)
-        if temp_dir and os.path.exists(temp_dir):
-            # logging.info(f"Cleaning up temporary directory: {temp_dir}")
-            # shutil.rmtree(temp_dir) # Keep for inspection for now
-            logging.warning(f"Temporary directory {temp_dir} was not cleaned up for inspection.")
-            pass
+        metrics.finish()
+
+def process_pbix_edit_request(pbix_input_path: str, pbix_output_path: str | None, user_request: str,
+                              bypass_cache: bool = False, track_memory: bool = False,
+                              patch_path: str | None = None) -> PipelineMetrics:
+    """Orchestrates the end-to-end process of editing a PBIX file based on a user request.
+
+    Returns:
+        The run's `PipelineMetrics` (per-stage wall time, bytes, memory, LLM
+        latency/tokens and cache hits).
+    """
+    metrics = PipelineMetrics(track_memory=track_memory)
+    process_pbix_edit_requests(pbix_input_path, pbix_output_path, [user_request], stop_on_error=True,
+                               bypass_cache=bypass_cache, metrics=metrics, patch_path=patch_path)
+    return metrics
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Edit a PBIX file using an AI request.")
     parser.add_argument("-i", "--input", required=True, help="Path to the input PBIX file.")
-    parser.add_argument("-o", "--output", required=True, help="Path to save the modified PBIX file.")
+    parser.add_argument("-o", "--output", help="Path to save the modified PBIX file.")
     parser.add_argument("-r", "--request", required=True, help="Natural language request for the edit.")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the AI instruction cache.")
+    parser.add_argument("--metrics-json", help="Write run metrics as JSON to this path.")
+    parser.add_argument("--metrics-prom", help="Write run metrics in Prometheus text format to this path.")
+    parser.add_argument("--track-memory", action="store_true", help="Record per-stage allocations with tracemalloc.")
+    parser.add_argument("--patch", help="Write the edits as a layout patch to this path (replay with `python -m src.patch apply`).")
 
     args = parser.parse_args()
+    if not args.output and not args.patch:
+        parser.error("at least one of --output or --patch is required")
 
     try:
-        process_pbix_edit_request(args.input, args.output, args.request)
-        print(f"Process finished. Modified PBIX (placeholder) saved to {args.output}")
-        print(f"Check the temporary directory ({TEMP_DIR_BASE}/...) for extracted/modified files.")
+        run_metrics = process_pbix_edit_request(args.input, args.output, args.request, bypass_cache=args.no_cache,
+                                                track_memory=args.track_memory, patch_path=args.patch)
+        if args.output:
+            print(f"Process finished. Modified PBIX saved to {args.output}")
+        if args.patch:
+            print(f"Layout patch saved to {args.patch}")
+        if args.metrics_json:
+            with open(args.metrics_json, "w", encoding="utf-8") as f:
+                f.write(run_metrics.to_json())
+        if args.metrics_prom:
+            with open(args.metrics_prom, "w", encoding="utf-8") as f:
+                f.write(run_metrics.to_prometheus())
     except Exception as e:
         print(f"Process failed: {e}")
         exit(1)
-'''
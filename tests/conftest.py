@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from benchmarks.synthetic import build_layout, write_synthetic_pbix
+from src import ai_handler, parse_cache
+from src.layout import Layout
+
+def layout_bytes(pages: int = 2, visuals_per_page: int = 3, seed: int = 0) -> bytes:
+    """Encodes a synthetic layout the way Power BI writes Report/Layout (compact UTF-16-LE JSON)."""
+    return json.dumps(build_layout(pages, visuals_per_page, seed=seed), separators=(",", ":")).encode("utf-16-le")
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    """Keeps tests off real LLM providers and the on-disk caches in the user's home directory."""
+    for name in ("GOOGLE_API_KEY", "AI_PROVIDER_BASE_URL", "INTENT_RULES", "INTENT_MIN_CONFIDENCE"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("AI_CACHE", "0")
+    monkeypatch.setenv("PARSE_CACHE", "0")
+    monkeypatch.setattr(ai_handler, "_default_client", None)
+    monkeypatch.setattr(ai_handler, "_default_cache", None)
+    monkeypatch.setattr(ai_handler, "_default_cache_loaded", False)
+    monkeypatch.setattr(parse_cache, "_default_cache", None)
+    monkeypatch.setattr(parse_cache, "_default_cache_loaded", False)
+
+@pytest.fixture
+def layout() -> Layout:
+    return Layout.from_bytes(layout_bytes())
+
+@pytest.fixture
+def pbix_path(tmp_path) -> str:
+    path = str(tmp_path / "report.pbix")
+    write_synthetic_pbix(path, pages=2, visuals_per_page=3, datamodel_bytes=4096, seed=0)
+    return path
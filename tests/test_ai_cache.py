@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import pytest
+
+from src import ai_cache, ai_handler
+from src.ai_cache import InstructionCache, cache_from_env
+from src.ai_client import AITransport, AsyncAIClient
+
+INSTRUCTION = {"action": "change_title", "target": {"visual_name": "visual0_0"}, "parameters": {"new_title": "X"}}
+SUMMARY = {"sections": [{"name": "ReportSection0", "visuals": [{"name": "visual0_0", "type": "card"}]}]}
+
+@pytest.fixture
+def cache(tmp_path):
+    instruction_cache = InstructionCache(str(tmp_path / "cache.sqlite"), ttl_seconds=60)
+    yield instruction_cache
+    instruction_cache.close()
+
+class _CountingTransport(AITransport):
+    name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def complete(self, prompt, model, system_prompt=""):
+        self.calls += 1
+        return {"content": json.dumps(INSTRUCTION), "usage": {"prompt_tokens": 10, "completion_tokens": 5}}
+
+def test_keys_ignore_phrasing_noise_but_not_structure_model_or_prompt():
+    key = InstructionCache.make_key("Hide the title of visual0_0.", SUMMARY, "m", "1")
+    assert InstructionCache.make_key("  hide the TITLE of   visual0_0 ", dict(reversed(SUMMARY.items())), "m", "1") == key
+    assert InstructionCache.make_key("Hide the title of visual0_0", {"sections": []}, "m", "1") != key
+    assert InstructionCache.make_key("Hide the title of visual0_0", SUMMARY, "other", "1") != key
+    assert InstructionCache.make_key("Hide the title of visual0_0", SUMMARY, "m", "2") != key
+
+def test_round_trip_and_stats(cache):
+    key = cache.make_key("request", SUMMARY, "m", "1")
+    assert cache.get(key) is None
+    cache.put(key, INSTRUCTION)
+    assert cache.get(key) == INSTRUCTION
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["writes"], stats["entries"]) == (1, 1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+def test_expired_entries_miss(cache, monkeypatch):
+    cache.put("key", INSTRUCTION)
+    now = ai_cache.time.time()
+    monkeypatch.setattr(ai_cache.time, "time", lambda: now + 61)
+
+    assert cache.get("key") is None
+    assert cache.stats()["expired"] == 1 and cache.stats()["entries"] == 0
+
+def test_purge_removes_only_expired_entries(cache, monkeypatch):
+    now = ai_cache.time.time()
+    monkeypatch.setattr(ai_cache.time, "time", lambda: now - 120)
+    cache.put("old", INSTRUCTION)
+    monkeypatch.setattr(ai_cache.time, "time", lambda: now)
+    cache.put("new", INSTRUCTION)
+
+    assert cache.purge_expired() == 1
+    assert cache.get("new") == INSTRUCTION
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(ai_cache.time, "time", lambda: float(next(clock)))
+    cache = InstructionCache(str(tmp_path / "cache.sqlite"), max_entries=2, ttl_seconds=None)
+    cache.put("a", INSTRUCTION)
+    cache.put("b", INSTRUCTION)
+    cache.get("a")
+    cache.put("c", INSTRUCTION)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == INSTRUCTION and cache.get("c") == INSTRUCTION
+    assert cache.stats()["evictions"] == 1
+    cache.close()
+
+def test_entries_are_shared_between_connections(cache):
+    cache.put("key", INSTRUCTION)
+    other = InstructionCache(cache.path)
+    assert other.get("key") == INSTRUCTION
+    other.close()
+
+def test_cache_from_env(tmp_path, monkeypatch):
+    assert cache_from_env() is None # AI_CACHE=0 from the offline fixture
+
+    monkeypatch.setenv("AI_CACHE", "1")
+    monkeypatch.setenv("AI_CACHE_PATH", str(tmp_path / "env" / "cache.sqlite"))
+    monkeypatch.setenv("AI_CACHE_TTL_SECONDS", "5")
+    cache = cache_from_env()
+    assert cache.ttl_seconds == 5 and (tmp_path / "env" / "cache.sqlite").exists()
+    cache.close()
+
+def test_repeat_requests_are_served_from_the_cache(cache):
+    transport = _CountingTransport()
+    client = AsyncAIClient(transport, model="test")
+
+    for request in ("Hide the title of visual0_0", "hide the title of visual0_0."):
+        assert asyncio.run(ai_handler.get_ai_edit_instructions_async(request, SUMMARY, client, cache=cache)) == INSTRUCTION
+    assert transport.calls == 1
+
+    asyncio.run(ai_handler.get_ai_edit_instructions_async("Hide the title of visual0_0", SUMMARY, client,
+                                                           cache=cache, bypass_cache=True))
+    assert transport.calls == 2
+
+def test_unparseable_responses_are_not_cached(cache):
+    class _Garbage(_CountingTransport):
+        async def complete(self, prompt, model, system_prompt=""):
+            await super().complete(prompt, model, system_prompt)
+            return {"content": "not json", "usage": {}}
+
+    client = AsyncAIClient(_Garbage(), model="test")
+    assert asyncio.run(ai_handler.get_ai_edit_instructions_async("request", SUMMARY, client, cache=cache)) is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,99 @@
+import asyncio
+import http.server
+import json
+import threading
+
+import pytest
+
+from src import ai_handler
+from src.ai_client import (AIClientError, AITransport, AITransportError, AsyncAIClient, OpenAICompatibleTransport,
+                           RetryPolicy, _post_json)
+
+INSTRUCTION = {"action": "change_title", "target": {"visual_name": "visual0_0"}, "parameters": {"new_title": "X"}}
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        if self.path == "/truncated":
+            self.send_header("Content-Length", "100")
+            self.end_headers()
+            self.wfile.write(b'{"choices"')
+            self.close_connection = True
+            return
+        body = b"<html>busy</html>"
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture(scope="module")
+def provider_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+class _ScriptedTransport(AITransport):
+    """Fails the first `failures` calls with `error`, then answers with `content`."""
+
+    name = "scripted"
+
+    def __init__(self, failures: int = 0, error: Exception | None = None, content: str = json.dumps(INSTRUCTION)):
+        self.failures = failures
+        self.error = error
+        self.content = content
+        self.calls = 0
+
+    async def complete(self, prompt, model, system_prompt=""):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return {"content": self.content, "usage": {"prompt_tokens": 10, "completion_tokens": 5}}
+
+def _client(transport: AITransport, attempts: int = 3) -> AsyncAIClient:
+    return AsyncAIClient(transport, model="test", retry_policy=RetryPolicy(max_attempts=attempts, base_delay=0.001))
+
+@pytest.mark.parametrize("path", ["/not-json", "/truncated"])
+def test_bad_response_bodies_are_transport_errors(provider_url, path):
+    with pytest.raises(AITransportError) as error:
+        _post_json(provider_url + path, {}, {}, timeout=5)
+    assert error.value.retryable
+
+def test_retries_transient_errors():
+    transport = _ScriptedTransport(failures=2, error=AITransportError("busy", status=503))
+    response = asyncio.run(_client(transport).complete("prompt"))
+    assert response["attempts"] == 3 and transport.calls == 3
+
+def test_does_not_retry_permanent_errors():
+    transport = _ScriptedTransport(failures=5, error=AITransportError("bad key", status=401))
+    with pytest.raises(AIClientError):
+        asyncio.run(_client(transport).complete("prompt"))
+    assert transport.calls == 1
+
+def test_attempt_timeout_covers_the_socket_timeout():
+    transport = OpenAICompatibleTransport(None, "http://127.0.0.1:9", http_timeout=120)
+    assert AsyncAIClient(transport, model="test", timeout=60).timeout >= 120
+
+def test_one_failed_request_does_not_sink_the_batch():
+    class _Selective(_ScriptedTransport):
+        async def complete(self, prompt, model, system_prompt=""):
+            if "broken request" in prompt:
+                raise RuntimeError("transport bug")
+            return await super().complete(prompt, model, system_prompt)
+
+    results = asyncio.run(ai_handler.get_many_ai_edit_instructions(
+        [("broken request", {}), ("Change the title of visual0_0 to X", {})], _client(_Selective()), bypass_cache=True))
+    assert results == [None, INSTRUCTION]
+
+@pytest.mark.parametrize("content, expected", [
+    (json.dumps(INSTRUCTION), INSTRUCTION),
+    (json.dumps([INSTRUCTION, INSTRUCTION]), {"operations": [INSTRUCTION, INSTRUCTION]}),
+    ("not json", None),
+    (json.dumps({"target": {}}), None),
+])
+def test_parse_instructions(content, expected):
+    assert ai_handler.parse_instructions(content) == expected
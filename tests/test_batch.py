@@ -0,0 +1,80 @@
+import json
+import shutil
+import zipfile
+
+import pytest
+
+from src.batch import group_manifest, load_manifest, run_batch
+
+@pytest.fixture
+def reports(tmp_path, pbix_path):
+    for name in ("a", "b"):
+        shutil.copy(pbix_path, tmp_path / f"{name}.pbix")
+    return tmp_path
+
+def _layout(path) -> dict:
+    with zipfile.ZipFile(path) as archive:
+        return json.loads(archive.read("Report/Layout").decode("utf-16-le"))
+
+def test_loads_jsonl_and_csv_manifests(tmp_path):
+    (tmp_path / "batch.jsonl").write_text('{"input": "a.pbix", "output": "a_out.pbix", "request": "Hide it"}\n\n',
+                                          encoding="utf-8")
+    (tmp_path / "batch.csv").write_text("input,output,request\na.pbix,a_out.pbix,Hide it\n", encoding="utf-8")
+
+    expected = [{"input": "a.pbix", "output": "a_out.pbix", "request": "Hide it"}]
+    assert load_manifest(str(tmp_path / "batch.jsonl")) == expected
+    assert load_manifest(str(tmp_path / "batch.csv")) == expected
+
+@pytest.mark.parametrize("content, message", [
+    ('{"input": "a.pbix", "output": "b.pbix"}\n', "missing field"),
+    ("not json\n", "invalid JSON"),
+])
+def test_malformed_manifests_report_the_line(tmp_path, content, message):
+    (tmp_path / "batch.jsonl").write_text(content, encoding="utf-8")
+    with pytest.raises(ValueError, match=rf":1: {message}"):
+        load_manifest(str(tmp_path / "batch.jsonl"))
+
+def test_missing_manifest(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_manifest(str(tmp_path / "missing.jsonl"))
+
+def test_groups_keep_request_order_and_reject_shared_outputs():
+    items = [{"input": "a.pbix", "output": "a_out.pbix", "request": "first"},
+             {"input": "b.pbix", "output": "b_out.pbix", "request": "other"},
+             {"input": "a.pbix", "output": "a_out.pbix", "request": "second"}]
+    assert [group["requests"] for group in group_manifest(items)] == [["first", "second"], ["other"]]
+
+    with pytest.raises(ValueError, match="more than one input"):
+        group_manifest(items + [{"input": "b.pbix", "output": "a_out.pbix", "request": "clash"}])
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_one_bad_file_does_not_sink_the_batch(reports, workers):
+    (reports / "broken.pbix").write_bytes(b"not a zip")
+    items = [{"input": str(reports / "a.pbix"), "output": str(reports / "a_out.pbix"),
+              "request": "Change the title of visual0_1 to Revenue"},
+             {"input": str(reports / "broken.pbix"), "output": str(reports / "broken_out.pbix"),
+              "request": "Hide the title of visual0_1"},
+             {"input": str(reports / "b.pbix"), "output": str(reports / "b_out.pbix"),
+              "request": "Hide all titles on Page 2"}]
+
+    results = run_batch(items, max_workers=workers)
+
+    assert [(result["input"], result["status"]) for result in results] == [
+        (items[0]["input"], "ok"), (items[1]["input"], "error"), (items[2]["input"], "ok")]
+    assert results[1]["error"]
+    assert all("group_seconds" in result and "group_metrics" in result for result in results)
+    assert not (reports / "broken_out.pbix").exists()
+    titles = [visual for section in _layout(reports / "a_out.pbix")["sections"]
+              for visual in section["visualContainers"] if "Revenue" in visual["config"]]
+    assert len(titles) == 1
+
+def test_failed_request_is_reported_per_row(reports):
+    items = [{"input": str(reports / "a.pbix"), "output": str(reports / "a_out.pbix"),
+              "request": "Hide the title of visual0_1"},
+             {"input": str(reports / "a.pbix"), "output": str(reports / "a_out.pbix"),
+              "request": "Make the report look nicer"}] # No rule matches and no LLM is configured
+
+    results = run_batch(items, max_workers=1)
+
+    assert [result["status"] for result in results] == ["ok", "error"]
+    assert (reports / "a_out.pbix").exists()
@@ -0,0 +1,57 @@
+import os
+import warnings
+import zipfile
+
+import pytest
+
+from src.extractor import UnsafeArchiveError, extract_pbix
+
+def _archive(path, members: list[tuple[str, bytes]], compression=zipfile.ZIP_DEFLATED) -> str:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore") # Duplicate names warn on write
+        with zipfile.ZipFile(path, "w", compression) as archive:
+            for name, data in members:
+                archive.writestr(name, data)
+    return str(path)
+
+def test_extracts_every_member(pbix_path, tmp_path):
+    output = tmp_path / "out"
+    names = extract_pbix(pbix_path, str(output), max_workers=4)
+
+    with zipfile.ZipFile(pbix_path) as archive:
+        assert sorted(names) == sorted(archive.namelist())
+        for name in archive.namelist():
+            assert (output / name).read_bytes() == archive.read(name)
+    assert not list(output.rglob("*.partial"))
+
+def test_member_patterns_select_a_subset(pbix_path, tmp_path):
+    names = extract_pbix(pbix_path, str(tmp_path / "out"), members=["Version", "Report/*"])
+    assert sorted(names) == ["Report/Layout", "Report/StaticResources/SharedResources/BaseThemes/CY24SU02.json", "Version"]
+    assert not (tmp_path / "out" / "DataModel").exists()
+
+@pytest.mark.parametrize("name", ["../evil.txt", "/etc/evil.txt", "C:/evil.txt", "a/../../evil.txt"])
+def test_rejects_path_traversal(tmp_path, name):
+    archive = _archive(tmp_path / "bad.zip", [("ok.txt", b"fine"), (name, b"evil")])
+    with pytest.raises(UnsafeArchiveError):
+        extract_pbix(archive, str(tmp_path / "out"))
+    assert os.listdir(tmp_path / "out") == []
+
+@pytest.mark.parametrize("names", [["a.txt", "a.txt"], ["dir/b.txt", "dir/./b.txt"]])
+def test_rejects_members_that_collide(tmp_path, names):
+    archive = _archive(tmp_path / "dup.zip", [(name, b"data") for name in names])
+    with pytest.raises(UnsafeArchiveError):
+        extract_pbix(archive, str(tmp_path / "out"))
+    assert os.listdir(tmp_path / "out") == []
+
+def test_rejects_high_compression_ratio(tmp_path):
+    archive = _archive(tmp_path / "bomb.zip", [("zeros", b"\x00" * (4 * 1024 * 1024))])
+    with pytest.raises(UnsafeArchiveError):
+        extract_pbix(archive, str(tmp_path / "out"), max_ratio=100)
+
+def test_rejects_archives_over_the_size_and_member_limits(tmp_path):
+    archive = _archive(tmp_path / "big.zip", [(f"m{index}", b"x" * 100) for index in range(5)], zipfile.ZIP_STORED)
+    with pytest.raises(UnsafeArchiveError):
+        extract_pbix(archive, str(tmp_path / "out"), max_total_bytes=400)
+    with pytest.raises(UnsafeArchiveError):
+        extract_pbix(archive, str(tmp_path / "out"), max_members=4)
+    assert extract_pbix(archive, str(tmp_path / "out"), max_total_bytes=500, max_members=5)
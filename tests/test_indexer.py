@@ -0,0 +1,66 @@
+import json
+import shutil
+import zipfile
+
+import pytest
+
+from benchmarks.synthetic import build_layout
+from src.indexer import ReportIndex
+
+@pytest.fixture
+def reports(tmp_path, pbix_path):
+    directory = tmp_path / "reports"
+    directory.mkdir()
+    shutil.copy(pbix_path, directory / "sales.pbix")
+
+    # A report whose second page has no visuals yet
+    layout = build_layout(1, 2, seed=1)
+    layout["sections"].append({"name": "EmptySection", "displayName": "Notes", "ordinal": 1, "visualContainers": []})
+    with zipfile.ZipFile(directory / "notes.pbix", "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("Report/Layout", json.dumps(layout, separators=(",", ":")).encode("utf-16-le"))
+    return directory
+
+@pytest.fixture
+def index(tmp_path):
+    with ReportIndex(str(tmp_path / "index.sqlite")) as report_index:
+        yield report_index
+
+def _corrupt_layout(path):
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo("Report/Layout")
+    data = bytearray(path.read_bytes())
+    start = info.header_offset + 30 + len(info.filename.encode()) + len(info.extra)
+    for offset in range(start + 5, start + 25):
+        data[offset] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_corrupt_report_is_recorded_without_aborting_the_scan(reports, index, workers):
+    _corrupt_layout(reports / "sales.pbix")
+
+    stats = index.update(str(reports), max_workers=workers)
+
+    assert stats["indexed"] == 1 and stats["failed"] == 1
+    assert index.stats()["failed"] == 1
+
+def test_rescans_only_changed_reports(reports, index):
+    assert index.update(str(reports), max_workers=1)["indexed"] == 2
+    assert index.update(str(reports), max_workers=1) == {"scanned": 2, "indexed": 0, "unchanged": 2, "failed": 0,
+                                                         "removed": 0}
+    (reports / "notes.pbix").unlink()
+    assert index.update(str(reports), max_workers=1)["removed"] == 1
+
+def test_pages_without_visuals_are_indexed(reports, index):
+    index.update(str(reports), max_workers=1)
+    assert index.stats()["pages"] == 2 + 2 # sales.pbix has two pages, notes.pbix a full and an empty one
+
+@pytest.mark.parametrize("text", ["Sales-Amount", 'Chart "1', "visual0_1 NOT", "*"])
+def test_free_text_is_not_parsed_as_query_syntax(reports, index, text):
+    index.update(str(reports), max_workers=1)
+    assert isinstance(index.find_visuals(text=text), list)
+
+def test_free_text_matches_every_word(reports, index):
+    index.update(str(reports), max_workers=1)
+    rows = index.find_visuals(text="Chart 1-2")
+    assert rows and all(row["title"] == "Chart 1-2" for row in rows)
+    assert {row["visual"] for row in index.find_visuals(text="visual0_1")} == {"visual0_1"}
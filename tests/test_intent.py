@@ -0,0 +1,66 @@
+import pytest
+
+from src.intent import DEFAULT_MIN_CONFIDENCE, match_intent, min_confidence_from_env, route_requests
+from src.transformer import apply_edits
+
+def _targets(instructions: dict) -> list[str]:
+    operations = instructions.get("operations", [instructions])
+    return [operation["target"]["visual_name"] for operation in operations]
+
+def test_change_title_resolves_by_title_and_name(layout):
+    match = match_intent('Change the title of "Chart 2-3" to Revenue by Region', layout)
+
+    assert match["intent"] == "change_title" and match["confidence"] >= DEFAULT_MIN_CONFIDENCE
+    assert match["instructions"] == {"action": "change_title",
+                                     "target": {"section_name": "ReportSection1", "visual_name": "visual1_2"},
+                                     "parameters": {"new_title": "Revenue by Region"}}
+
+@pytest.mark.parametrize("request_text, expected", [
+    ("Hide all titles on Page 2", ["visual1_0", "visual1_1", "visual1_2"]),
+    ("hide all the titles on page 2", ["visual1_0", "visual1_1", "visual1_2"]),
+    ("Show titles on Page 1", ["visual0_0", "visual0_1", "visual0_2"]),
+    ("Hide the titles of all bar charts on Page 2", ["visual1_0"]),
+    ("Hide the title of visual0_1", ["visual0_1"]),
+])
+def test_toggle_title_resolves_pages_and_types(layout, request_text, expected):
+    match = match_intent(request_text, layout)
+    assert match["confidence"] >= DEFAULT_MIN_CONFIDENCE
+    assert _targets(match["instructions"]) == expected
+
+def test_toggled_titles_apply_cleanly(layout):
+    apply_edits(layout, match_intent("Hide all titles on Page 2", layout)["instructions"])
+    shows = [visual.config["singleVisual"]["vcObjects"]["title"][0]["properties"]["show"]
+             for visual in layout.get_section("Page 2").visuals]
+    assert shows == [{"expr": {"Literal": {"Value": "false"}}}] * 3
+
+@pytest.mark.parametrize("request_text", [
+    "Change visual0_1 to a line chart",     # bar -> line share their projections
+    "Convert visual1_1 to a column chart",
+])
+def test_visual_type_changes_within_a_family_use_rules(layout, request_text):
+    assert match_intent(request_text, layout)["confidence"] >= DEFAULT_MIN_CONFIDENCE
+
+@pytest.mark.parametrize("request_text", [
+    "Change visual0_1 to a pie chart",      # bar -> pie needs projections remapped
+    "Change visual1_2 to a matrix",
+    "Change visual0_0 to a bar chart",      # card has no family
+])
+def test_visual_type_changes_across_families_go_to_the_llm(layout, request_text):
+    match = match_intent(request_text, layout)
+    assert match["confidence"] < DEFAULT_MIN_CONFIDENCE
+    assert "remapping" in match["reason"]
+
+@pytest.mark.parametrize("request_text", [
+    "Change the title of Nonexistent Chart to X",         # unknown visual
+    "Hide all titles on Page 9",                          # unknown page
+    "Change the title of visual0_1 to Sales and hide it", # two edits in one
+    "Make the report look nicer",                         # no rule
+])
+def test_uncertain_requests_are_left_to_the_llm(layout, request_text):
+    assert route_requests([request_text], layout)[0]["route"] == "llm"
+
+def test_rules_can_be_disabled(layout, monkeypatch):
+    monkeypatch.setenv("INTENT_RULES", "0")
+    assert min_confidence_from_env() is None
+    routed = route_requests(["Hide the title of visual0_1"], layout, min_confidence_from_env())
+    assert routed[0]["route"] == "llm" and routed[0]["instructions"] is None
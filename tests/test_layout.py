@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from src.layout import Layout
+from tests.conftest import layout_bytes
+
+def test_unmodified_layout_round_trips_byte_for_byte():
+    source = layout_bytes()
+    layout = Layout.from_bytes(source)
+    layout.get_section("ReportSection0").visuals[0].config # Decoding alone is not a change
+
+    assert not layout.modified
+    assert layout.to_bytes() == source
+
+def test_splice_rewrites_only_the_touched_visual():
+    source = layout_bytes()
+    layout = Layout.from_bytes(source)
+    visual = layout.find_visuals_by_name("visual1_2")[0]
+    visual.config["singleVisual"]["visualType"] = "lineChart"
+    visual.touch()
+
+    output = layout.to_bytes()
+    expected = json.loads(source.decode("utf-16-le"))
+    config = json.loads(expected["sections"][1]["visualContainers"][2]["config"])
+    config["singleVisual"]["visualType"] = "lineChart"
+    expected["sections"][1]["visualContainers"][2]["config"] = json.dumps(config, separators=(",", ":"))
+
+    assert json.loads(output.decode("utf-16-le")) == expected
+    # Everything before the spliced visual is kept verbatim
+    start = visual.span[0] * 2
+    assert output[:start] == source[:start]
+    assert Layout.from_bytes(output).find_visuals_by_name("visual1_2")[0].visual_type == "lineChart"
+
+def test_transaction_rolls_back_every_checkpointed_node(layout):
+    before = layout.to_bytes()
+    first, second = layout.find_visuals_by_name("visual0_0")[0], layout.find_visuals_by_name("visual0_1")[0]
+
+    with pytest.raises(RuntimeError):
+        with layout.transaction():
+            layout.checkpoint(first)
+            first.config["singleVisual"]["visualType"] = "pieChart"
+            first.touch()
+            section = layout.get_section("ReportSection0")
+            layout.checkpoint(section)
+            section.remove_visual(second)
+            raise RuntimeError("edit failed")
+
+    assert not layout.modified
+    assert first.visual_type != "pieChart"
+    assert layout.find_visuals_by_name("visual0_1")
+    assert layout.to_bytes() == before
+
+def test_transactions_cannot_nest(layout):
+    with layout.transaction():
+        with pytest.raises(RuntimeError):
+            with layout.transaction():
+                pass
@@ -0,0 +1,60 @@
+import copy
+
+import pytest
+
+from src.layout import Layout
+from src.patch import PatchConflictError, apply_patch, invert_patch, layout_changes, make_patch
+from tests.conftest import layout_bytes
+
+def _edit(layout: Layout):
+    visual = layout.find_visuals_by_name("visual0_1")[0]
+    visual.config["singleVisual"]["visualType"] = "lineChart"
+    visual.raw["x"] = 99.0
+    visual.touch()
+    layout.get_section("ReportSection1").remove_visual(layout.find_visuals_by_name("visual1_0")[0])
+
+def test_patch_replays_the_edit_and_inverts_back():
+    source = layout_bytes()
+    edited = Layout.from_bytes(source)
+    _edit(edited)
+    patch = make_patch(layout_changes(edited))
+
+    target = Layout.from_bytes(source)
+    assert apply_patch(target, patch) > 0
+    assert target.to_dict() == edited.to_dict()
+
+    apply_patch(target, invert_patch(patch))
+    assert Layout.from_bytes(target.to_bytes()).to_dict() == Layout.from_bytes(source).to_dict()
+
+def test_unedited_layout_has_no_changes(layout):
+    assert layout_changes(layout) == []
+
+def test_strict_conflict_leaves_layout_unchanged():
+    source = layout_bytes()
+    edited = Layout.from_bytes(source)
+    _edit(edited)
+    patch = make_patch(layout_changes(edited))
+
+    # The target diverged from the patch's base on one of the replaced values
+    target = Layout.from_bytes(source)
+    visual = target.find_visuals_by_name("visual0_1")[0]
+    visual.raw["x"] = 5.0
+    visual.touch()
+    before = copy.deepcopy(target.to_dict())
+
+    with pytest.raises(PatchConflictError):
+        apply_patch(target, patch)
+    assert target.to_dict() == before
+
+    assert apply_patch(target, patch, strict=False) > 0
+    assert target.find_visuals_by_name("visual0_1")[0].raw["x"] == 99.0
+
+def test_missing_target_is_a_conflict(layout):
+    patch = make_patch([{"section": "ReportSection0", "visual": "nope",
+                         "ops": [{"op": "replace", "path": "/x", "value": 1.0, "old": 2.0}]}])
+    with pytest.raises(PatchConflictError):
+        apply_patch(layout, patch)
+
+def test_rejects_foreign_documents(layout):
+    with pytest.raises(ValueError):
+        apply_patch(layout, {"format": "something-else", "version": 1, "changes": []})
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from src.layout import Layout
+from src.property_path import PropertyPathError, compile_path
+
+TITLE_TEXT = "config.singleVisual.vcObjects.title[0].properties.text.expr.Literal.Value"
+
+def test_get_crosses_encoded_config(layout):
+    visual = layout.find_visuals_by_name("visual0_1")[0]
+    assert compile_path("config.singleVisual.visualType").get(visual) == [visual.visual_type]
+
+def test_set_marks_the_visual_modified(layout):
+    visual = layout.find_visuals_by_name("visual0_1")[0]
+
+    assert compile_path(TITLE_TEXT).set(visual, "'Revenue'") == 1
+    assert visual.title == "Revenue"
+    assert visual in layout.modified_nodes()
+    assert layout.find_visuals_by_title("Revenue") == [visual]
+
+def test_set_creates_missing_keys_only_when_asked(layout):
+    visual = layout.find_visuals_by_name("visual0_1")[0]
+    path = compile_path("config.singleVisual.vcObjects.background[0].properties.show")
+
+    assert path.set(visual, True, create=False) == 0
+    assert compile_path("config.singleVisual.vcObjects.background").set(visual, [{"properties": {}}]) == 1
+    assert path.set(visual, True) == 1
+    assert path.get(visual) == [True]
+
+def test_delete_removes_the_value(layout):
+    visual = layout.find_visuals_by_name("visual0_1")[0]
+
+    assert compile_path("config.singleVisual.vcObjects.title").delete(visual) == 1
+    assert visual.title is None
+    with pytest.raises(PropertyPathError):
+        compile_path("config.singleVisual.vcObjects[*]").delete(visual)
+
+def test_wildcards_and_filters_select_across_the_report(layout):
+    bar_charts = [visual for visual in layout.iter_visuals() if visual.visual_type == "barChart"]
+    path = compile_path("$.sections[*].visualContainers[?config.singleVisual.visualType=barChart]."
+                        + TITLE_TEXT)
+
+    assert path.set(layout, "'Bars'") == len(bar_charts)
+    assert all(visual.title == "Bars" for visual in bar_charts)
+    assert all(visual.title != "Bars" for visual in layout.iter_visuals() if visual.visual_type != "barChart")
+
+def test_renaming_a_section_updates_the_section_lookup(layout):
+    assert compile_path("$.sections[0].name").set(layout, "Renamed") == 1
+    assert layout.get_section("Renamed") is layout.sections[0]
+    assert layout.get_section("ReportSection0") is None
+
+def test_deleting_a_visual_removes_it_from_the_saved_layout(layout):
+    assert compile_path("$.sections[0].visualContainers[0]").delete_many([layout]) == 1
+
+    saved = Layout.from_bytes(layout.to_bytes())
+    assert [visual.name for visual in saved.sections[0].visuals] == ["visual0_1", "visual0_2"]
+    assert not layout.find_visuals_by_name("visual0_0")
+
+def test_replacing_a_section_goes_through_the_model(layout):
+    replacement = {"name": "Fresh", "displayName": "Fresh", "visualContainers": []}
+    assert compile_path("$.sections[1]").set(layout, replacement) == 1
+
+    assert layout.get_section("Fresh") is layout.sections[1]
+    assert [section["name"] for section in json.loads(layout.to_bytes().decode("utf-16-le"))["sections"]] == \
+        ["ReportSection0", "Fresh"]
+
+def test_whole_node_lists_cannot_be_overwritten(layout):
+    with pytest.raises(PropertyPathError):
+        compile_path("$.sections").set(layout, [])
+    with pytest.raises(PropertyPathError):
+        compile_path("visualContainers").delete(layout.sections[0])
+
+def test_path_deletes_roll_back_with_the_transaction(layout):
+    before = layout.to_bytes()
+    with pytest.raises(RuntimeError):
+        with layout.transaction():
+            compile_path("$.sections[0].visualContainers[1]").delete_many([layout], before_write=layout.checkpoint)
+            raise RuntimeError("edit failed")
+    assert layout.to_bytes() == before
+    assert layout.find_visuals_by_name("visual0_1")
@@ -0,0 +1,62 @@
+import os
+import stat
+import zipfile
+
+from src.pbix_package import PbixPackage
+from src.repackager import repackage_pbix
+
+def _compressed_bytes(path: str, info: zipfile.ZipInfo) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = int.from_bytes(f.read(2), "little"), int.from_bytes(f.read(2), "little")
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        return f.read(info.compress_size)
+
+def test_untouched_members_are_copied_raw(pbix_path, tmp_path):
+    output = str(tmp_path / "out.pbix")
+    stats = repackage_pbix(pbix_path, output, {"Report/Layout": "{}".encode("utf-16-le")})
+
+    with zipfile.ZipFile(pbix_path) as source, zipfile.ZipFile(output) as result:
+        assert result.testzip() is None
+        assert [info.filename for info in result.infolist()] == [info.filename for info in source.infolist()]
+        for before in source.infolist():
+            after = result.getinfo(before.filename)
+            assert after.compress_type == before.compress_type
+            assert after.date_time == before.date_time
+            if before.filename != "Report/Layout":
+                assert after.CRC == before.CRC
+                assert _compressed_bytes(output, after) == _compressed_bytes(pbix_path, before)
+        assert result.read("Report/Layout") == "{}".encode("utf-16-le")
+    assert stats["rewritten"] == 1
+    assert stats["copied_raw"] == len(source.infolist()) - 1
+
+def test_new_members_are_appended(pbix_path, tmp_path):
+    output = str(tmp_path / "out.pbix")
+    stats = repackage_pbix(pbix_path, output, {"Report/Extra": b"data"})
+
+    with zipfile.ZipFile(output) as result:
+        assert result.namelist()[-1] == "Report/Extra"
+        assert result.read("Report/Extra") == b"data"
+    assert stats["added"] == 1
+
+def test_saving_an_unchanged_package_keeps_member_contents(pbix_path, tmp_path):
+    output = str(tmp_path / "out.pbix")
+    with PbixPackage(pbix_path) as package:
+        package.read_layout_document()
+        package.save(output)
+
+    with zipfile.ZipFile(pbix_path) as source, zipfile.ZipFile(output) as result:
+        for info in source.infolist():
+            assert result.read(info.filename) == source.read(info.filename)
+
+def test_new_output_gets_default_file_permissions(pbix_path, tmp_path):
+    umask = os.umask(0o022)
+    os.umask(umask)
+    output = str(tmp_path / "out.pbix")
+    repackage_pbix(pbix_path, output, {})
+    assert stat.S_IMODE(os.stat(output).st_mode) == 0o666 & ~umask
+
+def test_replaced_output_keeps_its_permissions(pbix_path, tmp_path):
+    os.chmod(pbix_path, 0o640)
+    repackage_pbix(pbix_path, pbix_path, {"Report/Extra": b"data"}) # In place, as PbixPackage.save may do
+    assert stat.S_IMODE(os.stat(pbix_path).st_mode) == 0o640
@@ -0,0 +1,89 @@
+import http.client
+import json
+import os
+import shutil
+import threading
+
+import pytest
+
+from src.service import QueueFullError, TransformService, make_server
+
+TOKEN = "test-token"
+REQUEST = "Change the title of visual0_0 to Revenue"
+
+@pytest.fixture
+def server(tmp_path, pbix_path):
+    root = tmp_path / "root"
+    root.mkdir()
+    shutil.copy(pbix_path, root / "in.pbix")
+    service = TransformService(workers=1, queue_size=4, job_timeout=30, allowed_root=str(root))
+    service.start()
+    http_server = make_server(service, port=0, token=TOKEN)
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    yield http_server
+    http_server.shutdown()
+    http_server.server_close()
+    service.shutdown()
+
+def _call(server, method: str, path: str, body: dict | None = None, headers: dict | None = None,
+          content_type: str = "application/json") -> tuple[int, dict]:
+    all_headers = {"Authorization": f"Bearer {TOKEN}"}
+    if body is not None:
+        all_headers["Content-Type"] = content_type
+    all_headers.update(headers or {})
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=30)
+    try:
+        connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=all_headers)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b"{}")
+    finally:
+        connection.close()
+
+def test_job_runs_and_writes_inside_the_root(server):
+    status, job = _call(server, "POST", "/jobs?wait=1", {"input": "in.pbix", "output": "out.pbix", "request": REQUEST})
+
+    assert status == 200 and job["status"] == "done"
+    assert os.path.exists(os.path.join(server.service.allowed_root, "out.pbix"))
+    assert _call(server, "GET", f"/jobs/{job['id']}")[1]["results"][0]["status"] == "ok"
+    assert _call(server, "GET", "/health")[1]["jobs"]["done"] == 1
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"Authorization": ""}, 401),
+    ({"Authorization": "Bearer wrong"}, 401),
+    ({"Host": "attacker.example:8765"}, 403),
+    ({"Origin": "http://attacker.example"}, 403),
+])
+def test_rejects_unauthenticated_and_cross_site_requests(server, headers, expected):
+    assert _call(server, "GET", "/health", headers=headers)[0] == expected
+
+def test_requires_json_bodies(server):
+    status, _ = _call(server, "POST", "/jobs", {"input": "in.pbix", "output": "out.pbix", "request": REQUEST},
+                      content_type="text/plain")
+    assert status == 415
+
+@pytest.mark.parametrize("spec", [
+    {"input": "../in.pbix", "output": "out.pbix"},
+    {"input": "in.pbix", "output": "/tmp/elsewhere.pbix"},
+    {"input": "in.pbix", "patch": "../edit.json"},
+])
+def test_rejects_paths_outside_the_allowed_root(server, spec):
+    assert _call(server, "POST", "/jobs", {**spec, "request": REQUEST})[0] == 403
+
+@pytest.mark.parametrize("timeout", ["5", 0, -1, True, float("nan")])
+def test_rejects_invalid_timeouts(server, timeout):
+    spec = {"input": "in.pbix", "output": "out.pbix", "request": REQUEST, "timeout": timeout}
+    status, body = _call(server, "POST", "/jobs?wait=1", spec)
+    assert status == 400
+    assert "timeout" in body["error"]
+
+def test_full_queue_rejects_and_queued_jobs_can_be_cancelled():
+    service = TransformService(workers=1, queue_size=1) # Not started: jobs stay queued
+    job = service.submit("in.pbix", "out.pbix", [REQUEST])
+    with pytest.raises(QueueFullError):
+        service.submit("in.pbix", "out.pbix", [REQUEST])
+
+    assert service.cancel(job.id)
+    assert job.status == "cancelled"
+    assert not service.cancel(job.id)
+    assert service.counters["rejected"] == 1 and service.counters["cancelled"] == 1
@@ -0,0 +1,70 @@
+import os
+import zipfile
+
+import pytest
+
+from src.layout import Layout
+from src.transformer import apply_edits, process_pbix_edit_requests
+
+def _output_layout(path: str) -> Layout:
+    with zipfile.ZipFile(path) as archive:
+        return Layout.from_bytes(archive.read("Report/Layout"))
+
+def test_unknown_action_fails_and_rolls_back(layout):
+    before = layout.to_bytes()
+    plan = {"operations": [
+        {"action": "change_title", "target": {"visual_name": "visual0_0"}, "parameters": {"new_title": "Kept?"}},
+        {"action": "add_visual", "target": {"section_name": "Page 1"}, "parameters": {"visual_type": "textbox"}},
+    ]}
+    with pytest.raises(ValueError, match="not implemented"):
+        apply_edits(layout, plan)
+    assert layout.to_bytes() == before
+
+def test_unimplemented_request_is_an_error_and_writes_nothing(pbix_path, tmp_path):
+    output = str(tmp_path / "out.pbix")
+    # The offline placeholder transport answers this with an add_visual instruction
+    results = process_pbix_edit_requests(pbix_path, output, ["Add a title card to Page 1"], bypass_cache=True)
+
+    assert results[0]["status"] == "error"
+    assert "not implemented" in results[0]["error"]
+    assert not os.path.exists(output) # Nothing succeeded, so nothing is written
+
+def test_failed_request_leaves_no_trace_next_to_a_successful_one(pbix_path, tmp_path):
+    output = str(tmp_path / "out.pbix")
+    results = process_pbix_edit_requests(pbix_path, output, ["Change the title of visual0_0 to Kept",
+                                                             "Add a title card to Page 1"], bypass_cache=True)
+
+    assert [result["status"] for result in results] == ["ok", "error"]
+    with zipfile.ZipFile(output) as archive:
+        text = archive.read("Report/Layout").decode("utf-16-le")
+    assert "_ai_instruction" not in text
+    assert _output_layout(output).find_visuals_by_name("visual0_0")[0].title == "Kept"
+
+def test_rules_routed_request_edits_the_saved_report(pbix_path, tmp_path):
+    output = str(tmp_path / "out.pbix")
+    results = process_pbix_edit_requests(pbix_path, output, ["Change the title of visual1_2 to Revenue"])
+
+    assert results[0]["status"] == "ok" and results[0]["route"] == "rules"
+    assert _output_layout(output).find_visuals_by_name("visual1_2")[0].title == "Revenue"
+
+def test_change_title_keeps_existing_title_formatting(layout):
+    visual = layout.find_visuals_by_name("visual0_1")[0]
+    properties = visual.config["singleVisual"]["vcObjects"]["title"][0]["properties"]
+    properties["fontColor"] = {"solid": {"color": {"expr": {"Literal": {"Value": "'#FF0000'"}}}}}
+    properties["alignment"] = {"expr": {"Literal": {"Value": "'center'"}}}
+
+    apply_edits(layout, {"action": "change_title", "target": {"visual_name": "visual0_1"},
+                         "parameters": {"new_title": "It's new"}})
+
+    properties = visual.config["singleVisual"]["vcObjects"]["title"][0]["properties"]
+    assert visual.title == "It's new"
+    assert properties["show"] == {"expr": {"Literal": {"Value": "true"}}}
+    assert {"fontColor", "alignment"} <= set(properties)
+
+def test_change_title_creates_missing_title_objects(layout):
+    visual = layout.find_visuals_by_name("visual0_2")[0]
+    del visual.config["singleVisual"]["vcObjects"]
+
+    apply_edits(layout, {"action": "change_title", "target": {"visual_name": "visual0_2"},
+                         "parameters": {"new_title": "Fresh"}})
+    assert Layout.from_bytes(layout.to_bytes()).find_visuals_by_name("visual0_2")[0].title == "Fresh"